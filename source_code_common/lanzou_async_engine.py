@@ -0,0 +1,814 @@
+"""asyncio 引擎：列表翻页、提链、直链校验与流式下载的协程实现（依赖可选的 aiohttp）。
+
+与线程引擎（LanzouListFetcher / LanzouDownloadCore）共用同一套页面解析、直链缓存、断点元数据与统计；
+区别在于请求走 aiohttp、按主机限流的名额以协程方式等待、退避与限速用 asyncio.sleep，
+因此成百上千个提链可以同时在途而不占用线程。
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+from urllib.parse import urlparse, urljoin
+
+try:
+    import aiohttp
+    from yarl import URL
+except Exception:
+    aiohttp = None
+    URL = None
+
+try:
+    from source_code_common.lanzou_errors import LanzouError, ErrorCode, is_cancelled
+    from source_code_common.lanzou_list_fetcher import _AdaptivePacer
+    from source_code_common.lanzou_types import AsyncEngineConfig, FileItem
+except Exception:
+    from lanzou_errors import LanzouError, ErrorCode, is_cancelled
+    from lanzou_list_fetcher import _AdaptivePacer
+    from lanzou_types import AsyncEngineConfig, FileItem
+
+
+_NETWORK_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError) if aiohttp is not None else (asyncio.TimeoutError,)
+
+
+class _Response:
+    """已读完正文的响应快照（状态码 / 响应头 / 文本），连接已归还连接池。"""
+    __slots__ = ("status_code", "headers", "text", "url")
+
+    def __init__(self, status_code, headers, text, url):
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+        self.url = url
+
+
+class AsyncLanzouEngine:
+    """协程版列表 / 提链 / 下载引擎，按 async with 管理 aiohttp 会话。"""
+
+    def __init__(self, downloader, config=None):
+        if aiohttp is None:
+            raise RuntimeError("未安装 aiohttp，无法使用 asyncio 引擎（pip install aiohttp）")
+        self.d = downloader
+        self.config = config or getattr(downloader, "async_config", None) or AsyncEngineConfig()
+        self._session = None
+        self.queue = None  # 批量下载进行中的 DownloadQueue（供运行中调整优先级）
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+        return False
+
+    async def open(self):
+        if self._session is not None:
+            return
+        cfg = self.config
+        connector = aiohttp.TCPConnector(
+            limit=max(1, cfg.max_connections),
+            limit_per_host=max(1, cfg.per_host_limit),
+            ttl_dns_cache=300,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            # unsafe=True 允许为 IP 主机保存 cookie（本地替身服务 / 直连 IP 的 CDN）
+            cookie_jar=aiohttp.CookieJar(unsafe=True),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=cfg.connect_timeout_s, sock_read=cfg.read_timeout_s),
+            trust_env=False,
+        )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    # ---- 请求基础设施 ----
+
+    def _host_limit(self, url):
+        """按主机占用在途名额：与线程引擎共用 HttpPool 的 HostConcurrencyLimiter（set_host_concurrency 对两者都生效）。"""
+        return self.d.http_pool.host_limiter.slot(url)
+
+    async def _backoff(self, attempt):
+        cfg = self.config
+        delay = min(cfg.backoff_max_s, cfg.backoff_base_s * (2 ** (attempt - 1)))
+        await asyncio.sleep(delay * (0.5 + random.random()))
+
+    def _set_cookie(self, url, name, value):
+        parsed = urlparse(url)
+        self._session.cookie_jar.update_cookies({name: value}, URL(f"{parsed.scheme}://{parsed.netloc}/"))
+
+    async def _request(self, method, url, phase, **kwargs):
+        """带主机限流与指数退避的请求，读完正文后返回 _Response；网络错误与 5xx 用尽重试后抛 LanzouError。"""
+        retries = max(0, self.config.request_retries)
+        last_error = None
+        for attempt in range(1, retries + 2):
+            try:
+                async with self._host_limit(url):
+                    with self.d.metrics.span(phase, http=True):
+                        async with self._session.request(method, url, **kwargs) as resp:
+                            text = await resp.text(errors="replace")
+                            result = _Response(resp.status, resp.headers, text, str(resp.url))
+                if result.status_code < 500:
+                    return result
+                last_error = f"HTTP {result.status_code}"
+            except _NETWORK_ERRORS as e:
+                last_error = str(e) or type(e).__name__
+            if attempt <= retries:
+                self.d.metrics.inc("retries", kind=f"async_{phase}")
+                await self._backoff(attempt)
+        raise LanzouError(ErrorCode.NETWORK, f"请求失败({phase}): {last_error}")
+
+    async def _get_page(self, url, headers, phase):
+        """GET 页面；遇到 acw_sc__v2 挑战时计算 cookie 后重取一次，并补齐 codelen。"""
+        resp = await self._request("GET", url, phase, headers=headers)
+        if self.d._is_html_challenge_response(resp, resp.text):
+            token = self.d._solve_acw_sc_v2(resp.text)
+            if token:
+                self._set_cookie(url, "acw_sc__v2", token)
+                resp = await self._request("GET", url, phase, headers=headers)
+        self._set_cookie(url, "codelen", "1")
+        if resp.status_code >= 400:
+            raise LanzouError(ErrorCode.NETWORK, f"HTTP {resp.status_code}: {self.d._mask_url(url)}")
+        return resp
+
+    # ---- 列表 ----
+
+    async def list_files(self, url=None, password=None, on_batch=None, stop_event=None, incremental=False):
+        """抓取整棵目录树，返回 FileItem 列表；每解析一页以该页 FileItem 列表调用 on_batch。
+
+        目录按广度优先并发（ListFetchConfig.folder_workers），同一目录内按自适应节奏逐页翻。
+        不读写目录清单，incremental=True 直接报错，增量刷新请用线程列表获取器（LanzouListFetcher）。
+        """
+        if incremental:
+            raise ValueError("asyncio 引擎不支持增量刷新，请改用线程列表获取器（login_and_get_files 会自动转交）")
+        if url is None:
+            url = self.d.default_url
+        if password is None:
+            password = self.d.default_password
+        fetcher = self.d.list_fetcher
+        pacer = _AdaptivePacer(self.d.list_config)
+        crawl = {"items": [], "on_batch": on_batch, "stop_event": stop_event, "pacer": pacer}
+        visited = {fetcher._normalize_share_url(url)}
+        folder_limit = asyncio.Semaphore(max(1, self.d.list_config.folder_workers))
+
+        root_subfolders = await self._list_folder(url, password, crawl, "")
+
+        async def _sub(sub_url, prefix):
+            async with folder_limit:
+                try:
+                    return await self._list_folder(sub_url, password, crawl, prefix), prefix
+                except LanzouError as e:
+                    if e.code == ErrorCode.PASSWORD_INCORRECT:
+                        raise
+                    print(f"调试: 子目录抓取失败，已跳过 {self.d._mask_url(sub_url)}，原因: {e}")
+                except Exception as e:
+                    print(f"调试: 子目录抓取失败，已跳过 {self.d._mask_url(sub_url)}，原因: {e}")
+                return [], prefix
+
+        pending = set()
+
+        def _submit(subfolders, parent_prefix):
+            for sub_url, sub_name in subfolders:
+                sub_norm = fetcher._normalize_share_url(sub_url)
+                if not sub_norm or sub_norm in visited:
+                    continue
+                visited.add(sub_norm)
+                print(f"调试: 进入子目录 {sub_name} -> {sub_norm}")
+                pending.add(asyncio.ensure_future(_sub(sub_url, f"{parent_prefix}{sub_name}/")))
+
+        if not self._stopped(stop_event):
+            _submit(root_subfolders, "")
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.discard(task)
+                    subfolders, prefix = task.result()
+                    if not self._stopped(stop_event):
+                        _submit(subfolders, prefix)
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if len(visited) > 1:
+            print(f"调试: 目录抓取完成，共 {len(visited)} 个目录，{len(crawl['items'])} 个文件")
+        return crawl["items"]
+
+    @staticmethod
+    def _stopped(stop_event):
+        return stop_event is not None and stop_event.is_set()
+
+    async def _load_context(self, url, headers, cache_bust=False):
+        req_url = url
+        if cache_bust:
+            sep = "&" if "?" in req_url else "?"
+            req_url = f"{req_url}{sep}t={int(time.time() * 1000)}"
+        resp = await self._get_page(req_url, headers, "list_share_page")
+        return resp.text
+
+    async def _list_folder(self, url, password, crawl, prefix):
+        """抓取单个目录的全部分页，返回子目录 [(url, name)]。"""
+        d = self.d
+        fetcher = d.list_fetcher
+        pacer = crawl["pacer"]
+        stop_event = crawl["stop_event"]
+        common_headers = d._make_common_headers()
+
+        print(f"正在访问链接: {d._mask_url(url)}")
+        page_html = await self._load_context(url, common_headers)
+        if not fetcher._is_lanzou_share_link(url, page_html):
+            raise LanzouError(ErrorCode.INVALID_LINK, "链接不是蓝奏云分享页，请重新输入正确的蓝奏云链接")
+        try:
+            ctx = fetcher._extract_context(page_html, url)
+        except LanzouError as e:
+            if e.code == ErrorCode.PARSE:
+                raise LanzouError(ErrorCode.INVALID_LINK, "链接不是蓝奏云分享页，请重新输入正确的蓝奏云链接")
+            raise
+        ctx["referer_url"] = url
+        subfolders = fetcher._extract_subfolder_links(page_html, url)
+        ajax_url = f"{ctx['origin']}/filemoreajax.php?file={ctx['fid']}"
+        print(f"参数提取成功 fid={ctx['fid']} uid={ctx['uid']}")
+
+        seen_ids = set()
+        page = 1
+        while page <= d.list_config.max_pages:
+            if self._stopped(stop_event):
+                print("调试: 已收到停止加载信号，提前结束")
+                break
+            if page > 1:
+                await asyncio.sleep(pacer.next_delay())
+            data, zt, ctx = await self._load_page(ajax_url, ctx, url, password, page, common_headers, pacer)
+            if zt == "2":
+                print(f"调试: 第 {page} 页 zt=2，列表结束")
+                break
+            if zt == "3":
+                info = data.get("info", "unknown") if data else "unknown"
+                raise LanzouError(ErrorCode.PASSWORD_INCORRECT, f"密码错误: {info}")
+            if zt != "1":
+                raise LanzouError(ErrorCode.UNKNOWN, f"第 {page} 页请求失败，zt={zt}, info={data.get('info', '') if data else ''}")
+            pacer.on_success()
+
+            rows = data.get("text") or []
+            entries, _rows = fetcher._parse_page_rows(rows, ctx["origin"], prefix, seen_ids)
+            if entries:
+                self._emit(crawl, entries, prefix)
+            if not entries or len(rows) < d.list_config.page_size:
+                break
+            page += 1
+        return subfolders
+
+    def _emit(self, crawl, entries, prefix):
+        items = crawl["items"]
+        first = len(items) + 1
+        batch = [
+            FileItem(
+                index=first + i,
+                name=e["name"],
+                link=e["link"],
+                size=e["size"],
+                time=e["time"],
+                ajax_file_id=e["ajax_file_id"],
+                folder_path=prefix,
+                relative_path=f"{prefix}{e['name']}" if prefix else "",
+            )
+            for i, e in enumerate(entries)
+        ]
+        items.extend(batch)
+        if callable(crawl["on_batch"]):
+            try:
+                crawl["on_batch"](batch)
+            except Exception:
+                pass
+
+    async def _load_page(self, ajax_url, ctx, url, password, page, common_headers, pacer, max_attempts=8):
+        """请求一页，zt=4 / 限流时非阻塞退避并刷新上下文，返回 (data, zt, ctx)。"""
+        d = self.d
+        fetcher = d.list_fetcher
+        data, zt = None, ""
+        for attempt in range(1, max_attempts + 1):
+            payload = fetcher._build_page_payload(ctx, password, page)
+            headers = fetcher._list_ajax_headers(ctx, url, common_headers["User-Agent"])
+            try:
+                resp = await self._request("POST", ajax_url, "list_page", data=payload, headers=headers)
+            except LanzouError as e:
+                print(f"调试: 第 {page} 页请求异常: {e}")
+                await self._backoff(attempt)
+                continue
+            rate_limited = "http_ratelimit" in resp.headers.get("x-tengine-error", "")
+            if rate_limited or d._is_html_challenge_response(resp, resp.text):
+                if rate_limited:
+                    d.metrics.inc("list_ratelimit")
+                token = d._solve_acw_sc_v2(resp.text)
+                if token:
+                    self._set_cookie(ajax_url, "acw_sc__v2", token)
+                data, zt = {"zt": "4", "info": "rate limit challenge"}, "4"
+            else:
+                try:
+                    data = json.loads(resp.text)
+                    zt = str(data.get("zt", ""))
+                except Exception:
+                    data, zt = {"zt": "4", "info": "non-json response"}, "4"
+
+            if zt in ("1", "2", "3"):
+                return data, zt, ctx
+            if zt != "4":
+                await self._backoff(attempt)
+                continue
+            d.metrics.inc("list_zt4")
+            pacer.on_throttle()
+            info = data.get("info", "") if isinstance(data, dict) else ""
+            print(f"调试: 第 {page} 页 zt=4 (attempt {attempt}/{max_attempts}) info={info}")
+            low, high = d.list_config.zt4_wait_s
+            await asyncio.sleep(low + (high - low) * random.random())
+            if attempt % 2 == 0:
+                try:
+                    page_html = await self._load_context(url, common_headers, cache_bust=True)
+                    new_ctx = fetcher._extract_context(page_html, url)
+                    new_ctx["referer_url"] = url
+                    ctx = new_ctx
+                except Exception:
+                    pass
+        return data, zt, ctx
+
+    # ---- 提链 ----
+
+    async def resolve(self, file_info, download_dir="downloads", use_cache=True):
+        """先查下载目录的直链缓存，未命中再走协程提链链路并写回缓存。"""
+        d = self.d
+        link = file_info.get("link")
+        ajax_file_id = file_info.get("ajax_file_id")
+        cache = d.get_url_cache(download_dir)
+        if use_cache and cache is not None:
+            try:
+                cached = cache.get(link, ajax_file_id)
+            except Exception:
+                cached = None
+            if cached:
+                print(f"命中直链缓存: {file_info.get('name')}")
+                return cached
+        real_url = await self.get_real_download_url(link, ajax_file_id)
+        if real_url and cache is not None:
+            try:
+                cache.put(link, ajax_file_id, real_url)
+            except Exception:
+                pass
+        return real_url
+
+    async def get_real_download_url(self, file_link, ajax_file_id=None):
+        """分享页 → fn 页（内联 / 外链脚本参数）→ ajaxm.php；主路径失败时在线程中走浏览器兜底。"""
+        if not file_link:
+            return None
+        with self.d.metrics.span("resolve") as span:
+            real_url = await self._get_real_download_url(file_link, ajax_file_id)
+            span.set(outcome="ok" if real_url else "failed")
+        return real_url
+
+    async def _get_real_download_url(self, file_link, ajax_file_id):
+        try:
+            real_url = await self._resolve_by_requests(file_link, ajax_file_id)
+        except Exception as e:
+            print(f"异步链路获取真实下载链接失败: {e}")
+            real_url = None
+        if real_url:
+            return real_url
+        print("异步主路径提链失败，尝试浏览器兜底")
+        return await asyncio.to_thread(self.d._get_real_download_url_by_browser, file_link)
+
+    async def _resolve_by_requests(self, file_link, ajax_file_id):
+        d = self.d
+        common_headers = d._resolve_headers()
+        parsed = urlparse(file_link)
+        origin = f"{parsed.scheme}://{parsed.netloc}"
+
+        # 1) 分享页 → fn 页链接
+        r1 = await self._get_page(file_link, common_headers, "file_page")
+        fn_candidate = d._find_fn_url_in_page(r1.text)
+        if not fn_candidate:
+            jump_url = d._find_js_redirect_url(r1.text, origin)
+            if jump_url:
+                r1b = await self._get_page(jump_url, common_headers, "file_page")
+                fn_candidate = d._find_fn_url_in_page(r1b.text)
+        if not fn_candidate:
+            print("警告: 分享页未找到 fn 链接")
+            return None
+        fn_url = urljoin(origin + "/", fn_candidate)
+
+        # 2) fn 页参数（首轮不完整时刷新重试一次）
+        file_id = str(ajax_file_id).strip() if ajax_file_id is not None else None
+        if file_id and not file_id.isdigit():
+            file_id = None
+        params = {"file_id": file_id} if file_id else {}
+        for attempt in (1, 2):
+            h2 = dict(common_headers)
+            h2["Referer"] = file_link
+            r2 = await self._request("GET", fn_url, "fn_page", headers=h2)
+            if r2.status_code >= 400:
+                raise LanzouError(ErrorCode.NETWORK, f"fn 页 HTTP {r2.status_code}")
+            found = await self._extract_fn_params(r2.text, origin, fn_url, common_headers)
+            d._merge_ajax_params(params, found)
+            if params.get("file_id") == "1":
+                params.pop("file_id")
+            if d._ajax_params_complete(params):
+                break
+            if attempt == 1:
+                print("fn参数提取首轮未完整，刷新后重试一次")
+                d.metrics.inc("retries", kind="fn_page")
+                await asyncio.sleep(0.35)
+        if not d._ajax_params_complete(params):
+            print("警告: fn页面参数提取失败")
+            return None
+
+        # 3) ajaxm.php → dom + url
+        ajax_url, query, payload, post_headers = d._build_ajaxm_request(
+            origin, fn_url, params["file_id"], params["ajaxdata"], params["wp_sign"], params.get("websign"),
+            common_headers,
+        )
+        r3 = await self._request("POST", ajax_url, "ajaxm", params=query, data=payload, headers=post_headers)
+        try:
+            data = json.loads(r3.text)
+        except Exception:
+            print(f"警告: ajaxm返回非JSON(HTTP {r3.status_code})")
+            return None
+        if str(data.get("zt")) != "1":
+            print(f"警告: ajaxm返回异常 zt={data.get('zt')}, info={data.get('inf')}")
+            return None
+        real_url = d._real_url_from_ajaxm(data)
+        if not real_url:
+            print("警告: ajaxm缺少 dom/url")
+            return None
+        print(f"找到真实下载链接: {d._mask_url(real_url)}")
+        return real_url
+
+    async def _extract_fn_params(self, fn_html, origin, fn_url, headers):
+        """同 _extract_ajax_params_from_fn_assets：外链脚本先查共享脚本缓存，未命中再异步拉取并写回。"""
+        d = self.d
+        best = d._extract_inline_ajax_params(fn_html)
+        if d._ajax_params_complete(best):
+            return best
+        for full in d._fn_script_urls(fn_html, origin):
+            js_text = d.script_cache.peek(full)
+            if js_text is None:
+                h = dict(headers)
+                h["Referer"] = fn_url
+                try:
+                    resp = await self._request("GET", full, "script_asset", headers=h)
+                except LanzouError:
+                    continue
+                d.metrics.inc("script_cache", result="miss")
+                if resp.status_code != 200:
+                    continue
+                js_text = resp.text
+                d.script_cache.store(full, js_text, resp.headers)
+            d._merge_ajax_params(best, d._extract_ajax_params_from_js_text(js_text))
+            if d._ajax_params_complete(best):
+                return best
+        d._log_partial_ajax_params(best)
+        return best
+
+    # ---- 校验与下载 ----
+
+    async def validate(self, url):
+        """直链校验（HEAD，失败时 Range 0-0）：可下载返回 True，失效或为 HTML 返回 False。"""
+        headers = {"User-Agent": self.d._make_common_headers()["User-Agent"], "Accept": "*/*"}
+        for method, phase, extra in (("HEAD", "validate_head", {}), ("GET", "validate_range", {"Range": "bytes=0-0"})):
+            try:
+                async with self._host_limit(url):
+                    with self.d.metrics.span(phase, http=True):
+                        async with self._session.request(method, url, headers=dict(headers, **extra)) as resp:
+                            status = resp.status
+                            ctype = (resp.headers.get("Content-Type") or "").lower()
+            except _NETWORK_ERRORS:
+                continue
+            if status in (200, 206):
+                return "text/html" not in ctype
+            if status in (403, 404, 410):
+                return False
+        return False
+
+    async def _prevalidate(self, url):
+        d = self.d
+        if not d.download_config.prevalidate or d._should_skip_validation(url):
+            return None
+        return await self.validate(url)
+
+    async def download_file(self, file_info, download_dir="downloads", real_url=None):
+        """下载单个文件（跳过已存在、提链、可选预校验、流式写入 .part；失败时重新提链再试一次）。"""
+        try:
+            ok = await self._download_file(file_info, download_dir, real_url)
+        except LanzouError as e:
+            if e.code == ErrorCode.CANCELLED:
+                self.d.metrics.inc("files", outcome="cancelled")
+            raise
+        self.d.metrics.inc("files", outcome="ok" if ok else "failed")
+        return ok
+
+    async def _download_file(self, file_info, download_dir, real_url):
+        d = self.d
+        core = d.download_core
+        try:
+            if d.cancel_event.is_set():
+                raise LanzouError(ErrorCode.CANCELLED, "下载已取消")
+            file_path, clean_filename, _target_dir = core._resolve_target_path(file_info, download_dir)
+            core._adopt_truncated_file(file_path, file_info)
+            if os.path.exists(file_path):
+                d.report_progress(clean_filename, os.path.getsize(file_path), file_path, "跳过(已存在)", 100, done=True)
+                return True
+
+            if not real_url:
+                real_url = await self.resolve(file_info, download_dir)
+                if not real_url:
+                    print(f"未能获取到 {file_info['name']} 的真实下载链接，跳过该文件")
+                    return False
+            validation = await self._prevalidate(real_url)
+            if await self._transfer(real_url, file_path, clean_filename, file_info):
+                if validation is False:
+                    d._record_validation_false_negative(real_url)
+                return True
+
+            if d.cancel_event.is_set():
+                return False
+            print(f"首次直链下载失败，重新提链后重试: {file_info['name']}")
+            d.metrics.inc("retries", kind="re_resolve")
+            fresh_url = await self.resolve(file_info, download_dir, use_cache=False)
+            if not fresh_url:
+                print(f"重新提链失败，跳过该文件: {file_info['name']}")
+                return False
+            return await self._transfer(fresh_url, file_path, clean_filename, file_info)
+        except Exception as e:
+            if is_cancelled(e):
+                raise
+            print(f"异步下载文件 {file_info.get('name')} 时出错: {e}")
+            return False
+
+    async def _transfer(self, url, file_path, file_name, file_info):
+        try:
+            with self.d.metrics.span("transfer", mode="async") as span:
+                ok = await self.stream_to_file(url, file_path, file_name, file_info.get("link"), file_info.get("ajax_file_id"))
+                span.set(outcome="ok" if ok else "failed")
+        finally:
+            self.d.bandwidth.forget(file_path)
+        return ok
+
+    async def stream_to_file(self, url, file_path, file_name, file_link=None, ajax_file_id=None):
+        """流式下载到 .part（断点元数据与线程引擎通用），断线按 Range 续传，字节数吻合后原子重命名。"""
+        d = self.d
+        core = d.download_core
+        part_path, meta_path = core._part_paths(file_path)
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        meta = core._load_part_meta(meta_path) if os.path.exists(part_path) else {}
+        if meta.get("mode") == "segmented":
+            # 分段断点文件是预分配的，交给线程引擎按分段续传
+            return await asyncio.to_thread(core.download_segmented, url, file_path, file_name, file_link, ajax_file_id)
+        if meta.get("source_link") and file_link and meta.get("source_link") != file_link:
+            core._discard_part(part_path, meta_path)
+            meta = {}
+
+        headers = core._download_headers()
+        headers.pop("Connection", None)
+        current_url = url
+        resume_attempts = 0
+        while True:
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            expected = meta.get("expected_length")
+            if offset and expected and offset >= expected:
+                if offset == expected:
+                    break
+                core._discard_part(part_path, meta_path)
+                meta, offset = {}, 0
+
+            outcome, detail = await self._stream_once(current_url, headers, part_path, meta_path, meta, offset,
+                                                      file_path, file_name, file_link)
+            if outcome == "done":
+                break
+            if outcome == "failed":
+                if detail:
+                    print(detail)
+                if file_link:
+                    d.invalidate_resolved_url(file_link, ajax_file_id)
+                return False
+            if outcome == "restart":
+                core._discard_part(part_path, meta_path)
+                meta = {}
+                continue
+            meta = core._load_part_meta(meta_path)
+            resume_attempts += 1
+            d.metrics.inc("retries", kind="resume")
+            if resume_attempts > d.download_config.max_resume_attempts:
+                print(f"续传次数已用尽，保留断点文件: {file_name}（{detail}）")
+                return False
+            print(f"下载中断，准备第 {resume_attempts} 次续传: {file_name}（{detail}）")
+            await self._backoff(resume_attempts)
+            if file_link:
+                fresh_url = await self.get_real_download_url(file_link, ajax_file_id)
+                if fresh_url:
+                    current_url = fresh_url
+
+        final_size = os.path.getsize(part_path)
+        os.replace(part_path, file_path)
+        core._discard_part(part_path, meta_path)
+        d.report_progress(file_name, final_size, file_path, "下载完成", 100, done=True)
+        print(f"文件下载完成: {file_name}")
+        return True
+
+    async def _stream_once(self, url, headers, part_path, meta_path, meta, offset, file_path, file_name, file_link):
+        """发起一次下载请求并写入，返回 (结果, 说明)：done / resume（可续传）/ restart（丢弃重下）/ failed。"""
+        d = self.d
+        core = d.download_core
+        h = dict(headers)
+        if offset:
+            h["Range"] = f"bytes={offset}-"
+        downloaded = offset
+        encoded = False
+        try:
+            async with self._host_limit(url):
+                with d.metrics.span("download_request", http=True):
+                    resp = await self._session.get(url, headers=h, allow_redirects=True)
+                # 正文读完前一直占用主机名额（与线程引擎的流式响应一致）
+                async with resp:
+                    if resp.status in (403, 404, 410):
+                        return "failed", f"直链已失效(HTTP {resp.status}): {file_name}"
+                    if resp.status == 416 and offset:
+                        return "restart", None
+                    if resp.status >= 400:
+                        return "resume", f"HTTP {resp.status}"
+                    if "text/html" in (resp.headers.get("Content-Type") or "").lower():
+                        body = await resp.text(errors="replace")
+                        if d._is_html_challenge_response(resp, body):
+                            token = d._solve_acw_sc_v2(body)
+                            if token:
+                                self._set_cookie(url, "acw_sc__v2", token)
+                                return "resume", "检测到挑战页，已计算acw_sc__v2"
+                        return "failed", f"下载响应为HTML，已阻止保存假文件: {file_name}"
+
+                    content_length = int(resp.headers.get("Content-Length", 0) or 0)
+                    # 仍为压缩编码（aiohttp 会自动解压）：长度按未知处理，且不能按偏移续传
+                    encoded = (resp.headers.get("Content-Encoding") or "identity").strip().lower() != "identity"
+                    if encoded:
+                        if resp.status == 206:
+                            return "restart", None
+                        content_length = 0
+                    if offset and resp.status == 206:
+                        range_start, range_total = core._parse_content_range(resp.headers.get("Content-Range"))
+                        if range_start != offset:
+                            return "restart", None
+                        total_size = range_total or (offset + content_length if content_length else 0)
+                    else:
+                        offset = downloaded = 0
+                        total_size = content_length
+                    expected = meta.get("expected_length")
+                    if expected and total_size and expected != total_size:
+                        return "restart", None
+                    core._save_part_meta(meta_path, {
+                        "expected_length": total_size or None,
+                        "source_link": file_link or meta.get("source_link"),
+                        "file_name": file_name,
+                        "updated_at": int(time.time()),
+                    })
+
+                    with open(part_path, "ab" if offset else "wb") as fh:
+                        async for chunk in resp.content.iter_chunked(max(4096, self.config.chunk_bytes)):
+                            if d.cancel_event.is_set():
+                                raise LanzouError(ErrorCode.CANCELLED, "下载已取消")
+                            fh.write(chunk)
+                            downloaded += len(chunk)
+                            await d.bandwidth.athrottle(file_path, len(chunk), d.cancel_event)
+                            if total_size > 0:
+                                d.report_progress(
+                                    file_name, downloaded, file_path, "下载中...",
+                                    int(downloaded / total_size * 100), total_size,
+                                )
+            if not total_size or downloaded == total_size:
+                return "done", None
+            return "resume", f"字节数不足 {downloaded}/{total_size}"
+        except _NETWORK_ERRORS as e:
+            if encoded:
+                # 解压后的字节无法按偏移续传，丢弃后从头下载（仍计入续传次数）
+                core._discard_part(part_path, meta_path)
+            return "resume", str(e) or type(e).__name__
+        finally:
+            d.metrics.inc("download_bytes", downloaded - offset)
+
+    # ---- 批量 ----
+
+    def reorder(self, files=None, priority=None, policy=None):
+        """运行中调整排队文件的优先级或出队策略（与 LanzouDownloadScheduler.reorder 相同），返回调整的文件数。"""
+        queue = self.queue
+        if queue is None:
+            return 0
+        if policy is not None:
+            queue.set_policy(policy)
+        if files:
+            return queue.set_priority(files, priority or 0)
+        return 0
+
+    async def download_files(self, files, download_dir="downloads", max_workers=None, on_file_done=None):
+        """并发提链与下载，返回与 LanzouDownloadScheduler.run() 相同结构的统计。
+
+        与线程调度共用 DownloadQueue：传输并发 + prefetch_window 个协程各自出队一个文件、提链、
+        再等待传输名额（download_concurrency 或 max_workers），因此提链最多领先传输 prefetch_window 个文件，
+        运行中调整的优先级与出队策略对尚未出队的文件立即生效。等待传输超过 prefetch_ttl_s 的直链在开始前重新提链。
+        """
+        d = self.d
+        cfg = self.config
+        files = list(files or [])
+        total = len(files)
+        results = [None] * total
+        state = {"finished": 0, "succeeded": 0}
+        stop_event = d.cancel_event
+        work = d.create_download_queue(files)
+        self.queue = work
+        d.progress.begin(sum(d.parse_size_bytes(f.get("size")) or 0 for f in files))
+        resolve_limit = asyncio.Semaphore(max(1, cfg.resolve_concurrency))
+        transfers = max(1, int(max_workers or cfg.download_concurrency))
+        transfer_limit = asyncio.Semaphore(transfers)
+        window = transfers + max(0, int(d.download_config.prefetch_window))
+        ttl_s = float(d.download_config.prefetch_ttl_s)
+        print(f"异步下载调度: 共 {total} 个文件，提链并发 {cfg.resolve_concurrency}，传输并发 {transfers}，"
+              f"前瞻 {window}，顺序 {work.policy}")
+
+        def _report(file_info, success):
+            state["finished"] += 1
+            if success:
+                state["succeeded"] += 1
+            if d.global_progress_callback:
+                try:
+                    d.global_progress_callback(state["finished"], total, state["succeeded"])
+                except Exception:
+                    pass
+            if callable(on_file_done):
+                try:
+                    on_file_done(file_info, success)
+                except Exception:
+                    pass
+
+        async def _one(pos, file_info):
+            real_url = None
+            resolved_at = 0.0
+            cancelled = False
+            file_path, _name, _dir = d.download_core._resolve_target_path(file_info, download_dir)
+            if not os.path.exists(file_path):
+                async with resolve_limit:
+                    if stop_event.is_set():
+                        return
+                    try:
+                        real_url = await self.resolve(file_info, download_dir)
+                        resolved_at = time.monotonic()
+                    except Exception as e:
+                        print(f"提链 {file_info.get('name')} 时出错: {e}")
+                if not real_url:
+                    print(f"未能获取到 {file_info['name']} 的真实下载链接，跳过该文件")
+                    d.metrics.inc("files", outcome="failed")
+            if real_url or os.path.exists(file_path):
+                async with transfer_limit:
+                    if stop_event.is_set():
+                        return
+                    if real_url and time.monotonic() - resolved_at > ttl_s:
+                        print(f"直链等待传输超过 {ttl_s:.0f} 秒，重新提链: {file_info.get('name')}")
+                        try:
+                            real_url = await self.resolve(file_info, download_dir, use_cache=False) or real_url
+                        except Exception as e:
+                            print(f"重新提链 {file_info.get('name')} 时出错: {e}")
+                    try:
+                        success = await self.download_file(file_info, download_dir, real_url=real_url)
+                    except LanzouError as e:
+                        # 只有下载链路因取消而停止才算取消；取消前已经发生的错误仍计入失败
+                        if e.code != ErrorCode.CANCELLED:
+                            raise
+                        cancelled, success = True, False
+            else:
+                success = False
+            if not success:
+                d.progress.finish(file_path, "已取消" if cancelled else "下载失败")
+                if cancelled:
+                    return
+            results[pos] = success
+            _report(file_info, success)
+
+        async def _worker():
+            # 空闲时才出队：尚未出队的文件随优先级 / 策略调整重新排序
+            while not stop_event.is_set():
+                item = work.pop()
+                if item is None:
+                    return
+                pos, file_info, large = item
+                try:
+                    await _one(pos, file_info)
+                finally:
+                    work.done(large)
+
+        try:
+            await asyncio.gather(*(_worker() for _ in range(min(window, total))))
+        finally:
+            self.queue = None
+        cancelled = sum(1 for r in results if r is None)
+        if cancelled:
+            print(f"异步下载调度: 已取消 {cancelled} 个文件（未开始或中途中断）")
+        return {
+            "total": total,
+            "succeeded": state["succeeded"],
+            "failed": state["finished"] - state["succeeded"],
+            "cancelled": cancelled,
+            "results": [{"file": f, "success": r} for f, r in zip(files, results)],
+        }
@@ -0,0 +1,173 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+_FIELDS = ("name", "link", "size", "time", "ajax_file_id", "folder_path")
+
+
+class ShareCatalog:
+    """分享目录的持久化文件清单（SQLite），按 (分享链接, 目录链接, 蓝奏文件 id) 索引，用于增量刷新与变化比对。"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS catalog_files (
+                    share_url TEXT NOT NULL,
+                    folder_url TEXT NOT NULL,
+                    file_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    link TEXT NOT NULL,
+                    size TEXT,
+                    time TEXT,
+                    ajax_file_id TEXT,
+                    folder_path TEXT NOT NULL DEFAULT '',
+                    position INTEGER NOT NULL,
+                    first_seen REAL NOT NULL,
+                    last_seen REAL NOT NULL,
+                    PRIMARY KEY (share_url, folder_url, file_id)
+                )
+                """
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS catalog_folders (
+                    share_url TEXT NOT NULL,
+                    folder_url TEXT NOT NULL,
+                    folder_path TEXT NOT NULL DEFAULT '',
+                    complete INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL,
+                    verified_at REAL,
+                    PRIMARY KEY (share_url, folder_url)
+                )
+                """
+            )
+            # 旧版清单没有 verified_at（上次扫描到末页的时间），补列后视为从未完整验证
+            columns = {r[1] for r in self._conn.execute("PRAGMA table_info(catalog_folders)")}
+            if "verified_at" not in columns:
+                self._conn.execute("ALTER TABLE catalog_folders ADD COLUMN verified_at REAL")
+
+    @staticmethod
+    def _row_to_dict(file_id, row):
+        entry = {"file_id": file_id}
+        entry.update(zip(_FIELDS, row))
+        return entry
+
+    def load_folder(self, share_url, folder_url, max_age_s=None):
+        """返回 (按上次列表顺序排列的 {file_id: 条目}, 清单是否完整)。
+
+        完整指曾有一次扫描到末页；给出 max_age_s 时，该次完整扫描还须在 max_age_s 秒以内。
+        """
+        with self._lock:
+            folder = self._conn.execute(
+                "SELECT complete, verified_at FROM catalog_folders WHERE share_url = ? AND folder_url = ?",
+                (share_url, folder_url),
+            ).fetchone()
+            rows = self._conn.execute(
+                "SELECT file_id, name, link, size, time, ajax_file_id, folder_path FROM catalog_files "
+                "WHERE share_url = ? AND folder_url = ? ORDER BY position ASC",
+                (share_url, folder_url),
+            ).fetchall()
+        known = {}
+        for row in rows:
+            known[row[0]] = self._row_to_dict(row[0], row[1:])
+        complete = bool(folder and folder[0])
+        if complete and max_age_s is not None:
+            complete = folder[1] is not None and time.time() - folder[1] <= max_age_s
+        return known, complete
+
+    def save_folder(self, share_url, folder_url, folder_path, entries, complete, prune=None):
+        """用本次列表结果覆盖目录清单，返回 {"added", "removed", "renamed"} 变化。
+
+        entries 为按列表顺序排列的条目；complete 表示本次扫描到了末页，此时记为完整并更新 verified_at；
+        为 False（增量提前停止）时保留原有的完整标记与验证时间。prune 为 False 时不判定删除，默认与 complete 相同。
+        """
+        if prune is None:
+            prune = complete
+        known, _ = self.load_folder(share_url, folder_url)
+        now = time.time()
+        diff = {"added": [], "removed": [], "renamed": []}
+        current_ids = set()
+        with self._lock, self._conn:
+            for position, entry in enumerate(entries):
+                file_id = entry["file_id"]
+                current_ids.add(file_id)
+                old = known.get(file_id)
+                if old is None:
+                    diff["added"].append(entry)
+                elif old["name"] != entry["name"]:
+                    diff["renamed"].append(dict(entry, old_name=old["name"]))
+                self._conn.execute(
+                    "INSERT INTO catalog_files "
+                    "(share_url, folder_url, file_id, name, link, size, time, ajax_file_id, folder_path, "
+                    "position, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(share_url, folder_url, file_id) DO UPDATE SET "
+                    "name = excluded.name, link = excluded.link, size = excluded.size, time = excluded.time, "
+                    "ajax_file_id = excluded.ajax_file_id, folder_path = excluded.folder_path, "
+                    "position = excluded.position, last_seen = excluded.last_seen",
+                    (
+                        share_url, folder_url, file_id,
+                        entry["name"], entry["link"], entry.get("size"), entry.get("time"),
+                        entry.get("ajax_file_id"), entry.get("folder_path") or "",
+                        position, now, now,
+                    ),
+                )
+            if prune:
+                for file_id, old in known.items():
+                    if file_id in current_ids:
+                        continue
+                    diff["removed"].append(old)
+                    self._conn.execute(
+                        "DELETE FROM catalog_files WHERE share_url = ? AND folder_url = ? AND file_id = ?",
+                        (share_url, folder_url, file_id),
+                    )
+            if complete:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO catalog_folders "
+                    "(share_url, folder_url, folder_path, complete, updated_at, verified_at) VALUES (?, ?, ?, 1, ?, ?)",
+                    (share_url, folder_url, folder_path or "", now, now),
+                )
+            else:
+                self._conn.execute(
+                    "INSERT INTO catalog_folders (share_url, folder_url, folder_path, complete, updated_at) "
+                    "VALUES (?, ?, ?, 0, ?) ON CONFLICT(share_url, folder_url) DO UPDATE SET "
+                    "folder_path = excluded.folder_path, updated_at = excluded.updated_at",
+                    (share_url, folder_url, folder_path or "", now),
+                )
+        return diff
+
+    def prune_folders(self, share_url, keep_folder_urls):
+        """删除本次已不存在的子目录清单，返回被移除的文件条目。"""
+        keep = set(keep_folder_urls)
+        removed = []
+        with self._lock, self._conn:
+            folders = [
+                r[0] for r in self._conn.execute(
+                    "SELECT folder_url FROM catalog_folders WHERE share_url = ?", (share_url,)
+                ).fetchall()
+                if r[0] not in keep
+            ]
+            for folder_url in folders:
+                rows = self._conn.execute(
+                    "SELECT file_id, name, link, size, time, ajax_file_id, folder_path FROM catalog_files "
+                    "WHERE share_url = ? AND folder_url = ? ORDER BY position ASC",
+                    (share_url, folder_url),
+                ).fetchall()
+                removed.extend(self._row_to_dict(r[0], r[1:]) for r in rows)
+                self._conn.execute(
+                    "DELETE FROM catalog_files WHERE share_url = ? AND folder_url = ?", (share_url, folder_url)
+                )
+                self._conn.execute(
+                    "DELETE FROM catalog_folders WHERE share_url = ? AND folder_url = ?", (share_url, folder_url)
+                )
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,266 @@
+"""无界面命令行入口：列出分享文件、按规则筛选并批量下载（适合服务器/定时任务）。
+
+    python -m source_code_common.lanzou_cli list --url URL --password PWD --glob "*.zip"
+    python -m source_code_common.lanzou_cli download --url URL --password PWD --index 1-20 -o downloads --json
+"""
+
+import argparse
+import contextlib
+import fnmatch
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+try:
+    from source_code_common.lanzou_core import OptimizedLanzouDownloader
+    from source_code_common.lanzou_errors import LanzouError, ErrorCode
+    from source_code_common.lanzou_scheduler import SCHEDULE_POLICIES
+except Exception:
+    from lanzou_core import OptimizedLanzouDownloader
+    from lanzou_errors import LanzouError, ErrorCode
+    from lanzou_scheduler import SCHEDULE_POLICIES
+
+
+EXIT_OK = 0
+EXIT_DOWNLOAD_FAILED = 1  # 部分或全部文件下载失败
+EXIT_USAGE = 2  # 参数错误（argparse 直接以此退出）
+EXIT_NO_MATCH = 3  # 筛选后没有文件
+EXIT_CANCELLED = 130
+
+# 列表/提链阶段的错误按 ErrorCode 映射退出码，便于脚本区分处理
+ERROR_EXIT_CODES = {
+    ErrorCode.INVALID_LINK: 10,
+    ErrorCode.LIST_API_UNAVAILABLE: 11,
+    ErrorCode.PASSWORD_REQUIRED: 12,
+    ErrorCode.PASSWORD_INCORRECT: 13,
+    ErrorCode.RATE_LIMIT: 14,
+    ErrorCode.CHALLENGE: 15,
+    ErrorCode.NETWORK: 16,
+    ErrorCode.PARSE: 17,
+    ErrorCode.CANCELLED: EXIT_CANCELLED,
+    ErrorCode.UNKNOWN: 19,
+}
+
+
+def parse_index_ranges(text):
+    """解析序号范围 "1-10,15,20-"，返回 [(start, end)]（end 为 None 表示不设上限）。"""
+    ranges = []
+    for part in str(text or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        m = re.fullmatch(r"(\d*)\s*-\s*(\d*)", part)
+        if m:
+            start = int(m.group(1)) if m.group(1) else 1
+            end = int(m.group(2)) if m.group(2) else None
+        elif part.isdigit():
+            start = end = int(part)
+        else:
+            raise ValueError(f"无法解析序号范围: {part}")
+        ranges.append((start, end))
+    return ranges
+
+
+class FileSelector:
+    """按 glob / 正则 / 序号范围筛选文件；同类规则之间为“或”，不同类规则之间为“与”。"""
+
+    def __init__(self, globs=None, regexes=None, index_ranges=None):
+        self.globs = [g.lower() for g in (globs or [])]
+        self.regexes = [re.compile(r, re.I) for r in (regexes or [])]
+        self.index_ranges = list(index_ranges or [])
+
+    def matches(self, file_info):
+        path = file_info.get("relative_path") or file_info.get("name", "")
+        if self.globs:
+            lowered = path.lower()
+            name = str(file_info.get("name", "")).lower()
+            if not any(fnmatch.fnmatchcase(lowered, g) or fnmatch.fnmatchcase(name, g) for g in self.globs):
+                return False
+        if self.regexes and not any(r.search(path) for r in self.regexes):
+            return False
+        if self.index_ranges:
+            index = int(file_info.get("index") or 0)
+            if not any(start <= index and (end is None or index <= end) for start, end in self.index_ranges):
+                return False
+        return True
+
+
+class _Output:
+    """--json 时逐行输出 JSON 事件到 stdout，否则输出可读文本。"""
+
+    def __init__(self, stream, as_json):
+        self.stream = stream
+        self.as_json = as_json
+        self._lock = threading.Lock()
+
+    def event(self, kind, text=None, **fields):
+        with self._lock:
+            if self.as_json:
+                self.stream.write(json.dumps(dict(event=kind, **fields), ensure_ascii=False) + "\n")
+            elif text:
+                self.stream.write(text + "\n")
+            self.stream.flush()
+
+
+def _build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--url", default=os.environ.get("LANZOU_URL"), help="分享链接（默认取 LANZOU_URL）")
+    common.add_argument("--password", default=os.environ.get("LANZOU_PASSWORD"), help="分享密码（默认取 LANZOU_PASSWORD）")
+    common.add_argument("--json", action="store_true", help="stdout 逐行输出 JSON 事件，日志转到 stderr")
+    common.add_argument("--incremental", action="store_true", help="按目录清单增量刷新列表")
+    common.add_argument("--glob", action="append", default=[], help="文件名/相对路径 glob，可重复")
+    common.add_argument("--regex", action="append", default=[], help="相对路径正则，可重复")
+    common.add_argument("--index", help="序号范围，如 1-10,15,20-")
+    common.add_argument("--engine", choices=("threads", "asyncio"), default="threads",
+                        help="批量下载引擎（asyncio 需安装 aiohttp）")
+    common.add_argument("--metrics", help="结束时写出分阶段耗时与请求计数（.prom 为 Prometheus 文本，其余为 JSON）")
+
+    parser = argparse.ArgumentParser(prog="lanzou_cli", description="蓝奏云分享列表与批量下载（无界面）")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", parents=[common], help="列出（筛选后的）文件")
+    dl = sub.add_parser("download", parents=[common], help="下载筛选后的文件")
+    dl.add_argument("-o", "--output", default="downloads", help="下载目录")
+    dl.add_argument("-j", "--jobs", type=int, default=None, help="并发下载数")
+    dl.add_argument("--order", choices=SCHEDULE_POLICIES, default="selection",
+                    help="下载顺序：筛选顺序 / 小文件优先 / 按目录 / 大小文件交替")
+    dl.add_argument("--limit-rate", help="全局下载限速（每秒字节数，可带 K/M 单位，如 2M）")
+    dl.add_argument("--file-limit-rate", help="单文件下载限速（同上）")
+    dl.add_argument("--progress-interval", type=float, default=1.0, help="进度事件输出间隔（秒，0 为关闭）")
+    return parser
+
+
+def parse_rate(text):
+    """解析限速文本（如 "500K"、"2M"、"1048576"）为每秒字节数；空值返回 None。"""
+    if not text:
+        return None
+    m = re.match(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?)i?B?(?:/s)?\s*$", text, re.I)
+    if not m:
+        raise ValueError(f"无法解析的限速: {text}")
+    return int(float(m.group(1)) * {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}[m.group(2).upper()])
+
+
+def _collect(downloader, args, selector, out):
+    files = []
+    listed = 0
+    for item in downloader.iter_files(url=args.url, password=args.password, incremental=args.incremental or None):
+        listed += 1
+        file_info = item.to_dict()
+        if not selector.matches(file_info):
+            continue
+        files.append(file_info)
+        if args.command == "list":
+            out.event(
+                "file",
+                f"{file_info['index']:5d}  {file_info['size']:>10}  {file_info.get('relative_path') or file_info['name']}",
+                **file_info,
+            )
+    out.event("listed", f"共 {listed} 个文件，选中 {len(files)} 个", total=listed, selected=len(files))
+    return files
+
+
+def _download(downloader, args, files, out):
+    result = {}
+    error = []
+
+    def _on_file_done(file_info, success):
+        out.event(
+            "file_done",
+            f"{'完成' if success else '失败'}: {file_info.get('relative_path') or file_info['name']}",
+            name=file_info.get("name"),
+            relative_path=file_info.get("relative_path"),
+            success=bool(success),
+        )
+
+    def _run():
+        try:
+            result.update(downloader.download_files(files, args.output, max_workers=args.jobs, on_file_done=_on_file_done))
+        except Exception as e:
+            error.append(e)
+
+    downloader.clear_cancel()
+    worker = threading.Thread(target=_run, name="lanzou-cli-download", daemon=True)
+    worker.start()
+    try:
+        while worker.is_alive():
+            worker.join(args.progress_interval if args.progress_interval > 0 else 0.5)
+            if args.progress_interval > 0 and worker.is_alive():
+                _, summary = downloader.progress.poll()
+                eta = summary["eta_s"]
+                out.event(
+                    "progress",
+                    f"进行中 {summary['active']} 个，{summary['speed_bps'] / 1048576:.2f} MB/s"
+                    + (f"，预计剩余 {int(eta)} 秒" if eta is not None else ""),
+                    **summary,
+                )
+    except KeyboardInterrupt:
+        downloader.cancel_downloads()
+        worker.join()
+    if error:
+        raise error[0]
+    return result
+
+
+def main(argv=None):
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+    try:
+        selector = FileSelector(args.glob, args.regex, parse_index_ranges(args.index))
+        if args.command == "download":
+            rates = (parse_rate(args.limit_rate), parse_rate(args.file_limit_rate))
+    except (ValueError, re.error) as e:
+        parser.error(str(e))
+
+    out = _Output(sys.stdout, args.json)
+    # 下载器内部日志走 print；JSON 模式下转到 stderr，保证 stdout 可被逐行解析
+    log_target = sys.stderr if args.json else sys.stdout
+    started = time.time()
+    downloader = None
+    try:
+        with contextlib.redirect_stdout(log_target):
+            if args.url:
+                downloader = OptimizedLanzouDownloader(
+                    default_url=args.url, default_password=args.password or "", engine=args.engine
+                )
+            else:
+                downloader = OptimizedLanzouDownloader(engine=args.engine)  # 使用内置分享链接
+            downloader.metrics.enabled = bool(args.metrics)
+            files = _collect(downloader, args, selector, out)
+            if not files:
+                return EXIT_NO_MATCH
+            if args.command == "list":
+                return EXIT_OK
+            downloader.set_schedule_policy(args.order)
+            downloader.set_bandwidth_limit(global_bps=rates[0], per_file_bps=rates[1])
+            result = _download(downloader, args, files, out)
+    except LanzouError as e:
+        out.event("error", f"错误({e.code.value}): {e}", code=e.code.value, message=str(e))
+        return ERROR_EXIT_CODES.get(e.code, ERROR_EXIT_CODES[ErrorCode.UNKNOWN])
+    except KeyboardInterrupt:
+        out.event("error", "已取消", code=ErrorCode.CANCELLED.value, message="已取消")
+        return EXIT_CANCELLED
+    finally:
+        if args.metrics and downloader is not None:
+            downloader.metrics.write(args.metrics)
+
+    out.event(
+        "summary",
+        f"下载结束：成功 {result['succeeded']}，失败 {result['failed']}，取消 {result['cancelled']}，"
+        f"用时 {time.time() - started:.1f} 秒",
+        total=result["total"],
+        succeeded=result["succeeded"],
+        failed=result["failed"],
+        cancelled=result["cancelled"],
+        elapsed_s=round(time.time() - started, 3),
+    )
+    if result["cancelled"]:
+        return EXIT_CANCELLED
+    if result["failed"]:
+        return EXIT_DOWNLOAD_FAILED
+    return EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -14,86 +14,456 @@ import threading
 import re
 import json
 import hmac
-try:
-    from DrissionPage import Chromium, ChromiumOptions, SessionOptions
-except Exception:
-    Chromium = None
-    ChromiumOptions = None
-    SessionOptions = None
+from collections import deque, OrderedDict
 import base64
 import hashlib
 import html
 from urllib.parse import urlparse, parse_qs, urljoin
 try:
-    from source_code_common.lanzou_types import FileItem, ListFetchConfig
+    from source_code_common.lanzou_types import (
+        FileItem, ListFetchConfig, DownloadConfig, HttpPoolConfig, AsyncEngineConfig
+    )
     from source_code_common.lanzou_list_fetcher import LanzouListFetcher
     from source_code_common.lanzou_download_core import LanzouDownloadCore
+    from source_code_common.lanzou_scheduler import LanzouDownloadScheduler, DownloadQueue, SCHEDULE_POLICIES
+    from source_code_common.lanzou_url_cache import ResolvedUrlCache
+    from source_code_common.lanzou_catalog import ShareCatalog
+    from source_code_common.lanzou_progress import ProgressAggregator
+    from source_code_common.lanzou_metrics import Metrics
+    from source_code_common.lanzou_http import HttpPool
+    from source_code_common.lanzou_ratelimit import BandwidthLimiter
+    from source_code_common.lanzou_page_scanner import (
+        decode_escaped_html, scan_ajax_file_id, scan_ajax_params, scan_fn_url,
+        scan_inline_ajax_params, scan_js_redirect, scan_script_srcs,
+    )
 except Exception:
-    from lanzou_types import FileItem, ListFetchConfig
+    from lanzou_types import FileItem, ListFetchConfig, DownloadConfig, HttpPoolConfig, AsyncEngineConfig
     from lanzou_list_fetcher import LanzouListFetcher
     from lanzou_download_core import LanzouDownloadCore
+    from lanzou_scheduler import LanzouDownloadScheduler, DownloadQueue, SCHEDULE_POLICIES
+    from lanzou_url_cache import ResolvedUrlCache
+    from lanzou_catalog import ShareCatalog
+    from lanzou_progress import ProgressAggregator
+    from lanzou_metrics import Metrics
+    from lanzou_http import HttpPool
+    from lanzou_ratelimit import BandwidthLimiter
+    from lanzou_page_scanner import (
+        decode_escaped_html, scan_ajax_file_id, scan_ajax_params, scan_fn_url,
+        scan_inline_ajax_params, scan_js_redirect, scan_script_srcs,
+    )
+
+
+ENGINES = ("threads", "asyncio")
+
+
+def _import_drissionpage():
+    """按需导入 DrissionPage（导入较慢，只有真正走浏览器兜底时才需要），未安装时返回 None。"""
+    try:
+        from DrissionPage import Chromium, ChromiumOptions, SessionOptions
+    except Exception:
+        return None
+    return Chromium, ChromiumOptions, SessionOptions
+
+
+_credentials = None
+_credentials_lock = threading.Lock()
 
 
 class _PrefetchManager:
-    """后台预取真实下载链接。"""
+    """后台预取真实下载链接：小型解析线程池 + 前瞻窗口 + TTL 过期。"""
 
-    def __init__(self, downloader, max_queue_size=50):
-        from queue import Queue
+    def __init__(self, downloader, window=None, workers=None, ttl_s=None, resolve_fn=None):
+        cfg = downloader.download_config
         self.downloader = downloader
-        self.q = Queue(maxsize=max_queue_size)
-        self.cache = {}  # file_index -> real_url
+        self.window = max(1, int(window if window is not None else cfg.prefetch_window))
+        self.workers = max(1, int(workers if workers is not None else cfg.prefetch_workers))
+        self.ttl_s = float(ttl_s if ttl_s is not None else cfg.prefetch_ttl_s)
+        self.resolve_fn = resolve_fn or self._default_resolve
+        self.cache = {}  # key -> (real_url, resolved_at)
+        self._pending = deque()  # 待解析 file_info（按下载顺序）
+        self._in_flight = set()
+        self._abandoned = set()  # take() 等待超时后放弃的在途解析，结果回来时直接丢弃
+        self._cond = threading.Condition()
         self._stop = threading.Event()
-        self._worker = None
+        self._workers = []
+
+    def _default_resolve(self, file_info):
+        return self.downloader.get_real_download_url(
+            file_info.get("link"),
+            ajax_file_id=file_info.get("ajax_file_id"),
+        )
+
+    @staticmethod
+    def _key(file_info):
+        return file_info.get("link") or file_info.get("index")
 
     def start(self):
-        if self._worker and self._worker.is_alive():
+        if any(t.is_alive() for t in self._workers):
             return
         self._stop.clear()
-        self._worker = threading.Thread(target=self._run, daemon=True)
-        self._worker.start()
+        self._workers = [
+            threading.Thread(target=self._run, name=f"lanzou-prefetch-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for t in self._workers:
+            t.start()
 
     def stop(self):
         self._stop.set()
+        with self._cond:
+            self._pending.clear()
+            self._abandoned.clear()
+            self.cache.clear()
+            self._cond.notify_all()
 
     def enqueue(self, file_info):
-        key = file_info.get("index")
-        if key is None or key in self.cache:
-            return
-        try:
-            self.q.put_nowait(file_info)
-        except Exception:
+        key = self._key(file_info)
+        if key is None:
             return
+        with self._cond:
+            if key in self.cache or key in self._in_flight:
+                return
+            self._pending.append(file_info)
+            self._cond.notify_all()
+
+    def feed(self, files):
+        for f in files:
+            self.enqueue(f)
+
+    def reorder(self, files):
+        """按 files 的顺序重排尚未开始解析的预取（调度顺序变化后调用）。"""
+        order = {self._key(f): i for i, f in enumerate(files)}
+        with self._cond:
+            self._pending = deque(sorted(self._pending, key=lambda f: order.get(self._key(f), len(order))))
+
+    def get_cached(self, key):
+        """仅查看（不消费）未过期的预取结果。"""
+        with self._cond:
+            entry = self.cache.get(key)
+            if entry and not self._is_expired(entry):
+                return entry[0]
+            return None
 
-    def get_cached(self, file_index):
-        return self.cache.get(file_index)
+    def take(self, file_info, wait_s=0.0):
+        """取走预取直链；解析中则最多等待 wait_s 秒，未开始则撤销预取并返回 None。"""
+        key = self._key(file_info)
+        if key is None:
+            return None
+        deadline = time.time() + max(0.0, wait_s)
+        with self._cond:
+            try:
+                while True:
+                    entry = self.cache.pop(key, None)
+                    if entry:
+                        if not self._is_expired(entry):
+                            return entry[0]
+                        print(f"预取直链已过期，重新提链: {file_info.get('name')}")
+                        return None
+                    remaining = deadline - time.time()
+                    if key in self._in_flight:
+                        if remaining > 0 and not self._stop.is_set():
+                            self._cond.wait(remaining)
+                            continue
+                        # 等待超时：调用方自行提链，迟到的预取结果不再占用窗口
+                        self._abandoned.add(key)
+                        return None
+                    # 尚未开始解析：撤销，由调用方自行提链，避免重复请求
+                    for f in list(self._pending):
+                        if self._key(f) == key:
+                            self._pending.remove(f)
+                    return None
+            finally:
+                self._cond.notify_all()
+
+    def _is_expired(self, entry):
+        return (time.time() - entry[1]) > self.ttl_s
+
+    def _purge_expired_locked(self):
+        for key in [k for k, v in self.cache.items() if self._is_expired(v)]:
+            self.cache.pop(key, None)
+
+    def _next_locked(self):
+        while not self._stop.is_set():
+            self._purge_expired_locked()
+            if self._pending and len(self.cache) + len(self._in_flight) < self.window:
+                f = self._pending.popleft()
+                self._in_flight.add(self._key(f))
+                return f
+            self._cond.wait(0.5)
+        return None
 
     def _run(self):
-        from queue import Empty
         while not self._stop.is_set():
+            with self._cond:
+                f = self._next_locked()
+            if f is None:
+                return
+            key = self._key(f)
+            real = None
             try:
-                f = self.q.get(timeout=0.2)
-            except Empty:
-                continue
+                real = self.resolve_fn(f)
+            except Exception as e:
+                print(f"预取直链失败: {f.get('name')}，原因: {e}")
+            with self._cond:
+                self._in_flight.discard(key)
+                abandoned = key in self._abandoned
+                self._abandoned.discard(key)
+                if real and not abandoned and not self._stop.is_set():
+                    self.cache[key] = (real, time.time())
+                self._cond.notify_all()
+
+
+class _ScriptAssetCache:
+    """fn 页外链脚本缓存：按绝对 URL 共享、LRU 限量，可选遵循 HTTP 缓存头。"""
+
+    def __init__(self, max_entries=64, max_bytes=4 * 1024 * 1024, default_ttl_s=1800.0, honor_http_cache=True,
+                 metrics=None):
+        self.metrics = metrics or Metrics()
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+        self.default_ttl_s = float(default_ttl_s)
+        self.honor_http_cache = honor_http_cache
+        self._entries = OrderedDict()  # url -> {"text", "expires_at", "etag", "last_modified", "size"}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _expiry_from_headers(self, headers, now):
+        """返回 (是否可缓存, 过期时间)。"""
+        if not self.honor_http_cache:
+            return True, now + self.default_ttl_s
+        cc = (headers.get("Cache-Control") or "").lower()
+        if "no-store" in cc:
+            return False, now
+        if "no-cache" in cc:
+            return True, now  # 可缓存，但每次使用前需条件请求校验
+        m = re.search(r"max-age\s*=\s*(\d+)", cc)
+        if m:
+            return True, now + int(m.group(1))
+        return True, now + self.default_ttl_s
+
+    def _store_locked(self, url, entry):
+        old = self._entries.pop(url, None)
+        if old:
+            self._bytes -= old["size"]
+        if entry["size"] > self.max_bytes:
+            return
+        self._entries[url] = entry
+        self._bytes += entry["size"]
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted["size"]
+
+    def fetch(self, session, url, headers, timeout=12):
+        """返回脚本文本；非 200 返回 None（不缓存失败结果）。"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry:
+                self._entries.move_to_end(url)
+                if entry["expires_at"] > now:
+                    self.hits += 1
+                    self.metrics.inc("script_cache", result="hit")
+                    return entry["text"]
+        h = dict(headers)
+        if entry and self.honor_http_cache:
+            if entry.get("etag"):
+                h["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                h["If-Modified-Since"] = entry["last_modified"]
+        with self.metrics.span("script_asset", http=True):
+            r = session.get(url, headers=h, timeout=timeout)
+        now = time.time()
+        if r.status_code == 304 and entry:
+            cacheable, expires_at = self._expiry_from_headers(r.headers, now)
+            with self._lock:
+                entry["expires_at"] = expires_at if cacheable else now
+                self.hits += 1
+            self.metrics.inc("script_cache", result="revalidated")
+            return entry["text"]
+        with self._lock:
+            self.misses += 1
+        self.metrics.inc("script_cache", result="miss")
+        if r.status_code != 200:
+            return None
+        text = r.text
+        self.store(url, text, r.headers, now)
+        return text
+
+    def peek(self, url):
+        """仅查缓存：未过期时返回脚本文本（计一次命中），否则返回 None；供不走 requests 会话的调用方使用。"""
+        with self._lock:
+            entry = self._entries.get(url)
+            if not entry or entry["expires_at"] <= time.time():
+                return None
+            self._entries.move_to_end(url)
+            self.hits += 1
+        self.metrics.inc("script_cache", result="hit")
+        return entry["text"]
+
+    def store(self, url, text, headers, now=None):
+        """按响应头写入缓存（no-store 时不写）。"""
+        now = time.time() if now is None else now
+        cacheable, expires_at = self._expiry_from_headers(headers, now)
+        if not cacheable:
+            return
+        with self._lock:
+            self._store_locked(url, {
+                "text": text,
+                "expires_at": expires_at,
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "size": len(text),
+            })
+
+
+class _BrowserTabPool:
+    """浏览器兜底的标签页池：预先打开的标签页按需借出、用完归还，多个兜底提链可同时进行。
+
+    池绑定到当前 driver；driver 重建（close_browser 后再次兜底）后旧标签页作废，按需重新打开。
+    """
+
+    def __init__(self, downloader):
+        self.downloader = downloader
+        self._cond = threading.Condition()
+        self._driver = None
+        self._idle = []
+        self._owned = set()  # 当前 driver 下由池打开的标签页（含借出中的）
+        self._opening = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_s_total = 0.0
+
+    @property
+    def size(self):
+        return max(1, int(self.downloader.download_config.browser_tabs))
+
+    def _bind_locked(self, driver):
+        if driver is not self._driver:
+            # 旧浏览器已退出，其标签页无需（也无法）关闭
+            self._driver = driver
+            self._idle = []
+            self._owned = set()
+
+    def _open_tab(self, driver):
+        """打开新标签页（调用方已在锁内为它占位 _opening += 1）。"""
+        tab = None
+        try:
+            tab = driver.new_tab()
+            return tab
+        finally:
+            with self._cond:
+                self._opening -= 1
+                if tab is not None and driver is self._driver:
+                    self._owned.add(tab)
+                self._cond.notify_all()
+
+    def warm(self, driver=None):
+        """预先打开标签页至池大小（setup_driver 之后调用）。"""
+        driver = driver or self.downloader.driver
+        if driver is None:
+            return 0
+        opened = 0
+        while True:
+            with self._cond:
+                self._bind_locked(driver)
+                if len(self._owned) + self._opening >= self.size:
+                    break
+                self._opening += 1
             try:
-                key = f.get("index")
-                if key is None or key in self.cache:
-                    continue
-                real = self.downloader._get_real_download_url_impl(f.get("link"))
-                if real:
-                    self.cache[key] = real
+                tab = self._open_tab(driver)
+            except Exception as e:
+                print(f"预开浏览器标签页失败: {e}")
+                break
+            self.release(tab)
+            opened += 1
+        return opened
+
+    def checkout(self, driver, timeout=None):
+        """借出一个标签页：有空闲直接复用，未满则新开，已满则等待归还；超时返回 None。"""
+        timeout = self.downloader.download_config.browser_tab_wait_s if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + max(0.0, timeout)
+        waited = False
+        with self._cond:
+            self._bind_locked(driver)
+            while True:
+                if self._idle:
+                    tab = self._idle.pop()
+                    break
+                if len(self._owned) + self._opening < self.size:
+                    self._opening += 1
+                    tab = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    self.downloader.metrics.inc("browser_tabs", result="timeout")
+                    return None
+                waited = True
+                self._cond.wait(remaining)
+                self._bind_locked(driver)
+            wait_s = time.monotonic() - started
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+                self.wait_s_total += wait_s
+        self.downloader.metrics.observe("browser_tab_wait_s", wait_s)
+        if tab is not None:
+            self.downloader.metrics.inc("browser_tabs", result="reused")
+            return tab
+        self.downloader.metrics.inc("browser_tabs", result="opened")
+        return self._open_tab(driver)
+
+    def release(self, tab, broken=False):
+        """归还标签页；出错的标签页关闭后不再复用，下次按需新开。"""
+        with self._cond:
+            owned = tab in self._owned
+            if owned and not broken:
+                self._idle.append(tab)
+            else:
+                self._owned.discard(tab)
+            self._cond.notify_all()
+        if broken or not owned:
+            try:
+                tab.close()
             except Exception:
                 pass
-            finally:
-                try:
-                    self.q.task_done()
-                except Exception:
-                    pass
+
+    def close(self):
+        """关闭空闲标签页（退出浏览器前调用）。"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._owned.difference_update(idle)
+            self._cond.notify_all()
+        for tab in idle:
+            try:
+                tab.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        """标签页池统计：池大小、已打开 / 空闲数、借出次数、等待次数与平均等待秒数、超时次数。"""
+        with self._cond:
+            return {
+                "size": self.size,
+                "open": len(self._owned),
+                "idle": len(self._idle),
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "avg_wait_s": round(self.wait_s_total / self.waits, 3) if self.waits else 0.0,
+                "timeouts": self.timeouts,
+            }
 
 
 class OptimizedLanzouDownloader:
     def __init__(self, chrome_driver_path=None, edge_driver_path=None, headless=True, max_workers=3, browser="edge", 
                  browser_path=r"C:\Program Files (x86)\Microsoft\Edge\Application\msedge.exe", default_url=None, 
-                 default_password=None):
+                 default_password=None, engine="threads"):
+        if engine not in ENGINES:
+            raise ValueError(f"未知的引擎: {engine}（可选 {', '.join(ENGINES)}）")
         # 生产环境：使用混淆解密（无论是否打包）
         if default_url is None or default_password is None:
             self.default_url, self.default_password = self._get_obfuscated_credentials()
@@ -112,14 +482,59 @@ class OptimizedLanzouDownloader:
         self.driver = None
         self.progress_callback = None  # 用于GUI回调的进度更新函数
         self.global_progress_callback = None  # 用于全局进度更新的回调函数
-        # 串行化浏览器访问，避免多处调用时互相干扰
-        self.browser_lock = threading.RLock()
-        # 复用HTTP会话，减少频繁建连
-        self.http = requests.Session()
-        self.http.trust_env = False
-        # 直链校验自适应策略：记录域名的“校验误杀”情况，必要时跳过预校验
-        self.validation_policy = {}  # host -> {"false_negative": int, "skip_validation": bool}
+        # 浏览器只在首次兜底时启动（ensure_driver），之后复用到 close_browser()
+        self._driver_lock = threading.Lock()
+        self._driver_unavailable = False
+        # 浏览器兜底的标签页池（各提链线程并发借用，池大小见 download_config.browser_tabs）
+        self.browser_tabs = _BrowserTabPool(self)
+        # 共享连接池：各会话（下载器自身、列表抓取）复用按主机类别划分的长连接
+        self.http_config = HttpPoolConfig()
+        self.http_pool = HttpPool(self.http_config)
+        self.http = self.http_pool.session()
+        # 直链校验自适应策略：记录域名的“校验误杀”情况，必要时跳过预校验（持久化到 cache_dir）
+        self.validation_policy = {}  # host -> {"false_negative": int, "skip_validation": bool, "updated_at": float}
+        self._validation_policy_loaded = False
+        self._validation_policy_lock = threading.Lock()
         self.list_config = ListFetchConfig()
+        self.download_config = DownloadConfig(max_workers=max_workers)
+        # 列表与批量下载的执行引擎："threads"（线程 + requests）或 "asyncio"（协程 + aiohttp，需安装 aiohttp）
+        self.engine = engine
+        self.async_config = AsyncEngineConfig()
+        # 批量下载取消信号（调度器与下载循环共用）
+        self.cancel_event = threading.Event()
+        # 进行中的批量下载调度器（运行中调整优先级 / 出队策略用）与优先级递增序号
+        self._scheduler = None
+        self._priority_seq = 0
+        # 已解析直链的持久化缓存（按下载目录各一份）
+        self._url_caches = {}
+        self._url_caches_lock = threading.Lock()
+        # 分阶段耗时与请求计数（默认关闭，关闭时几乎无开销）
+        self.metrics = Metrics(enabled=self.download_config.metrics_enabled)
+        self.http_pool.host_limiter.metrics = self.metrics
+        # 下载限速：全局与单文件令牌桶（流式写入循环中按块扣减），运行中可调
+        self.bandwidth = BandwidthLimiter(
+            global_bps=self.download_config.max_download_bps,
+            per_file_bps=self.download_config.max_file_bps,
+            metrics=self.metrics,
+        )
+        # fn 页外链脚本多为整站共享的静态资源，跨文件复用
+        self.script_cache = _ScriptAssetCache(
+            max_entries=self.download_config.script_cache_max_entries,
+            max_bytes=self.download_config.script_cache_max_bytes,
+            default_ttl_s=self.download_config.script_cache_ttl_s,
+            honor_http_cache=self.download_config.script_cache_honor_http,
+            metrics=self.metrics,
+        )
+        # 下载进度汇总：工作线程只写计数，界面按频率拉取（见 report_progress）
+        self.progress = ProgressAggregator(
+            max_updates_per_s=self.download_config.progress_updates_per_s,
+            speed_window_s=self.download_config.progress_speed_window_s,
+        )
+        # 本地缓存目录（目录清单等跨下载目录共享的数据）
+        self.cache_dir = os.path.join(os.path.expanduser("~"), ".lanzou_manga_downloader")
+        self._catalog = None
+        self._catalog_lock = threading.Lock()
+        self.last_list_diff = None  # 最近一次列表刷新相对目录清单的变化
         self.list_fetcher = LanzouListFetcher(self)
         self.download_core = LanzouDownloadCore(self)
 
@@ -141,6 +556,13 @@ class OptimizedLanzouDownloader:
         """设置进度回调函数"""
         self.progress_callback = callback
     
+    def report_progress(self, filename, downloaded_size, filepath, status, progress, total_size=0, done=False):
+        """下载进度上报：写入进度汇总（不阻塞）；progress_callback 按每文件频率上限转发。"""
+        self.progress.publish(filename, downloaded_size, total_size, status, filepath, percent=progress, done=done)
+        callback = self.progress_callback
+        if callback and (done or self.progress.should_emit(self.progress.key_for(filename, filepath))):
+            callback(filename, downloaded_size, filepath, status, progress)
+
     def set_global_progress_callback(self, callback):
         """设置全局进度回调函数"""
         self.global_progress_callback = callback
@@ -158,8 +580,10 @@ class OptimizedLanzouDownloader:
         
     def setup_driver(self):
         """设置浏览器驱动"""
-        if Chromium is None or ChromiumOptions is None or SessionOptions is None:
+        drission = _import_drissionpage()
+        if drission is None:
             raise RuntimeError("未安装DrissionPage，无法启用浏览器兜底。")
+        Chromium, ChromiumOptions, SessionOptions = drission
         co = ChromiumOptions(read_file=False)  # 不读取文件方式新建配置对象
         
         # 设置浏览器路径为Edge
@@ -201,8 +625,45 @@ class OptimizedLanzouDownloader:
         so = SessionOptions(read_file=False)
         
         self.driver = Chromium(addr_or_opts=co, session_options=so)
+        self.browser_tabs.warm(self.driver)
     
+    def ensure_driver(self):
+        """首次浏览器兜底时才启动浏览器，之后复用；启动失败（或子类禁用浏览器）后不再重试。"""
+        if self.driver is not None:
+            return self.driver
+        with self._driver_lock:
+            if self.driver is None and not self._driver_unavailable:
+                try:
+                    with self.metrics.span("browser_startup"):
+                        self.setup_driver()
+                except Exception as e:
+                    print(f"浏览器兜底不可用：启动浏览器失败: {e}")
+                self._driver_unavailable = self.driver is None
+            return self.driver
+
+    def close_browser(self):
+        """关闭标签页池并退出浏览器；之后再需要兜底时会重新启动。"""
+        with self._driver_lock:
+            driver, self.driver = self.driver, None
+            self._driver_unavailable = False
+        if driver is None:
+            return
+        self.browser_tabs.close()
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
     def _get_obfuscated_credentials(self):
+        """获取内置凭证（解密结果在进程内缓存，重复创建下载器时不再导入 cryptography / 解密）。"""
+        global _credentials
+        with _credentials_lock:
+            if _credentials is None:
+                _credentials = self._decrypt_credentials()
+            return _credentials
+
+    @staticmethod
+    def _decrypt_credentials():
         """使用AES-GCM + 分片密钥重组获取凭证。"""
         from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
@@ -233,114 +694,92 @@ class OptimizedLanzouDownloader:
         data = json.loads(payload.decode("utf-8"))
         return data["u"], data["p"]
     
+    # 兜底提链的下载链接选择器（按优先级）；任一下载域名的链接出现即视为页面就绪
+    _BROWSER_LINK_SELECTORS = (
+        'xpath://a[contains(@href, "developer-oss") and contains(@href, "toolsdown")]',
+        'xpath://a[contains(@href, "lanzoug.com") and contains(@href, "file")]',
+        'xpath://a[contains(@href, "lanzou")]',
+        'xpath://a[contains(@onclick, "down") or contains(@onclick, "download")]',
+        'css:a[href*="developer-oss"]',
+        'css:a[href*="lanzoug.com"]',
+    )
+    _BROWSER_READY_SELECTOR = (
+        'xpath://a[contains(@href, "developer-oss") or contains(@href, "lanzoug.com") or contains(@href, "downserver")]'
+    )
+
+    def _pick_browser_download_href(self, tab):
+        for selector in self._BROWSER_LINK_SELECTORS:
+            try:
+                elements = tab.eles(selector, timeout=0)
+                for element in elements or ():
+                    href = element.attr('href')
+                    if href and ('developer-oss' in href or 'lanzoug.com' in href or 'downserver' in href):
+                        return href
+            except Exception:
+                continue
+        return None
+
     def _get_real_download_url_by_browser(self, file_link):
-        """浏览器路径（临时兜底）。"""
-        if not file_link or not self.driver:
+        """浏览器路径（临时兜底）：从标签页池借出预开的标签页，等到下载链接出现即返回。"""
+        driver = self.ensure_driver() if file_link else None
+        self.metrics.inc("browser_fallbacks", available=bool(file_link and driver))
+        if not file_link or not driver:
             print("浏览器兜底不可用：driver未初始化或file_link为空")
             return None
 
-        with self.browser_lock:
-            tab = None
-            try:
-                print("进入浏览器兜底提链流程")
-                tab = self.driver.new_tab()
+        cfg = self.download_config
+        try:
+            tab = self.browser_tabs.checkout(driver)
+        except Exception as e:
+            print(f"浏览器兜底提链异常: 打开标签页失败: {e}")
+            return None
+        if tab is None:
+            print(f"浏览器兜底提链失败：{cfg.browser_tab_wait_s:g} 秒内没有空闲标签页")
+            return None
+
+        broken = False
+        try:
+            print("进入浏览器兜底提链流程")
+            with self.metrics.span("browser_fallback"):
                 tab.get(file_link)
-                time.sleep(3)
-
-                selectors = [
-                    'xpath://a[contains(@href, "developer-oss") and contains(@href, "toolsdown")]',
-                    'xpath://a[contains(@href, "lanzoug.com") and contains(@href, "file")]',
-                    'xpath://a[contains(@href, "lanzou")]',
-                    'xpath://a[contains(@onclick, "down") or contains(@onclick, "download")]',
-                    'css:a[href*="developer-oss"]',
-                    'css:a[href*="lanzoug.com"]'
-                ]
-                for selector in selectors:
-                    try:
-                        elements = tab.eles(selector, timeout=3)
-                        if not elements:
-                            continue
-                        for element in elements:
-                            href = element.attr('href')
-                            if href and ('developer-oss' in href or 'lanzoug.com' in href or 'downserver' in href):
-                                print(f"浏览器兜底提链成功: {self._mask_url(href)}")
-                                return href
-                    except Exception:
-                        continue
-                print("浏览器兜底提链失败：未匹配到下载链接")
-                return None
-            except Exception as e:
-                print(f"浏览器兜底提链异常: {e}")
-                return None
-            finally:
-                try:
-                    if tab:
-                        tab.close()
-                except Exception:
-                    pass
+                # 等待下载链接出现（出现即返回），取代固定休眠
+                started = time.monotonic()
+                ready = tab.ele(self._BROWSER_READY_SELECTOR, timeout=cfg.browser_anchor_wait_s)
+                self.metrics.observe("browser_anchor_wait_s", time.monotonic() - started, found=bool(ready))
+                href = self._pick_browser_download_href(tab)
+            if href:
+                print(f"浏览器兜底提链成功: {self._mask_url(href)}")
+                return href
+            print("浏览器兜底提链失败：未匹配到下载链接")
+            return None
+        except Exception as e:
+            broken = True
+            print(f"浏览器兜底提链异常: {e}")
+            return None
+        finally:
+            self.browser_tabs.release(tab, broken=broken)
 
     def _extract_ajax_file_id_from_js_text(self, text):
         """从一段JS文本中提取 ajaxm.php 的 file 参数。"""
-        if not text:
-            return None
-
-        def _ok(v):
-            s = str(v).strip()
-            return s if s.isdigit() and s != "1" and len(s) >= 6 else None
-
-        direct_patterns = [
-            r"url\s*:\s*['\"]/ajaxm\.php\?file=(\d{6,})['\"]",
-            r"/ajaxm\.php\?file=(\d{6,})",
-            r"\bfile\s*[:=]\s*['\"]?(\d{6,})['\"]?",
-            r"\bfid\s*[:=]\s*['\"]?(\d{6,})['\"]?",
-        ]
-        for p in direct_patterns:
-            m = re.search(p, text)
-            if m:
-                v = _ok(m.group(1))
-                if v:
-                    return v
-
-        # 处理 url:'/ajaxm.php?file=' + someVar 这类拼接
-        m_var = re.search(r"/ajaxm\.php\?file=['\"]\s*\+\s*([A-Za-z_][A-Za-z0-9_]*)", text)
-        if m_var:
-            var_name = m_var.group(1)
-            m_val = re.search(
-                rf"\b(?:var\s+)?{re.escape(var_name)}\s*=\s*['\"]?(\d{{6,}})['\"]?",
-                text
-            )
-            if m_val:
-                v = _ok(m_val.group(1))
-                if v:
-                    return v
-
-        return None
+        return scan_ajax_file_id(text)
 
     def _extract_ajax_file_id_from_fn_assets(self, fn_html, origin, fn_url, headers):
         """从 fn 页内联脚本与外链JS中提取 file_id。"""
         # 1) 先扫内联 script
-        inline_scripts = re.findall(r"<script[^>]*>([\s\S]*?)</script>", fn_html, re.I)
-        for js in inline_scripts:
-            fid = self._extract_ajax_file_id_from_js_text(js)
-            if fid:
-                print(f"从fn内联脚本提取file_id: {fid}")
-                return fid
+        fid = scan_inline_ajax_params(fn_html).get("file_id")
+        if fid:
+            print(f"从fn内联脚本提取file_id: {fid}")
+            return fid
 
         # 2) 再扫外链 script src
-        script_srcs = re.findall(r"<script[^>]+src=['\"]([^'\"]+)['\"]", fn_html, re.I)
-        seen = set()
-        for src in script_srcs[:12]:
-            full = urljoin(origin + "/", html.unescape(src).strip())
-            if not full or full in seen:
-                continue
-            seen.add(full)
+        for full in self._fn_script_urls(fn_html, origin):
             try:
                 h = dict(headers)
                 h["Referer"] = fn_url
-                r = self.http.get(full, headers=h, timeout=12)
-                if r.status_code != 200:
+                js_text = self.script_cache.fetch(self.http, full, h, timeout=12)
+                if js_text is None:
                     continue
-                fid = self._extract_ajax_file_id_from_js_text(r.text)
+                fid = self._extract_ajax_file_id_from_js_text(js_text)
                 if fid:
                     print(f"从fn外链脚本提取file_id: {fid}")
                     return fid
@@ -350,101 +789,125 @@ class OptimizedLanzouDownloader:
 
     def _extract_ajax_params_from_js_text(self, text):
         """从JS文本中提取 downprocess 参数。"""
-        if not text:
-            return {}
-
-        out = {}
-
-        # file_id
-        fid = self._extract_ajax_file_id_from_js_text(text)
-        if fid:
-            out["file_id"] = fid
-
-        # websignkey / signs / ajaxdata
-        for p in [
-            r"var\s+ajaxdata\s*=\s*['\"]([^'\"]+)['\"]",
-            r"websignkey\s*[:=]\s*['\"]([^'\"]+)['\"]",
-            r"signs\s*[:=]\s*['\"]([^'\"]+)['\"]",
-        ]:
-            m = re.search(p, text, re.I)
-            if m:
-                out["ajaxdata"] = html.unescape(m.group(1)).strip()
-                break
+        return scan_ajax_params(text)
 
-        # wp_sign / sign
-        for p in [
-            r"var\s+wp_sign\s*=\s*['\"]([^'\"]+)['\"]",
-            r"\bsign\s*[:=]\s*['\"]([^'\"]+)['\"]",
-        ]:
-            m = re.search(p, text, re.I)
-            if m:
-                out["wp_sign"] = html.unescape(m.group(1)).strip()
-                break
-
-        # websign（部分站点要求固定值，如 "2"）
-        for p in [
-            r"var\s+websign\s*=\s*['\"]([^'\"]*)['\"]",
-            r"['\"]websign['\"]\s*[:=]\s*['\"]([^'\"]*)['\"]",
-            r"['\"]websign['\"]\s*[:=]\s*(\d+)",
-        ]:
-            m = re.search(p, text, re.I)
-            if m:
-                out["websign"] = html.unescape(m.group(1)).strip()
-                break
+    _AJAX_PARAM_KEYS = ("file_id", "ajaxdata", "wp_sign", "websign")
 
+    @classmethod
+    def _merge_ajax_params(cls, best, found):
+        """把新提取的参数并入 best（已有的键不覆盖）。"""
+        if not found:
+            return
+        for k in cls._AJAX_PARAM_KEYS:
+            if k not in best and found.get(k):
+                best[k] = found.get(k)
+
+    @staticmethod
+    def _ajax_params_complete(params):
+        return all(params.get(k) for k in ("file_id", "ajaxdata", "wp_sign"))
+
+    def _extract_inline_ajax_params(self, fn_html):
+        """只扫 fn 页内联脚本提取参数。"""
+        return scan_inline_ajax_params(fn_html)
+
+    @staticmethod
+    def _fn_script_urls(fn_html, origin, limit=12):
+        """fn 页外链脚本的绝对 URL（去重，最多 limit 个）。"""
+        out = []
+        for src in scan_script_srcs(fn_html)[:limit]:
+            full = urljoin(origin + "/", html.unescape(src).strip())
+            if full and full not in out:
+                out.append(full)
         return out
 
+    def _log_partial_ajax_params(self, best):
+        if best:
+            print(
+                "从fn脚本资产提取到部分参数: "
+                f"file_id={bool(best.get('file_id'))}, "
+                f"ajaxdata={bool(best.get('ajaxdata'))}, "
+                f"wp_sign={bool(best.get('wp_sign'))}, "
+                f"websign={bool(best.get('websign'))}"
+            )
+
     def _extract_ajax_params_from_fn_assets(self, fn_html, origin, fn_url, headers):
         """从 fn 页内联脚本与外链JS中联合提取 ajax 参数。"""
-        best = {}
-
-        def _merge(d):
-            nonlocal best
-            if not d:
-                return
-            for k in ("file_id", "ajaxdata", "wp_sign", "websign"):
-                if k not in best and d.get(k):
-                    best[k] = d.get(k)
-
         # 1) 内联脚本
-        inline_scripts = re.findall(r"<script[^>]*>([\s\S]*?)</script>", fn_html, re.I)
-        for js in inline_scripts:
-            _merge(self._extract_ajax_params_from_js_text(js))
-            if all(best.get(k) for k in ("file_id", "ajaxdata", "wp_sign")):
-                print(f"从fn内联脚本提取参数成功: file_id={best.get('file_id')}")
-                return best
+        best = self._extract_inline_ajax_params(fn_html)
+        if self._ajax_params_complete(best):
+            print(f"从fn内联脚本提取参数成功: file_id={best.get('file_id')}")
+            return best
 
         # 2) 外链脚本
-        script_srcs = re.findall(r"<script[^>]+src=['\"]([^'\"]+)['\"]", fn_html, re.I)
-        seen = set()
-        for src in script_srcs[:12]:
-            full = urljoin(origin + "/", html.unescape(src).strip())
-            if not full or full in seen:
-                continue
-            seen.add(full)
+        for full in self._fn_script_urls(fn_html, origin):
             try:
                 h = dict(headers)
                 h["Referer"] = fn_url
-                r = self.http.get(full, headers=h, timeout=12)
-                if r.status_code != 200:
+                js_text = self.script_cache.fetch(self.http, full, h, timeout=12)
+                if js_text is None:
                     continue
-                _merge(self._extract_ajax_params_from_js_text(r.text))
-                if all(best.get(k) for k in ("file_id", "ajaxdata", "wp_sign")):
+                self._merge_ajax_params(best, self._extract_ajax_params_from_js_text(js_text))
+                if self._ajax_params_complete(best):
                     print(f"从fn外链脚本提取参数成功: file_id={best.get('file_id')}")
                     return best
             except Exception:
                 continue
 
-        if best:
-            print(
-                "从fn脚本资产提取到部分参数: "
-                f"file_id={bool(best.get('file_id'))}, "
-                f"ajaxdata={bool(best.get('ajaxdata'))}, "
-                f"wp_sign={bool(best.get('wp_sign'))}, "
-                f"websign={bool(best.get('websign'))}"
-            )
+        self._log_partial_ajax_params(best)
         return best
 
+    def _resolve_headers(self):
+        return {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/145.0.0.0 Safari/537.36",
+            "Accept-Language": "zh-CN,zh;q=0.9",
+        }
+
+    @staticmethod
+    def _decode_escaped_html(text):
+        """还原页面中转义过的斜杠与冒号（\\/、\\u002F、\\x2f 等）。"""
+        return decode_escaped_html(text)
+
+    def _find_fn_url_in_page(self, page_html):
+        """从分享页提取 fn 页链接：先查原始 HTML，再查解码后的 HTML。"""
+        return scan_fn_url(page_html)
+
+    @staticmethod
+    def _find_js_redirect_url(page_html, origin):
+        target = scan_js_redirect(page_html)
+        return urljoin(origin + "/", target) if target else None
+
+    @staticmethod
+    def _build_ajaxm_request(origin, fn_url, file_id, ajaxdata, wp_sign, websign, common_headers):
+        """组装 ajaxm.php downprocess 请求，返回 (url, query, 表单, 请求头)。"""
+        post_headers = {
+            "Accept": "application/json, text/javascript, */*",
+            "Content-Type": "application/x-www-form-urlencoded",
+            "X-Requested-With": "XMLHttpRequest",
+            "Origin": origin,
+            "Referer": fn_url,
+            "User-Agent": common_headers["User-Agent"],
+            "Accept-Language": common_headers["Accept-Language"],
+        }
+        payload = {
+            "action": "downprocess",
+            "websignkey": ajaxdata,
+            "signs": ajaxdata,
+            "sign": wp_sign,
+            "websign": websign if websign is not None else "",
+            "kd": "1",
+            "ves": "1",
+        }
+        return f"{origin}/ajaxm.php", {"file": file_id}, payload, post_headers
+
+    @staticmethod
+    def _real_url_from_ajaxm(data):
+        """由 ajaxm.php 的 dom + url 拼出直链，缺字段时返回 None。"""
+        dom = str(data.get("dom", "")).strip().rstrip("/")
+        path = str(data.get("url", "")).strip()
+        if not dom or not path:
+            return None
+        return f"{dom}/file/{path}&toolsdown"
+
     def _get_real_download_url_impl(self, file_link, ajax_file_id=None):
         """下载核心实现（由 download_core 调用）。"""
         if not file_link:
@@ -452,76 +915,40 @@ class OptimizedLanzouDownloader:
 
         print(f"正在获取文件的真实下载链接: {self._mask_url(file_link)}")
         try:
-            common_headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/145.0.0.0 Safari/537.36",
-                "Accept-Language": "zh-CN,zh;q=0.9",
-            }
+            common_headers = self._resolve_headers()
 
             # 1) 访问分享页，提取 fn 页面链接
-            r1 = self.http.get(file_link, headers=common_headers, timeout=15)
+            with self.metrics.span("file_page", http=True):
+                r1 = self.http.get(file_link, headers=common_headers, timeout=15)
             r1.raise_for_status()
             page_html = r1.text
             parsed = urlparse(file_link)
             origin = f"{parsed.scheme}://{parsed.netloc}"
-            host = parsed.netloc
+            host = parsed.hostname or parsed.netloc
 
             # 处理简单的挑战页
             if self._is_html_challenge_response(r1, page_html):
                 token = self._solve_acw_sc_v2(page_html)
                 if token:
                     self.http.cookies.set("acw_sc__v2", token, domain=host, path="/")
-                    r1 = self.http.get(file_link, headers=common_headers, timeout=15)
+                    with self.metrics.span("file_page", http=True):
+                        r1 = self.http.get(file_link, headers=common_headers, timeout=15)
                     r1.raise_for_status()
                     page_html = r1.text
             # 补齐常见 cookie
             self.http.cookies.set("codelen", "1", domain=host, path="/")
 
-            def _decode_html(text):
-                if not text:
-                    return ""
-                s = html.unescape(text)
-                s = s.replace("\\/", "/")
-                s = s.replace("\\u002F", "/").replace("\\u002f", "/")
-                s = s.replace("\\x2f", "/").replace("\\x2F", "/")
-                s = s.replace("\\u003a", ":").replace("\\u003A", ":")
-                return s
-
-            def _find_fn_url(text):
-                if not text:
-                    return None
-                # iframe src
-                m_iframe = re.search(r'<iframe[^>]+src=[\'"]([^\'"]+)', text, re.I)
-                if m_iframe:
-                    src_val = html.unescape(m_iframe.group(1)).replace("\\/", "/").strip()
-                    if "fn?" in src_val:
-                        return src_val
-                # script 中直接赋值
-                m_fn = re.search(r'((?:https?://[^\s\'"]+)?/?fn\?[A-Za-z0-9_\-+=/%\?&]+)', text, re.I)
-                if m_fn:
-                    return html.unescape(m_fn.group(1)).replace("\\/", "/").strip()
-                # 更宽松的匹配
-                m_fn2 = re.search(r'(/fn\?[^\'"\s]+)', text, re.I)
-                if m_fn2:
-                    return html.unescape(m_fn2.group(1)).replace("\\/", "/").strip()
-                return None
-
-            fn_candidate = None
-            # 先尝试原始 HTML
-            fn_candidate = _find_fn_url(page_html)
-            # 尝试解码后的 HTML
-            if not fn_candidate:
-                fn_candidate = _find_fn_url(_decode_html(page_html))
+            fn_candidate = self._find_fn_url_in_page(page_html)
 
             # 兜底：处理 JS 跳转
             if not fn_candidate:
-                m_loc = re.search(r"location\.href\s*=\s*['\"]([^'\"]+)['\"]", page_html)
-                if m_loc:
-                    jump_url = urljoin(origin + "/", html.unescape(m_loc.group(1)).replace("\\/", "/").strip())
+                jump_url = self._find_js_redirect_url(page_html, origin)
+                if jump_url:
                     try:
-                        r1b = self.http.get(jump_url, headers=common_headers, timeout=15)
+                        with self.metrics.span("file_page", http=True):
+                            r1b = self.http.get(jump_url, headers=common_headers, timeout=15)
                         r1b.raise_for_status()
-                        html2 = r1b.text
-                        fn_candidate = _find_fn_url(html2) or _find_fn_url(_decode_html(html2))
+                        fn_candidate = self._find_fn_url_in_page(r1b.text)
                     except Exception:
                         pass
 
@@ -545,7 +972,8 @@ class OptimizedLanzouDownloader:
             for attempt in (1, 2):
                 h2 = dict(common_headers)
                 h2["Referer"] = file_link
-                r2 = self.http.get(fn_url, headers=h2, timeout=15)
+                with self.metrics.span("fn_page", http=True):
+                    r2 = self.http.get(fn_url, headers=h2, timeout=15)
                 r2.raise_for_status()
                 fn_html = r2.text
 
@@ -575,6 +1003,7 @@ class OptimizedLanzouDownloader:
 
                 if attempt == 1:
                     print("fn参数提取首轮未完整，刷新后重试一次")
+                    self.metrics.inc("retries", kind="fn_page")
                     time.sleep(0.35)
 
             if not (ajaxdata and wp_sign and file_id):
@@ -583,42 +1012,25 @@ class OptimizedLanzouDownloader:
                 return self._get_real_download_url_by_browser(file_link)
 
             # 3) 调用 ajaxm.php 获取 dom + url
-            ajax_url = f"{origin}/ajaxm.php"
-            params = {"file": file_id}
-            post_headers = {
-                "Accept": "application/json, text/javascript, */*",
-                "Content-Type": "application/x-www-form-urlencoded",
-                "X-Requested-With": "XMLHttpRequest",
-                "Origin": origin,
-                "Referer": fn_url,
-                "User-Agent": common_headers["User-Agent"],
-                "Accept-Language": common_headers["Accept-Language"],
-            }
-            payload = {
-                "action": "downprocess",
-                "websignkey": ajaxdata,
-                "signs": ajaxdata,
-                "sign": wp_sign,
-                "websign": websign if websign is not None else "",
-                "kd": "1",
-                "ves": "1",
-            }
-            r3 = self.http.post(ajax_url, params=params, data=payload, headers=post_headers, timeout=15)
-            r3.raise_for_status()
-            data = r3.json()
+            ajax_url, params, payload, post_headers = self._build_ajaxm_request(
+                origin, fn_url, file_id, ajaxdata, wp_sign, websign, common_headers
+            )
+            with self.metrics.span("ajaxm", http=True) as span:
+                r3 = self.http.post(ajax_url, params=params, data=payload, headers=post_headers, timeout=15)
+                r3.raise_for_status()
+                data = r3.json()
+                span.set(outcome=f"zt{data.get('zt')}")
             if str(data.get("zt")) != "1":
                 print(f"警告: ajaxm返回异常 zt={data.get('zt')}, info={data.get('inf')}")
                 print("requests主路径提链失败，尝试浏览器兜底")
                 return self._get_real_download_url_by_browser(file_link)
 
-            dom = str(data.get("dom", "")).strip().rstrip("/")
-            path = str(data.get("url", "")).strip()
-            if not dom or not path:
+            real_url = self._real_url_from_ajaxm(data)
+            if not real_url:
                 print("警告: ajaxm缺少 dom/url")
                 print("requests主路径提链失败，尝试浏览器兜底")
                 return self._get_real_download_url_by_browser(file_link)
 
-            real_url = f"{dom}/file/{path}&toolsdown"
             print("requests主路径提链成功")
             print(f"找到真实下载链接: {self._mask_url(real_url)}")
             return real_url
@@ -638,7 +1050,8 @@ class OptimizedLanzouDownloader:
         }
 
         try:
-            with self.http.head(url, allow_redirects=True, timeout=timeout, headers=headers) as r:
+            with self.metrics.span("validate_head", http=True), \
+                    self.http.head(url, allow_redirects=True, timeout=timeout, headers=headers) as r:
                 if r.status_code in (200, 206):
                     return "text/html" not in (r.headers.get("Content-Type") or "").lower()
                 if r.status_code in (403, 404, 410):
@@ -649,7 +1062,8 @@ class OptimizedLanzouDownloader:
         try:
             h2 = dict(headers)
             h2["Range"] = "bytes=0-0"
-            with self.http.get(url, headers=h2, stream=True, allow_redirects=True, timeout=timeout) as r:
+            with self.metrics.span("validate_range", http=True), \
+                    self.http.get(url, headers=h2, stream=True, allow_redirects=True, timeout=timeout) as r:
                 if r.status_code in (206, 200):
                     return "text/html" not in (r.headers.get("Content-Type") or "").lower()
                 if r.status_code in (403, 404, 410):
@@ -658,6 +1072,28 @@ class OptimizedLanzouDownloader:
             return False
         return False
 
+    def _probe_range_support_impl(self, url, timeout=8):
+        """下载核心实现（由 download_core 调用）。"""
+        if not url:
+            return False, None
+        headers = {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
+            "Accept": "*/*",
+            "Accept-Encoding": "identity",
+            "Range": "bytes=0-0",
+        }
+        try:
+            with self.metrics.span("range_probe", http=True), \
+                    self.http.get(url, headers=headers, stream=True, allow_redirects=True, timeout=timeout) as r:
+                if r.status_code != 206:
+                    return False, None
+                if "text/html" in (r.headers.get("Content-Type") or "").lower():
+                    return False, None
+                m = re.match(r"\s*bytes\s+0-0/(\d+)", r.headers.get("Content-Range") or "", re.I)
+                return (True, int(m.group(1))) if m else (False, None)
+        except Exception:
+            return False, None
+
     def _is_html_challenge_response(self, response, body_text=None):
         """判断响应是否为反爬挑战HTML页。"""
         ctype = (response.headers.get("Content-Type") or "").lower()
@@ -695,6 +1131,12 @@ class OptimizedLanzouDownloader:
 
     def _solve_acw_sc_v2(self, challenge_html):
         """从挑战页计算 acw_sc__v2 cookie 值。"""
+        with self.metrics.span("challenge") as span:
+            token = self._compute_acw_sc_v2(challenge_html)
+            span.set(outcome="solved" if token else "failed")
+        return token
+
+    def _compute_acw_sc_v2(self, challenge_html):
         try:
             m_arg1 = re.search(r"var\s+arg1='([0-9A-Fa-f]+)'", challenge_html)
             m_perm = re.search(r"var\s+m=\[([^\]]+)\]", challenge_html)
@@ -742,24 +1184,72 @@ class OptimizedLanzouDownloader:
         except Exception:
             return ""
 
+    def _validation_policy_path(self):
+        return os.path.join(self.cache_dir, "validation_policy.json") if self.cache_dir else None
+
+    def _ensure_validation_policy_loaded(self):
+        """首次使用时合并上次运行学到的按域名校验策略（过期条目丢弃）。"""
+        if self._validation_policy_loaded:
+            return
+        with self._validation_policy_lock:
+            if self._validation_policy_loaded:
+                return
+            self._validation_policy_loaded = True
+            path = self._validation_policy_path()
+            if not path or not os.path.exists(path):
+                return
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+            except Exception as e:
+                print(f"调试: 校验策略文件读取失败，已忽略: {e}")
+                return
+            cutoff = time.time() - self.download_config.validation_policy_ttl_s
+            for host, state in (saved or {}).items():
+                if isinstance(state, dict) and state.get("updated_at", 0) >= cutoff:
+                    self.validation_policy.setdefault(host, state)
+
+    def _save_validation_policy(self):
+        path = self._validation_policy_path()
+        if not path:
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with self._validation_policy_lock:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self.validation_policy, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"调试: 校验策略文件写入失败: {e}")
+
     def _should_skip_validation(self, url):
         host = self._get_host(url)
         if not host:
             return False
+        self._ensure_validation_policy_loaded()
         return bool(self.validation_policy.get(host, {}).get("skip_validation"))
 
     def _record_validation_false_negative(self, url):
         host = self._get_host(url)
         if not host:
             return
-        state = self.validation_policy.setdefault(host, {"false_negative": 0, "skip_validation": False})
-        state["false_negative"] += 1
-        if state["false_negative"] >= 2 and not state["skip_validation"]:
-            state["skip_validation"] = True
+        self._ensure_validation_policy_loaded()
+        with self._validation_policy_lock:
+            state = self.validation_policy.setdefault(host, {"false_negative": 0, "skip_validation": False})
+            state["false_negative"] += 1
+            state["updated_at"] = time.time()
+            learned = state["false_negative"] >= 2 and not state["skip_validation"]
+            if learned:
+                state["skip_validation"] = True
+        if learned:
             print(f"校验策略自适应: 检测到 {host} 存在校验误杀，后续将跳过预校验")
+        self._save_validation_policy()
     
-    def download_with_requests(self, url, file_path, file_name):
-        return self.download_core.download_with_requests(url, file_path, file_name)
+    def download_with_requests(self, url, file_path, file_name, file_link=None, ajax_file_id=None):
+        return self.download_core.download_with_requests(
+            url, file_path, file_name, file_link=file_link, ajax_file_id=ajax_file_id
+        )
 
     def download_single_file_optimized(self, file_info, download_dir="downloads", prefetched_real_url=None):
         return self.download_core.download_single_file_optimized(file_info, download_dir, prefetched_real_url)
@@ -767,10 +1257,255 @@ class OptimizedLanzouDownloader:
     def download_single_file_legacy(self, file_info, download_dir="downloads", max_retries=3):
         return self.download_core.download_single_file_legacy(file_info, download_dir, max_retries)
 
-    def login_and_get_files(self, url=None, password=None, on_batch=None, stop_event=None):
-        """代理到列表获取器，保持 API 不变。"""
-        return self.list_fetcher.fetch(url=url, password=password, on_batch=on_batch, stop_event=stop_event)
+    def get_url_cache(self, download_dir):
+        """获取下载目录下的直链缓存（download_dir/.lanzou_cache/resolved_urls.sqlite3）。"""
+        cfg = self.download_config
+        if not cfg.url_cache_enabled or not download_dir:
+            return None
+        key = os.path.abspath(download_dir)
+        with self._url_caches_lock:
+            cache = self._url_caches.get(key)
+            if cache is None:
+                try:
+                    cache = ResolvedUrlCache(
+                        os.path.join(key, ".lanzou_cache", "resolved_urls.sqlite3"),
+                        ttl_s=cfg.url_cache_ttl_s,
+                        max_entries=cfg.url_cache_max_entries,
+                    )
+                except Exception as e:
+                    print(f"直链缓存不可用，已跳过: {e}")
+                    return None
+                self._url_caches[key] = cache
+            return cache
+
+    def invalidate_resolved_url(self, file_link, ajax_file_id=None):
+        """直链被证实失效（HTML/403/404/410）时，从所有已打开的缓存中作废。"""
+        with self._url_caches_lock:
+            caches = list(self._url_caches.values())
+        for cache in caches:
+            try:
+                cache.invalidate(file_link, ajax_file_id)
+            except Exception:
+                pass
+
+    def resolve_real_url(self, file_info, download_dir="downloads", use_cache=True):
+        return self.download_core.resolve_real_url(file_info, download_dir, use_cache=use_cache)
+
+    def create_prefetch_manager(self, resolve_fn=None):
+        """创建直链预取流水线（窗口/线程数/TTL 取自 download_config）。"""
+        return _PrefetchManager(self, resolve_fn=resolve_fn)
+
+    def create_download_queue(self, files):
+        """按 download_config 的调度策略建立待下载队列（线程调度器与 asyncio 引擎共用）。"""
+        cfg = self.download_config
+        return DownloadQueue(
+            files,
+            policy=cfg.schedule_policy,
+            size_of=self.parse_size_bytes,
+            fair_large_bytes=cfg.fair_large_bytes,
+            fair_small_per_large=cfg.fair_small_per_large,
+            fair_large_workers=cfg.fair_large_workers,
+        )
+
+    def download_files(self, files, download_dir="downloads", max_workers=None, on_file_done=None):
+        """并发下载多个文件，返回 total/succeeded/failed/cancelled 统计。
+
+        不会清除取消信号：上一批取消过时，先调用 clear_cancel() 再开始新一批。
+        """
+        if self.engine == "asyncio":
+            async def _job(engine):
+                # 引擎提供与线程调度器相同的 queue / reorder()，运行中的插队与切换顺序同样生效
+                self._scheduler = engine
+                try:
+                    return await engine.download_files(
+                        files, download_dir, max_workers=max_workers, on_file_done=on_file_done
+                    )
+                finally:
+                    self._scheduler = None
+            return self.run_async(_job)
+        scheduler = LanzouDownloadScheduler(self, max_workers=max_workers)
+        self._scheduler = scheduler
+        try:
+            return scheduler.run(files, download_dir, on_file_done=on_file_done)
+        finally:
+            self._scheduler = None
+
+    def create_async_engine(self):
+        """创建 asyncio 引擎（async with engine: ...），可在调用方自己的事件循环中使用。"""
+        # 按需导入：aiohttp 导入较慢，线程引擎用不到
+        try:
+            from source_code_common.lanzou_async_engine import AsyncLanzouEngine
+        except Exception:
+            from lanzou_async_engine import AsyncLanzouEngine
+        return AsyncLanzouEngine(self)
+
+    def run_async(self, job):
+        """在新事件循环中运行 job(engine) 返回的协程；当前线程已有运行中的事件循环时改在独立线程中运行。"""
+        import asyncio
+
+        async def _main():
+            async with self.create_async_engine() as engine:
+                return await job(engine)
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(_main())
+        result, error = [], []
+
+        def _run():
+            try:
+                result.append(asyncio.run(_main()))
+            except BaseException as e:
+                error.append(e)
+
+        worker = threading.Thread(target=_run, name="lanzou-async-engine", daemon=True)
+        worker.start()
+        worker.join()
+        if error:
+            raise error[0]
+        return result[0]
+
+    def cancel_downloads(self):
+        """取消当前批量下载（未开始的文件不再执行，进行中的传输尽快中止）。"""
+        self.cancel_event.set()
+
+    def clear_cancel(self):
+        """清除上一批的取消信号（由界面 / 命令行在用户开始新一批下载时调用）。"""
+        self.cancel_event.clear()
+
+    def set_schedule_policy(self, policy):
+        """切换批量下载的出队顺序（见 SCHEDULE_POLICIES）；进行中的批量下载对剩余文件立即生效。"""
+        if policy not in SCHEDULE_POLICIES:
+            raise ValueError(f"未知的调度策略: {policy}")
+        self.download_config.schedule_policy = policy
+        scheduler = self._scheduler
+        if scheduler is not None:
+            scheduler.reorder(policy=policy)
+
+    def next_download_priority(self):
+        """比之前分配过的都高的优先级（后调整的文件先下载）。"""
+        self._priority_seq += 1
+        return self._priority_seq
+
+    def prioritize_downloads(self, files, priority=None):
+        """调整进行中批量下载里仍在排队的文件的优先级（默认排到最前），返回调整的文件数。"""
+        scheduler = self._scheduler
+        if scheduler is None:
+            return 0
+        if priority is None:
+            priority = self.next_download_priority()
+        return scheduler.reorder(files, priority=priority)
+
+    def get_download_queue(self):
+        """进行中批量下载里仍在排队的文件（按预计出队顺序），无批量下载时为空列表。"""
+        scheduler = self._scheduler
+        if scheduler is None or scheduler.queue is None:
+            return []
+        return [f for _, f in scheduler.queue.ordered()]
+
+    def get_http_stats(self):
+        """共享连接池统计（各主机类别的请求数、新建连接数与复用率），用于调优池大小。"""
+        return self.http_pool.stats()
+
+    def set_bandwidth_limit(self, global_bps=None, per_file_bps=None):
+        """调整下载限速（字节/秒，0 表示不限，None 表示不变）；进行中的下载立即生效。"""
+        if global_bps is not None:
+            self.download_config.max_download_bps = max(0, int(global_bps))
+            self.bandwidth.set_global_rate(global_bps)
+        if per_file_bps is not None:
+            self.download_config.max_file_bps = max(0, int(per_file_bps))
+            self.bandwidth.set_per_file_rate(per_file_bps)
+
+    def set_file_bandwidth_limit(self, file_info, bps, download_dir="downloads"):
+        """单独设置某个文件的下载限速（bps 为 None 时恢复单文件默认值）；按目标路径区分同名文件。"""
+        file_path = self.download_core._resolve_target_path(file_info, download_dir)[0]
+        self.bandwidth.set_file_rate(file_path, bps)
+
+    def set_host_concurrency(self, host_or_class, limit):
+        """设置某个主机（_get_host 的结果）或主机类别（share / download / asset）的并发上限，0 表示不限。"""
+        self.http_pool.host_limiter.set_limit(host_or_class, limit)
+
+    def get_limiter_stats(self):
+        """限速与按主机并发的当前状态。"""
+        return {"bandwidth": self.bandwidth.stats(), "hosts": self.http_pool.host_limiter.stats()}
+
+    def get_browser_stats(self):
+        """浏览器兜底标签页池统计（池大小、借出 / 等待次数、平均等待秒数、超时次数），用于调整 browser_tabs。"""
+        return self.browser_tabs.stats()
+
+    def get_catalog(self):
+        """获取分享目录清单（cache_dir/share_catalog.sqlite3），不可用时返回 None。"""
+        if not self.list_config.catalog_enabled or not self.cache_dir:
+            return None
+        with self._catalog_lock:
+            if self._catalog is None:
+                try:
+                    self._catalog = ShareCatalog(os.path.join(self.cache_dir, "share_catalog.sqlite3"))
+                except Exception as e:
+                    print(f"目录清单不可用，已跳过: {e}")
+                    return None
+            return self._catalog
+
+    def login_and_get_files(self, url=None, password=None, on_batch=None, stop_event=None, incremental=None):
+        """代理到列表获取器，保持 API 不变。
+
+        asyncio 引擎的协程抓取不读写目录清单：需要增量刷新或启用了目录清单时仍由线程列表获取器完成，
+        与 CLI 经 iter_files 取列表一致，保证清单与 last_list_diff 在两种引擎下含义相同。
+        """
+        if incremental is None:
+            incremental = self.list_config.incremental
+        if self.engine == "asyncio" and not incremental and self.get_catalog() is None:
+            return self._fetch_files_async(url, password, on_batch, stop_event)
+        return self.list_fetcher.fetch(
+            url=url, password=password, on_batch=on_batch, stop_event=stop_event, incremental=incremental
+        )
+
+    def _fetch_files_async(self, url, password, on_batch, stop_event):
+        self.files = []
+        self.file_items = []
+
+        def _sink(items):
+            batch = [item.to_dict() for item in items]
+            self.file_items.extend(items)
+            self.files.extend(batch)
+            if callable(on_batch):
+                try:
+                    on_batch(batch)
+                except Exception:
+                    pass
+
+        self.run_async(lambda engine: engine.list_files(url, password, on_batch=_sink, stop_event=stop_event))
+        return self.files
     
+    def iter_files(self, url=None, password=None, stop_event=None, incremental=None, max_pending_pages=None):
+        """逐页产出 FileItem（不累积到 self.files），提前关闭即取消抓取。"""
+        return self.list_fetcher.iter_files(
+            url=url,
+            password=password,
+            stop_event=stop_event,
+            incremental=incremental,
+            max_pending_pages=max_pending_pages,
+        )
+
+    def aiter_files(self, url=None, password=None, stop_event=None, incremental=None, max_pending_pages=None):
+        """iter_files 的异步迭代器版本。"""
+        return self.list_fetcher.aiter_files(
+            url=url,
+            password=password,
+            stop_event=stop_event,
+            incremental=incremental,
+            max_pending_pages=max_pending_pages,
+        )
+
+    def parse_size_bytes(self, size_text):
+        """把列表大小文本（如 "12.3 M"、"512 K"）换算为字节数，无法解析时返回 None。"""
+        m = re.match(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*$", str(size_text or ""), re.I)
+        if not m:
+            return None
+        scale = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}[m.group(2).upper()]
+        return int(float(m.group(1)) * scale)
+
     def sanitize_filename(self, filename):
         """清理文件名，移除非法字符"""
         # 移除或替换Windows不支持的字符
@@ -797,3 +1532,8 @@ class OptimizedLanzouDownloader:
 
     def is_download_url_valid(self, url, timeout=8):
         return self.download_core.is_download_url_valid(url, timeout)
+
+    def download_segmented(self, url, file_path, file_name, file_link=None, ajax_file_id=None):
+        return self.download_core.download_segmented(
+            url, file_path, file_name, file_link=file_link, ajax_file_id=ajax_file_id
+        )
@@ -1,7 +1,19 @@
 import os
+import re
+import json
 import time
+import threading
+import http.client
+import requests
+from urllib3.exceptions import HTTPError as Urllib3HTTPError, ProtocolError
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 
+try:
+    from source_code_common.lanzou_errors import LanzouError, ErrorCode, is_cancelled
+except Exception:
+    from lanzou_errors import LanzouError, ErrorCode, is_cancelled
+
 
 class LanzouDownloadCore:
     def __init__(self, downloader):
@@ -34,144 +46,631 @@ class LanzouDownloadCore:
         return os.path.join(target_dir, clean_filename), clean_filename, target_dir
 
     def get_real_download_url(self, file_link, ajax_file_id=None):
-        return self.d._get_real_download_url_impl(file_link, ajax_file_id)
+        with self.d.metrics.span("resolve") as span:
+            real_url = self.d._get_real_download_url_impl(file_link, ajax_file_id)
+            span.set(outcome="ok" if real_url else "failed")
+        return real_url
 
     def is_download_url_valid(self, url, timeout=8):
         return self.d._is_download_url_valid_impl(url, timeout)
 
-    def download_with_requests(self, url, file_path, file_name):
+    def _prevalidate(self, url):
+        """可选的下载前直链校验；未开启或该域名已学到跳过时返回 None，由下载请求的首个响应把关。"""
+        d = self.d
+        if not d.download_config.prevalidate or d._should_skip_validation(url):
+            return None
+        return self.is_download_url_valid(url)
+
+    def resolve_real_url(self, file_info, download_dir="downloads", use_cache=True):
+        """先查下载目录的直链缓存，未命中再走完整提链链路并写回缓存。"""
         d = self.d
+        link = file_info.get("link")
+        ajax_file_id = file_info.get("ajax_file_id")
+        cache = d.get_url_cache(download_dir)
+        if use_cache and cache is not None:
+            try:
+                cached = cache.get(link, ajax_file_id)
+            except Exception:
+                cached = None
+            if cached:
+                print(f"命中直链缓存: {file_info.get('name')}")
+                return cached
+        real_url = self.get_real_download_url(link, ajax_file_id=ajax_file_id)
+        if real_url and cache is not None:
+            try:
+                cache.put(link, ajax_file_id, real_url)
+            except Exception:
+                pass
+        return real_url
+
+    def _part_paths(self, file_path):
+        part_path = f"{file_path}.part"
+        return part_path, f"{part_path}.json"
+
+    def _load_part_meta(self, meta_path):
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            return meta if isinstance(meta, dict) else {}
+        except Exception:
+            return {}
+
+    def _save_part_meta(self, meta_path, meta):
+        try:
+            tmp_path = f"{meta_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(tmp_path, meta_path)
+        except Exception as e:
+            print(f"写入断点元数据失败: {e}")
+
+    def _discard_part(self, part_path, meta_path):
+        for p in (part_path, meta_path):
+            try:
+                if os.path.exists(p):
+                    os.remove(p)
+            except Exception:
+                pass
+
+    def _parse_content_range(self, value):
+        """解析 Content-Range: bytes start-end/total，返回 (start, total)。"""
+        m = re.match(r"\s*bytes\s+(\d+)-(\d+)/(\d+|\*)", str(value or ""), re.I)
+        if not m:
+            return None, None
+        total = int(m.group(3)) if m.group(3) != "*" else None
+        return int(m.group(1)), total
+
+    def _adopt_truncated_file(self, file_path, file_info):
+        """旧版本直接写最终文件；若其明显小于列表大小，则转为 .part 续传。"""
+        if not os.path.exists(file_path):
+            return False
+        listed = self.d.parse_size_bytes(file_info.get("size"))
+        actual = os.path.getsize(file_path)
+        # 列表大小保留一位小数，按 95% 作为截断判定阈值
+        if not listed or actual >= listed * 0.95:
+            return False
+        part_path, meta_path = self._part_paths(file_path)
+        if os.path.exists(part_path):
+            return False
+        try:
+            os.replace(file_path, part_path)
+            self._save_part_meta(meta_path, {
+                "expected_length": None,
+                "source_link": file_info.get("link"),
+                "file_name": file_info.get("name"),
+                "updated_at": int(time.time()),
+            })
+            print(f"检测到不完整文件({actual}/{listed} 字节)，转为断点续传: {file_info.get('name')}")
+            return True
+        except Exception as e:
+            print(f"转换不完整文件失败: {e}")
+            return False
+
+    def _download_headers(self):
+        """文件下载请求头：固定 identity 编码，保证 Content-Length、续传偏移与落盘字节一致。"""
+        return {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+            'Accept-Language': 'zh-CN,zh;q=0.8,en-US;q=0.5,en;q=0.3',
+            'Accept-Encoding': 'identity',
+            'Connection': 'keep-alive',
+            'Upgrade-Insecure-Requests': '1',
+        }
+
+    def _iter_body(self, response):
+        """逐块产出响应体（memoryview，复用同一缓冲区；调用方须在取下一块前写出）。
+
+        无内容编码时经 urllib3 的 readinto 读入预分配缓冲区，省去 iter_content 的分块生成开销；
+        走公开接口以便 urllib3 感知响应体读完并把连接归还连接池（保持长连接复用）。
+        缓冲区大小按吞吐在 io_chunk_min_bytes ~ io_chunk_max_bytes 间自适应。
+        """
+        cfg = self.d.download_config
+        min_size = max(4096, int(cfg.io_chunk_min_bytes))
+        max_size = max(min_size, int(cfg.io_chunk_max_bytes))
+        target_s = max(0.001, float(cfg.io_target_interval_s))
+        encoding = (response.headers.get("Content-Encoding") or "").strip().lower()
+        readinto = getattr(response.raw, "readinto", None)
+        if encoding not in ("", "identity") or readinto is None:
+            for chunk in response.iter_content(chunk_size=min_size):
+                if chunk:
+                    yield memoryview(chunk)
+            return
+
+        size = min_size
+        buf = bytearray(size)
+        view = memoryview(buf)
+        last = time.monotonic()
+        while True:
+            try:
+                n = readinto(view[:size])
+            except ProtocolError as e:
+                # 与 iter_content 一致地转换成 requests 异常，调用方按断线续传处理
+                raise requests.exceptions.ChunkedEncodingError(e)
+            except Urllib3HTTPError as e:
+                raise requests.exceptions.ConnectionError(e)
+            if not n:
+                break
+            yield view[:n]
+            now = time.monotonic()
+            elapsed, last = now - last, now
+            if n < size:
+                continue
+            if elapsed < target_s / 2 and size < max_size:
+                size = min(max_size, size * 2)
+                if size > len(buf):
+                    buf = bytearray(size)
+                    view = memoryview(buf)
+            elif elapsed > target_s * 2 and size > min_size:
+                size = max(min_size, size // 2)
+
+    def download_with_requests(self, url, file_path, file_name, file_link=None, ajax_file_id=None):
+        """下载到 .part 临时文件，断线后按 Range 续传，字节数吻合后原子重命名。"""
+        d = self.d
+        part_path, meta_path = self._part_paths(file_path)
         try:
             if os.path.exists(file_path):
-                if d.progress_callback:
-                    d.progress_callback(file_name, os.path.getsize(file_path), file_path, "跳过(已存在)", 100)
+                d.report_progress(file_name, os.path.getsize(file_path), file_path, "跳过(已存在)", 100, done=True)
                 return True
 
             print(f"开始使用requests下载: {file_name}")
 
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'zh-CN,zh;q=0.8,en-US;q=0.5,en;q=0.3',
-                'Accept-Encoding': 'gzip, deflate',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-            }
-
-            def _request_download(target_url):
-                return d.http.get(target_url, headers=headers, stream=True, timeout=30, allow_redirects=True)
-
-            response = _request_download(url)
-            response.raise_for_status()
-
-            ctype = (response.headers.get("Content-Type") or "").lower()
-            if "text/html" in ctype:
-                challenge_body = response.text
-                if d._is_html_challenge_response(response, challenge_body):
-                    token = d._solve_acw_sc_v2(challenge_body)
-                    response.close()
-                    if token:
-                        host = urlparse(url).hostname
-                        if host:
-                            d.http.cookies.set("acw_sc__v2", token, domain=host, path="/")
-                        print(f"检测到挑战页，已计算acw_sc__v2并重试下载: {file_name}")
-                        response = _request_download(url)
-                        response.raise_for_status()
-                    else:
-                        print(f"检测到挑战页，但未能计算acw_sc__v2: {file_name}")
-                        return False
-
-            final_ctype = (response.headers.get("Content-Type") or "").lower()
-            if "text/html" in final_ctype:
-                response.close()
-                print(f"下载响应仍为HTML，已阻止保存假文件: {file_name}")
-                return False
+            headers = self._download_headers()
+
+            def _request_download(target_url, offset):
+                h = dict(headers)
+                if offset > 0:
+                    h['Range'] = f"bytes={offset}-"
+                with d.metrics.span("download_request", http=True):
+                    return d.http.get(target_url, headers=h, stream=True, timeout=30, allow_redirects=True)
 
-            total_size = int(response.headers.get('content-length', 0))
             os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+            meta = self._load_part_meta(meta_path) if os.path.exists(part_path) else {}
+            if meta.get("mode") == "segmented":
+                # 预分配的分段断点文件不能按文件长度续传
+                return self.download_segmented(url, file_path, file_name, file_link, ajax_file_id)
+            if meta.get("source_link") and file_link and meta.get("source_link") != file_link:
+                print(f"断点文件来源不一致，重新下载: {file_name}")
+                self._discard_part(part_path, meta_path)
+                meta = {}
+
+            current_url = url
+            resume_attempts = 0
+            max_resume_attempts = d.download_config.max_resume_attempts
+            while True:
+                offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+                expected = meta.get("expected_length")
+                if offset and expected and offset >= expected:
+                    if offset == expected:
+                        break
+                    self._discard_part(part_path, meta_path)
+                    meta, offset = {}, 0
+                if offset:
+                    print(f"断点续传: {file_name} 从 {offset} 字节继续")
+
+                response = _request_download(current_url, offset)
+                if response.status_code in (403, 404, 410):
+                    response.close()
+                    print(f"直链已失效(HTTP {response.status_code}): {file_name}")
+                    if file_link:
+                        d.invalidate_resolved_url(file_link, ajax_file_id)
+                    return False
+                if response.status_code == 416 and offset:
+                    response.close()
+                    print(f"续传范围无效，重新下载: {file_name}")
+                    self._discard_part(part_path, meta_path)
+                    meta = {}
+                    continue
+                response.raise_for_status()
+
+                ctype = (response.headers.get("Content-Type") or "").lower()
+                if "text/html" in ctype:
+                    challenge_body = response.text
+                    if d._is_html_challenge_response(response, challenge_body):
+                        token = d._solve_acw_sc_v2(challenge_body)
+                        response.close()
+                        if token:
+                            host = urlparse(current_url).hostname
+                            if host:
+                                d.http.cookies.set("acw_sc__v2", token, domain=host, path="/")
+                            print(f"检测到挑战页，已计算acw_sc__v2并重试下载: {file_name}")
+                            response = _request_download(current_url, offset)
+                            response.raise_for_status()
+                        else:
+                            print(f"检测到挑战页，但未能计算acw_sc__v2: {file_name}")
+                            return False
+
+                final_ctype = (response.headers.get("Content-Type") or "").lower()
+                if "text/html" in final_ctype:
+                    response.close()
+                    print(f"下载响应仍为HTML，已阻止保存假文件: {file_name}")
+                    if file_link:
+                        d.invalidate_resolved_url(file_link, ajax_file_id)
+                    return False
+
+                content_length = int(response.headers.get('content-length', 0) or 0)
+                # 服务器仍返回了压缩编码：Content-Length 是压缩后的长度，按大小未知处理，也不能按偏移续传
+                encoded = (response.headers.get("Content-Encoding") or "identity").strip().lower() != "identity"
+                if encoded:
+                    content_length = 0
+                    if response.status_code == 206:
+                        response.close()
+                        print(f"续传响应为压缩编码，无法按偏移拼接，重新下载: {file_name}")
+                        self._discard_part(part_path, meta_path)
+                        meta = {}
+                        continue
+                if offset and response.status_code == 206:
+                    range_start, range_total = self._parse_content_range(response.headers.get("Content-Range"))
+                    if range_start != offset:
+                        response.close()
+                        print(f"服务器返回的续传起点不匹配，重新下载: {file_name}")
+                        self._discard_part(part_path, meta_path)
+                        meta = {}
+                        continue
+                    total_size = range_total or (offset + content_length if content_length else 0)
+                else:
+                    if offset:
+                        print(f"服务器未支持Range，重新下载: {file_name}")
+                        offset = 0
+                    total_size = content_length
+
+                if expected and total_size and expected != total_size:
+                    response.close()
+                    print(f"远端文件大小已变化({expected} -> {total_size})，重新下载: {file_name}")
+                    self._discard_part(part_path, meta_path)
+                    meta = {}
+                    continue
+
+                meta = {
+                    "expected_length": total_size or None,
+                    "source_link": file_link or meta.get("source_link"),
+                    "file_name": file_name,
+                    "updated_at": int(time.time()),
+                }
+                self._save_part_meta(meta_path, meta)
+
+                downloaded_size = offset
+                try:
+                    with response:
+                        with open(part_path, 'ab' if offset else 'wb') as file:
+                            for chunk in self._iter_body(response):
+                                if d.cancel_event.is_set():
+                                    raise LanzouError(ErrorCode.CANCELLED, "下载已取消")
+                                file.write(chunk)
+                                downloaded_size += len(chunk)
+                                d.bandwidth.throttle(file_path, len(chunk), d.cancel_event)
+                                if total_size > 0:
+                                    progress = int((downloaded_size / total_size) * 100)
+                                    d.report_progress(
+                                        file_name, downloaded_size, file_path, "下载中...", progress, total_size
+                                    )
+                    if not total_size or downloaded_size == total_size:
+                        break
+                    shortfall = "不足" if downloaded_size < total_size else "不符"
+                    stream_error = f"字节数{shortfall} {downloaded_size}/{total_size}"
+                except LanzouError:
+                    raise
+                except (requests.RequestException, http.client.HTTPException, OSError) as e:
+                    stream_error = str(e)
+                finally:
+                    d.metrics.inc("download_bytes", downloaded_size - offset)
+
+                if encoded or (total_size and downloaded_size > total_size):
+                    # 编码后的字节流或超长的文件无法按偏移续传，下次从头下载
+                    self._discard_part(part_path, meta_path)
+                    meta = {}
+                resume_attempts += 1
+                d.metrics.inc("retries", kind="resume")
+                if resume_attempts > max_resume_attempts:
+                    print(f"续传次数已用尽，保留断点文件: {file_name}（{stream_error}）")
+                    return False
+                print(f"下载中断，准备第 {resume_attempts} 次续传: {file_name}（{stream_error}）")
+                if file_link:
+                    fresh_url = self.get_real_download_url(file_link, ajax_file_id=ajax_file_id)
+                    if fresh_url:
+                        current_url = fresh_url
+
+            final_size = os.path.getsize(part_path)
+            os.replace(part_path, file_path)
+            self._discard_part(part_path, meta_path)
 
-            downloaded_size = 0
-            with response:
-                with open(file_path, 'wb') as file:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            file.write(chunk)
-                            downloaded_size += len(chunk)
-                            if total_size > 0 and d.progress_callback:
-                                progress = int((downloaded_size / total_size) * 100)
-                                d.progress_callback(file_name, downloaded_size, file_path, "下载中...", progress)
-
-            if d.progress_callback:
-                d.progress_callback(file_name, downloaded_size, file_path, "下载完成", 100)
+            d.report_progress(file_name, final_size, file_path, "下载完成", 100, done=True)
             print(f"文件下载完成: {file_name}")
             return True
 
         except Exception as e:
+            if is_cancelled(e):
+                raise
+            # 保留 .part 与元数据，下次重试时续传
             print(f"使用requests下载文件 {file_name} 时出错: {e}")
+            return False
+
+    def probe_range_support(self, url, timeout=8):
+        """用 Range: bytes=0-0 探测分段支持，返回 (是否支持, 文件总长度)。"""
+        return self.d._probe_range_support_impl(url, timeout)
+
+    def _split_segments(self, total_size, count):
+        count = max(1, min(int(count), total_size))
+        step = total_size // count
+        segments = []
+        for i in range(count):
+            start = i * step
+            end = total_size - 1 if i == count - 1 else (start + step - 1)
+            segments.append({"start": start, "end": end, "done": 0})
+        return segments
+
+    def download_segmented(self, url, file_path, file_name, file_link=None, ajax_file_id=None):
+        """大文件多连接分段下载：预分配 .part 后各分段按偏移写入，不支持 Range 时回退单流。"""
+        d = self.d
+        cfg = d.download_config
+        part_path, meta_path = self._part_paths(file_path)
+        try:
             if os.path.exists(file_path):
+                d.report_progress(file_name, os.path.getsize(file_path), file_path, "跳过(已存在)", 100, done=True)
+                return True
+
+            meta = self._load_part_meta(meta_path) if os.path.exists(part_path) else {}
+            if os.path.exists(part_path) and meta.get("mode") != "segmented":
+                # 已有单流断点，沿用单流续传
+                return self.download_with_requests(url, file_path, file_name, file_link, ajax_file_id)
+
+            supported, total_size = self.probe_range_support(url)
+            if meta and (not supported or total_size != meta.get("expected_length")
+                         or (file_link and meta.get("source_link") not in (None, file_link))):
+                print(f"分段断点已失效，改为重新下载: {file_name}")
+                self._discard_part(part_path, meta_path)
+                meta = {}
+            if not supported or not total_size:
+                print(f"服务器不支持Range，回退单连接下载: {file_name}")
+                return self.download_with_requests(url, file_path, file_name, file_link, ajax_file_id)
+            if not meta and total_size < cfg.segment_threshold_bytes:
+                return self.download_with_requests(url, file_path, file_name, file_link, ajax_file_id)
+
+            os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+            if meta:
+                segments = meta["segments"]
+                print(f"分段断点续传: {file_name}")
+            else:
+                segments = self._split_segments(total_size, cfg.segment_count)
+                with open(part_path, "wb") as f:
+                    f.truncate(total_size)
+                meta = {
+                    "mode": "segmented",
+                    "expected_length": total_size,
+                    "source_link": file_link,
+                    "file_name": file_name,
+                    "segments": segments,
+                }
+            meta["updated_at"] = int(time.time())
+            self._save_part_meta(meta_path, meta)
+            print(f"开始分段下载: {file_name}，{len(segments)} 段，共 {total_size} 字节")
+
+            url_lock = threading.Lock()  # 只保护 url_state 的读写
+            refresh_lock = threading.Lock()  # 串行化重新提链（网络请求期间其它分段照常下载）
+            progress_lock = threading.Lock()
+            url_state = {"url": url, "gen": 0}
+            progress_state = {"downloaded": sum(s["done"] for s in segments)}
+            checkpoint = {"downloaded": progress_state["downloaded"], "at": time.monotonic()}
+            checkpoint_lock = threading.Lock()
+            headers = self._download_headers()
+
+            def _refresh_url(seen_gen):
+                """分段内直链失效时重新提链；多个分段同时失效只提链一次（后到者看到代数已变即返回）。"""
+                if not file_link:
+                    return
+                with refresh_lock:
+                    with url_lock:
+                        if url_state["gen"] != seen_gen:
+                            return
+                    fresh = self.get_real_download_url(file_link, ajax_file_id=ajax_file_id)
+                    with url_lock:
+                        if fresh:
+                            url_state["url"] = fresh
+                        url_state["gen"] += 1
+
+            def _checkpoint(downloaded):
+                """定期把各分段已写入的字节数存入断点元数据，进程中途退出后仍可按分段续传。"""
+                if (downloaded - checkpoint["downloaded"] < cfg.segment_checkpoint_bytes
+                        and time.monotonic() - checkpoint["at"] < cfg.segment_checkpoint_s):
+                    return
+                # 另一个分段正在写时跳过，下一块再判断
+                if not checkpoint_lock.acquire(blocking=False):
+                    return
                 try:
-                    os.remove(file_path)
-                except Exception:
-                    pass
+                    checkpoint["downloaded"], checkpoint["at"] = downloaded, time.monotonic()
+                    meta["updated_at"] = int(time.time())
+                    self._save_part_meta(meta_path, meta)
+                finally:
+                    checkpoint_lock.release()
+
+            def _fetch_segment(seg):
+                seg_len = seg["end"] - seg["start"] + 1
+                failures = 0
+                url_failures, failed_gen = 0, None  # 当前直链上的连续失败次数
+                while seg["done"] < seg_len:
+                    if d.cancel_event.is_set():
+                        raise LanzouError(ErrorCode.CANCELLED, "下载已取消")
+                    with url_lock:
+                        seg_url, seen_gen = url_state["url"], url_state["gen"]
+                    h = dict(headers)
+                    h["Range"] = f"bytes={seg['start'] + seg['done']}-{seg['end']}"
+                    seg_before = seg["done"]
+                    link_dead = False
+                    try:
+                        with d.metrics.span("segment", http=True), \
+                                d.http.get(seg_url, headers=h, stream=True, timeout=30, allow_redirects=True) as r:
+                            ctype = (r.headers.get("Content-Type") or "").lower()
+                            if r.status_code in (403, 404, 410) or "text/html" in ctype:
+                                link_dead = True
+                                raise IOError(f"直链已失效 status={r.status_code} type={ctype}")
+                            r.raise_for_status()
+                            if r.status_code != 206:
+                                raise IOError(f"分段响应异常 status={r.status_code} type={ctype}")
+                            # 不经 Python 缓冲直接写入：检查点记录的字节数必须已经落到文件里
+                            with open(part_path, "r+b", buffering=0) as fh:
+                                for chunk in self._iter_body(r):
+                                    if d.cancel_event.is_set():
+                                        raise LanzouError(ErrorCode.CANCELLED, "下载已取消")
+                                    chunk = chunk[:seg_len - seg["done"]]
+                                    pos = seg["start"] + seg["done"]
+                                    if hasattr(os, "pwrite"):
+                                        os.pwrite(fh.fileno(), chunk, pos)
+                                    else:
+                                        fh.seek(pos)
+                                        fh.write(chunk)
+                                    seg["done"] += len(chunk)
+                                    d.bandwidth.throttle(file_path, len(chunk), d.cancel_event)
+                                    with progress_lock:
+                                        progress_state["downloaded"] += len(chunk)
+                                        downloaded = progress_state["downloaded"]
+                                    d.report_progress(
+                                        file_name, downloaded, file_path, "分段下载中...",
+                                        int(downloaded * 100 / total_size), total_size,
+                                    )
+                                    _checkpoint(downloaded)
+                                    if seg["done"] >= seg_len:
+                                        break
+                        if seg["done"] < seg_len:
+                            raise IOError(f"分段数据不完整 {seg['done']}/{seg_len}")
+                    except LanzouError:
+                        raise
+                    except Exception as e:
+                        failures += 1
+                        if failures > cfg.segment_retries:
+                            raise
+                        d.metrics.inc("retries", kind="segment")
+                        if failed_gen != seen_gen:
+                            url_failures, failed_gen = 0, seen_gen
+                        url_failures += 1
+                        # 偶发超时 / 断线直接按原直链续传；直链失效或同一直链屡次失败才重新提链
+                        if link_dead or url_failures >= max(1, cfg.segment_refresh_after):
+                            print(f"分段 {seg['start']}-{seg['end']} 中断，重新提链后重试({failures}/{cfg.segment_retries}): {e}")
+                            _refresh_url(seen_gen)
+                        else:
+                            print(f"分段 {seg['start']}-{seg['end']} 中断，按原直链重试({failures}/{cfg.segment_retries}): {e}")
+                    finally:
+                        d.metrics.inc("download_bytes", seg["done"] - seg_before)
+
+            errors = []
+            with ThreadPoolExecutor(max_workers=len(segments)) as pool:
+                futures = [pool.submit(_fetch_segment, s) for s in segments if s["done"] < s["end"] - s["start"] + 1]
+                for fut in futures:
+                    try:
+                        fut.result()
+                    except Exception as e:
+                        errors.append(e)
+            meta["updated_at"] = int(time.time())
+            self._save_part_meta(meta_path, meta)
+
+            if errors:
+                cancelled = next((e for e in errors if is_cancelled(e)), None)
+                if cancelled is not None:
+                    raise cancelled
+                print(f"分段下载未完成，保留断点文件: {file_name}（{errors[0]}）")
+                return False
+            if sum(s["done"] for s in segments) != total_size or os.path.getsize(part_path) != total_size:
+                print(f"分段下载字节数不匹配，保留断点文件: {file_name}")
+                return False
+
+            os.replace(part_path, file_path)
+            self._discard_part(part_path, meta_path)
+            d.report_progress(file_name, total_size, file_path, "下载完成", 100, done=True)
+            print(f"文件分段下载完成: {file_name}")
+            return True
+
+        except Exception as e:
+            if is_cancelled(e):
+                raise
+            print(f"分段下载文件 {file_name} 时出错: {e}")
             return False
 
+    def _transfer(self, url, file_path, file_name, file_info):
+        """按列表大小选择单流或分段下载。"""
+        cfg = self.d.download_config
+        listed = self.d.parse_size_bytes(file_info.get("size"))
+        use_segmented = (
+            cfg.segment_count > 1
+            and listed is not None
+            and listed >= cfg.segment_threshold_bytes
+        )
+        download = self.download_segmented if use_segmented else self.download_with_requests
+        try:
+            with self.d.metrics.span("transfer", mode="segmented" if use_segmented else "single") as span:
+                ok = download(
+                    url,
+                    file_path,
+                    file_name,
+                    file_link=file_info.get("link"),
+                    ajax_file_id=file_info.get("ajax_file_id"),
+                )
+                span.set(outcome="ok" if ok else "failed")
+        finally:
+            self.d.bandwidth.forget(file_path)
+        return ok
+
     def download_single_file_optimized(self, file_info, download_dir="downloads", prefetched_real_url=None):
+        """返回是否下载成功；因取消而未开始或中途停止时抛出 LanzouError(ErrorCode.CANCELLED)。"""
+        try:
+            ok = self._download_single_file_optimized(file_info, download_dir, prefetched_real_url)
+        except LanzouError as e:
+            if e.code == ErrorCode.CANCELLED:
+                self.d.metrics.inc("files", outcome="cancelled")
+            raise
+        self.d.metrics.inc("files", outcome="ok" if ok else "failed")
+        return ok
+
+    def _download_single_file_optimized(self, file_info, download_dir, prefetched_real_url):
         d = self.d
         try:
+            if d.cancel_event.is_set():
+                print(f"下载已取消，跳过: {file_info['name']}")
+                raise LanzouError(ErrorCode.CANCELLED, "下载已取消")
             print(f"开始优化下载流程: {file_info['name']}")
             file_path, clean_filename, _target_dir = self._resolve_target_path(file_info, download_dir)
 
-            real_url = prefetched_real_url
-            last_validation_result = None
-
-            if real_url and not d._should_skip_validation(real_url):
-                last_validation_result = self.is_download_url_valid(real_url)
-                if not last_validation_result:
-                    print(f"预取直链校验未通过，先尝试直接下载: {file_info['name']}")
-            elif real_url:
-                print("已启用自适应策略：跳过直链预校验")
+            # 已完整存在的文件无需提链；旧版遗留的截断文件转为断点续传
+            self._adopt_truncated_file(file_path, file_info)
+            if os.path.exists(file_path):
+                d.report_progress(clean_filename, os.path.getsize(file_path), file_path, "跳过(已存在)", 100, done=True)
+                return True
 
+            real_url = prefetched_real_url
             if not real_url:
-                real_url = self.get_real_download_url(
-                    file_info['link'],
-                    ajax_file_id=file_info.get("ajax_file_id")
-                )
+                real_url = self.resolve_real_url(file_info, download_dir)
                 if not real_url:
                     print(f"未能获取到 {file_info['name']} 的真实下载链接，跳过该文件")
                     return False
-                if not d._should_skip_validation(real_url):
-                    last_validation_result = self.is_download_url_valid(real_url)
-                    if not last_validation_result:
-                        print(f"真实链接校验未通过，先尝试直接下载: {file_info['name']}")
-                else:
-                    print("已启用自适应策略：跳过直链预校验")
 
-            success = self.download_with_requests(real_url, file_path, clean_filename)
+            # 状态码与 Content-Type 由下载请求的首个响应检查（写入前即放弃），默认不再单独预校验
+            last_validation_result = self._prevalidate(real_url)
+            if last_validation_result is False:
+                print(f"直链预校验未通过，先尝试直接下载: {file_info['name']}")
+
+            success = self._transfer(real_url, file_path, clean_filename, file_info)
             if success:
                 if last_validation_result is False:
                     d._record_validation_false_negative(real_url)
                 return True
 
+            if d.cancel_event.is_set():
+                return False
             print(f"首次直链下载失败，重新提链后重试: {file_info['name']}")
-            fresh_url = self.get_real_download_url(
-                file_info['link'],
-                ajax_file_id=file_info.get("ajax_file_id")
-            )
+            d.metrics.inc("retries", kind="re_resolve")
+            fresh_url = self.resolve_real_url(file_info, download_dir, use_cache=False)
             if not fresh_url:
                 print(f"重新提链失败，跳过该文件: {file_info['name']}")
                 return False
 
-            if not d._should_skip_validation(fresh_url):
-                fresh_valid = self.is_download_url_valid(fresh_url)
-                if not fresh_valid:
-                    print(f"重提直链校验未通过，继续尝试直接下载: {file_info['name']}")
+            if self._prevalidate(fresh_url) is False:
+                print(f"重提直链校验未通过，继续尝试直接下载: {file_info['name']}")
 
-            retry_success = self.download_with_requests(fresh_url, file_path, clean_filename)
+            retry_success = self._transfer(fresh_url, file_path, clean_filename, file_info)
             if not retry_success:
                 print(f"requests下载失败，跳过该文件: {file_info['name']}")
             return retry_success
 
         except Exception as e:
+            if is_cancelled(e):
+                raise
             print(f"优化下载文件 {file_info['name']} 时出错: {e}")
             return False
 
@@ -187,14 +686,17 @@ class LanzouDownloadCore:
             expected_file, clean_filename, target_dir = self._resolve_target_path(file_info, download_dir)
             os.makedirs(target_dir, exist_ok=True)
             if os.path.exists(expected_file):
-                if d.progress_callback:
-                    d.progress_callback(clean_filename, os.path.getsize(expected_file), expected_file, "跳过(已存在)", 100)
+                d.report_progress(clean_filename, os.path.getsize(expected_file), expected_file, "跳过(已存在)", 100, done=True)
                 return True
 
+            driver = d.ensure_driver()
+            if driver is None:
+                print(f"浏览器不可用，跳过该文件: {file_info['name']}")
+                return False
             abs_download_path = os.path.abspath(target_dir)
-            d.driver.set.download_path(abs_download_path)
+            driver.set.download_path(abs_download_path)
 
-            d.driver.latest_tab.get(file_info['link'])
+            driver.latest_tab.get(file_info['link'])
             time.sleep(8)
 
             download_found = False
@@ -210,7 +712,7 @@ class LanzouDownloadCore:
                 if download_found:
                     break
                 try:
-                    elements = d.driver.latest_tab.eles(selector, timeout=5)
+                    elements = driver.latest_tab.eles(selector, timeout=5)
                     if elements:
                         for element in elements:
                             if download_found:
@@ -221,22 +723,20 @@ class LanzouDownloadCore:
                                     width = rect.size['width']
                                     height = rect.size['height']
                                     if width > 0 and height > 0:
-                                        if d.progress_callback:
-                                            d.progress_callback(clean_filename, 0, expected_file, "开始下载...", 0)
+                                        d.report_progress(clean_filename, 0, expected_file, "开始下载...", 0)
                                         element.click(by_js=True)
                                         download_found = True
                                         success = self.monitor_download_progress(expected_file, clean_filename)
-                                        if success and d.progress_callback:
-                                            d.progress_callback(clean_filename, os.path.getsize(expected_file), expected_file, "下载完成", 100)
+                                        if success:
+                                            d.report_progress(clean_filename, os.path.getsize(expected_file), expected_file, "下载完成", 100, done=True)
                                         break
                                 except Exception:
-                                    if d.progress_callback:
-                                        d.progress_callback(clean_filename, 0, expected_file, "开始下载...", 0)
+                                    d.report_progress(clean_filename, 0, expected_file, "开始下载...", 0)
                                     element.click(by_js=True)
                                     download_found = True
                                     success = self.monitor_download_progress(expected_file, clean_filename)
-                                    if success and d.progress_callback:
-                                        d.progress_callback(clean_filename, os.path.getsize(expected_file), expected_file, "下载完成", 100)
+                                    if success:
+                                        d.report_progress(clean_filename, os.path.getsize(expected_file), expected_file, "下载完成", 100, done=True)
                                     break
                             except Exception:
                                 continue
@@ -246,7 +746,7 @@ class LanzouDownloadCore:
                     continue
 
             if not download_found:
-                all_links = d.driver.latest_tab.eles('tag:a')
+                all_links = driver.latest_tab.eles('tag:a')
                 for link in all_links:
                     if download_found:
                         break
@@ -254,11 +754,11 @@ class LanzouDownloadCore:
                         href = link.attr('href')
                         if href and ('developer-oss.lanrar.com' in href and 'toolsdown' in href):
                             try:
-                                d.driver.latest_tab.download(href)
+                                driver.latest_tab.download(href)
                                 download_found = True
                                 success = self.monitor_download_progress(expected_file, clean_filename)
-                                if success and d.progress_callback:
-                                    d.progress_callback(clean_filename, os.path.getsize(expected_file), expected_file, "下载完成", 100)
+                                if success:
+                                    d.report_progress(clean_filename, os.path.getsize(expected_file), expected_file, "下载完成", 100, done=True)
                                 break
                             except Exception as e:
                                 print(f"直接下载失败: {e}")
@@ -288,19 +788,16 @@ class LanzouDownloadCore:
             if os.path.exists(expected_file):
                 current_size = os.path.getsize(expected_file)
                 if current_size > initial_size:
-                    if d.progress_callback:
-                        progress = min(95, int((current_size - initial_size) * 100 / (initial_size + current_size + 1)))
-                        d.progress_callback(filename, current_size, expected_file, "下载中...", progress)
+                    progress = min(95, int((current_size - initial_size) * 100 / (initial_size + current_size + 1)))
+                    d.report_progress(filename, current_size, expected_file, "下载中...", progress)
                     initial_size = current_size
                 elif current_size > 0:
-                    if d.progress_callback:
-                        d.progress_callback(filename, current_size, expected_file, "下载完成", 100)
+                    d.report_progress(filename, current_size, expected_file, "下载完成", 100, done=True)
                     return True
             time.sleep(1)
 
         if os.path.exists(expected_file) and os.path.getsize(expected_file) > 0:
-            if d.progress_callback:
-                d.progress_callback(filename, os.path.getsize(expected_file), expected_file, "下载完成", 100)
+            d.report_progress(filename, os.path.getsize(expected_file), expected_file, "下载完成", 100, done=True)
             return True
 
         return False
@@ -10,6 +10,7 @@ class ErrorCode(str, Enum):
     CHALLENGE = "challenge"
     NETWORK = "network"
     PARSE = "parse"
+    CANCELLED = "cancelled"
     UNKNOWN = "unknown"
 
 
@@ -17,3 +18,8 @@ class LanzouError(Exception):
     def __init__(self, code: ErrorCode, message: str):
         super().__init__(message)
         self.code = code
+
+
+def is_cancelled(error):
+    """error 是否为取消导致的 LanzouError（下载链路据此把取消与真正的失败区分开）。"""
+    return isinstance(error, LanzouError) and error.code == ErrorCode.CANCELLED
@@ -0,0 +1,265 @@
+import bisect
+import re
+
+
+def normalize_folder_key(folder_key):
+    k = str(folder_key or "").replace("\\", "/")
+    k = re.sub(r"/{2,}", "/", k).strip("/")
+    if not k:
+        return ""
+    return k + "/"
+
+
+def folder_parent(folder_key):
+    key = normalize_folder_key(folder_key)
+    if not key:
+        return ""
+    parts = [p for p in key.strip("/").split("/") if p]
+    if len(parts) <= 1:
+        return ""
+    return "/".join(parts[:-1]) + "/"
+
+
+class VirtualFileView:
+    """文件列表的虚拟化渲染：按目录维护有序模型，Treeview 只承载可见窗口内的行。"""
+
+    def __init__(self, root, tree, scrollbar, frame_ms=16):
+        self.root = root
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.frame_ms = frame_ms
+        self.visible_rows = max(1, int(tree.cget("height") or 20))
+        self._row_iids = []  # 复用的 Treeview 行，按窗口内位置排列
+        self._row_keys = []  # 每个窗口行对应的模型行
+        self._repaint_pending = False
+        self.reset()
+
+        scrollbar.configure(command=self._on_scrollbar)
+        tree.bind("<Configure>", self._on_configure, add="+")
+        tree.bind("<<TreeviewSelect>>", self._on_select, add="+")
+        tree.bind("<ButtonPress-1>", self._on_press, add="+")
+        tree.bind("<MouseWheel>", self._on_wheel)
+        tree.bind("<Button-4>", self._on_wheel)
+        tree.bind("<Button-5>", self._on_wheel)
+        tree.bind("<Up>", lambda e: self._on_step(-1))
+        tree.bind("<Down>", lambda e: self._on_step(1))
+        tree.bind("<Prior>", lambda e: self.scroll_by(-self.visible_rows))
+        tree.bind("<Next>", lambda e: self.scroll_by(self.visible_rows))
+        tree.bind("<Home>", lambda e: self.scroll_to(0))
+        tree.bind("<End>", lambda e: self.scroll_to(self.row_count()))
+
+    # ---- 模型 ----
+    def reset(self, message=None):
+        """清空模型；message 非空时整个列表只显示这一行提示。"""
+        self.current_folder = ""
+        self.files = {}  # index -> file_info
+        self.folder_files = {}  # folder_key -> 按 index 升序的 index 列表
+        self.folder_children = {}  # folder_key -> 按名称排序的 [(name.lower(), name)]
+        self._child_sets = {}
+        self.selected = set()
+        self.message = message
+        self.top = 0
+        self.schedule_repaint()
+
+    def _add_child(self, parent, name):
+        names = self._child_sets.setdefault(parent, set())
+        if name in names:
+            return
+        names.add(name)
+        bisect.insort(self.folder_children.setdefault(parent, []), (name.lower(), name))
+
+    def _register_folder_chain(self, folder_key):
+        parent = ""
+        for part in [p for p in folder_key.strip("/").split("/") if p]:
+            self._add_child(parent, part)
+            parent = f"{parent}{part}/"
+
+    def add_files(self, batch):
+        """并入一批文件（按序号有序插入），重绘合并到下一帧。"""
+        for file_info in batch:
+            raw_index = file_info.get("index", "")
+            index = int(raw_index) if str(raw_index).isdigit() else -(len(self.files) + 1)
+            relative_path = str(file_info.get("relative_path") or "").replace("\\", "/").strip("/")
+            if relative_path and "/" in relative_path:
+                folder_key = "/".join(p for p in relative_path.split("/")[:-1] if p) + "/"
+            else:
+                folder_key = normalize_folder_key(file_info.get("folder_path"))
+            self._register_folder_chain(folder_key)
+            if index not in self.files:
+                bisect.insort(self.folder_files.setdefault(folder_key, []), index)
+            self.files[index] = file_info
+        if batch:
+            self.message = None
+            self.schedule_repaint()
+
+    def set_message(self, message):
+        """显示（或清除，传 None）整表提示行，保留已加载的数据与选择。"""
+        self.message = message
+        self.schedule_repaint()
+
+    def show_folder(self, folder_key):
+        """切换到目录（回到顶部并清空选择），立即重绘。"""
+        self.current_folder = normalize_folder_key(folder_key)
+        self.top = 0
+        self.selected.clear()
+        self.repaint()
+
+    # ---- 行定位 ----
+    def row_count(self):
+        if self.message is not None:
+            return 1
+        n = (1 if self.current_folder else 0)
+        n += len(self.folder_children.get(self.current_folder, ()))
+        n += len(self.folder_files.get(self.current_folder, ()))
+        return n or 1
+
+    def _row_at(self, pos):
+        """返回 (行键, 显示值)；行键可哈希，用于跨重绘保持选择。"""
+        if self.message is not None:
+            return ("message",), ("", self.message, "", "")
+        if self.current_folder:
+            if pos == 0:
+                return ("up",), ("", "[返回上级]", "", "")
+            pos -= 1
+        children = self.folder_children.get(self.current_folder, [])
+        if pos < len(children):
+            name = children[pos][1]
+            return ("folder", f"{self.current_folder}{name}/", name), ("", f"[文件夹] {name}", "", "")
+        pos -= len(children)
+        indices = self.folder_files.get(self.current_folder, [])
+        if pos < len(indices):
+            file_info = self.files[indices[pos]]
+            return ("file", indices[pos]), (
+                file_info.get("index", ""),
+                file_info.get("name", ""),
+                file_info.get("size", ""),
+                file_info.get("time", ""),
+            )
+        return ("empty",), ("", "当前目录暂无文件", "", "")
+
+    def meta_at(self, y):
+        """Treeview 坐标处的行信息：{"type": up/folder/file/empty/message, ...}。"""
+        iid = self.tree.identify_row(y)
+        if not iid or iid not in self._row_iids:
+            return {}
+        key = self._row_keys[self._row_iids.index(iid)]
+        if key[0] == "folder":
+            return {"type": "folder", "folder_key": key[1], "name": key[2]}
+        if key[0] == "file":
+            return {"type": "file", "file": self.files.get(key[1])}
+        return {"type": key[0]}
+
+    def has_selection(self):
+        return bool(self.selected)
+
+    def selected_files(self):
+        """当前目录中选中的文件（按列表顺序）。"""
+        picked = {key[1] for key in self.selected if key[0] == "file"}
+        return [
+            self.files[i]
+            for i in self.folder_files.get(self.current_folder, [])
+            if i in picked
+        ]
+
+    # ---- 绘制 ----
+    def schedule_repaint(self):
+        """合并短时间内的多次变更，每帧最多重绘一次。"""
+        if self._repaint_pending:
+            return
+        self._repaint_pending = True
+        self.root.after(self.frame_ms, self.repaint)
+
+    def repaint(self):
+        """只刷新可见窗口：复用已有行，仅改写其显示值。"""
+        self._repaint_pending = False
+        total = self.row_count()
+        n = min(self.visible_rows, total)
+        self.top = max(0, min(self.top, total - n))
+        while len(self._row_iids) < n:
+            self._row_iids.append(self.tree.insert("", "end", values=("", "", "", "")))
+        while len(self._row_iids) > n:
+            self.tree.delete(self._row_iids.pop())
+        keys = []
+        for offset, iid in enumerate(self._row_iids):
+            key, values = self._row_at(self.top + offset)
+            keys.append(key)
+            self.tree.item(iid, values=values)
+        self._row_keys = keys
+        self._apply_selection()
+        self.scrollbar.set(self.top / total, (self.top + n) / total)
+
+    def _apply_selection(self):
+        wanted = [iid for iid, key in zip(self._row_iids, self._row_keys) if key in self.selected]
+        if set(wanted) != set(self.tree.selection()):
+            self.tree.selection_set(wanted)
+
+    def scroll_to(self, top):
+        self.top = max(0, int(top))
+        self.schedule_repaint()
+        return "break"
+
+    def scroll_by(self, rows):
+        return self.scroll_to(self.top + rows)
+
+    # ---- 事件 ----
+    def _on_configure(self, event):
+        try:
+            row_height = int(self.tree.tk.call("ttk::style", "lookup", "Treeview", "-rowheight") or 20)
+        except Exception:
+            row_height = 20
+        # 扣除表头一行，避免最后一行被遮住后 Treeview 自行滚动
+        rows = max(1, event.height // max(1, row_height) - 1)
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self.schedule_repaint()
+
+    def _on_scrollbar(self, *args):
+        if not args:
+            return
+        if args[0] == "moveto":
+            self.scroll_to(float(args[1]) * self.row_count())
+        elif args[0] == "scroll":
+            step = int(args[1])
+            if len(args) > 2 and args[2] == "pages":
+                step *= self.visible_rows
+            self.scroll_by(step)
+
+    def _on_wheel(self, event):
+        if getattr(event, "num", None) == 4:
+            return self.scroll_by(-3)
+        if getattr(event, "num", None) == 5:
+            return self.scroll_by(3)
+        return self.scroll_by(-3 if event.delta > 0 else 3)
+
+    def _on_press(self, event):
+        # 不带 Ctrl/Shift 的单击会替换选择，窗口外已选中的行也一并清除
+        if not (event.state & 0x0005):
+            self.selected.clear()
+
+    def _on_select(self, _event=None):
+        current = set(self.tree.selection())
+        for iid, key in zip(self._row_iids, self._row_keys):
+            if key[0] not in ("file", "folder"):
+                continue
+            if iid in current:
+                self.selected.add(key)
+            else:
+                self.selected.discard(key)
+
+    def _on_step(self, delta):
+        """方向键到达窗口边缘时滚动一行，并把选择移到新露出的行。"""
+        if not self._row_iids:
+            return None
+        edge = 0 if delta < 0 else len(self._row_iids) - 1
+        if self.tree.focus() != self._row_iids[edge]:
+            return None
+        old_top = self.top
+        self.top += delta
+        self.repaint()
+        if self.top == old_top:
+            return "break"
+        key = self._row_keys[edge]
+        self.selected = {key} if key[0] in ("file", "folder") else set()
+        self._apply_selection()
+        self.tree.focus(self._row_iids[edge])
+        return "break"
@@ -17,8 +17,10 @@ import requests
 
 try:
     from source_code_common.lanzou_core import OptimizedLanzouDownloader
+    from source_code_common.lanzou_file_view import VirtualFileView, folder_parent
 except Exception:
     from lanzou_core import OptimizedLanzouDownloader
+    from lanzou_file_view import VirtualFileView, folder_parent
 
 
 RELEASES_PAGE_URL = "https://gitee.com/greovity/lanzou_manga_downloader/releases"
@@ -266,6 +268,30 @@ class _UpdateChecker:
             "exe_url": None,
         }
 
+# 下载顺序下拉框：(调度策略, 显示文本)
+SCHEDULE_POLICY_LABELS = (
+    ("selection", "按选择顺序"),
+    ("shortest_first", "小文件优先"),
+    ("folder", "按目录"),
+    ("fair", "大小文件交替"),
+)
+
+
+def _format_rate(bytes_per_s):
+    value = float(bytes_per_s)
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024 or unit == "GB":
+            return f"{value:.1f} {unit}/s" if unit != "B" else f"{int(value)} B/s"
+        value /= 1024
+
+
+def _format_eta(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
 # 以下是GUI部分的代码（优化布局并添加用户提示）
 class LanzouDownloaderGUI:
     def __init__(self, root):
@@ -285,12 +311,11 @@ class LanzouDownloaderGUI:
         # 当前选中的文件列表
         self.selected_files = []
         self.is_loading = False
+        self.is_downloading = False
+        self._total_progress_text = "0/0 (0%)"
         self.stop_event = threading.Event()
-        # 文件管理器视图状态
+        # 文件管理器视图状态（目录模型与可见行由 self.file_view 维护）
         self.current_folder = ""
-        self.folder_children = {}
-        self.files_in_folder = {}
-        self.tree_item_meta = {}
         
         # 创建界面
         self.setup_gui()
@@ -386,6 +411,35 @@ class LanzouDownloaderGUI:
         # 开始下载按钮
         self.download_btn = ttk.Button(control_frame, text="开始下载", command=self.start_download)
         self.download_btn.grid(row=2, column=5)
+
+        # 停止下载按钮
+        self.stop_download_btn = ttk.Button(control_frame, text="停止下载", command=self.stop_download)
+        self.stop_download_btn.grid(row=2, column=6, padx=(10, 0))
+
+        # 下载顺序（进行中的下载对剩余文件立即生效）与插队
+        order_frame = ttk.Frame(control_frame)
+        order_frame.grid(row=3, column=0, columnspan=7, sticky=tk.W, pady=(8, 0))
+        ttk.Label(order_frame, text="下载顺序:").grid(row=0, column=0, sticky=tk.W)
+        policy = self.downloader.download_config.schedule_policy
+        self.schedule_policy_var = tk.StringVar(value=dict(SCHEDULE_POLICY_LABELS).get(policy, SCHEDULE_POLICY_LABELS[0][1]))
+        self.schedule_policy_box = ttk.Combobox(
+            order_frame,
+            textvariable=self.schedule_policy_var,
+            values=[label for _, label in SCHEDULE_POLICY_LABELS],
+            state="readonly",
+            width=12,
+        )
+        self.schedule_policy_box.grid(row=0, column=1, padx=(5, 10))
+        self.schedule_policy_box.bind("<<ComboboxSelected>>", self.on_schedule_policy_changed)
+        self.prioritize_btn = ttk.Button(order_frame, text="优先下载所选", command=self.prioritize_selected)
+        self.prioritize_btn.grid(row=0, column=2)
+
+        # 增量刷新为可选项：默认全量刷新，才能发现分享中已删除的文件
+        self.incremental_var = tk.BooleanVar(value=bool(self.downloader.list_config.incremental))
+        self.incremental_check = ttk.Checkbutton(
+            order_frame, text="增量刷新（仅取新增文件）", variable=self.incremental_var
+        )
+        self.incremental_check.grid(row=0, column=3, padx=(15, 0))
         
         # 创建文件列表框架
         files_frame = ttk.LabelFrame(main_frame, text="文件列表", padding="10")
@@ -418,9 +472,9 @@ class LanzouDownloaderGUI:
         self.tree.column("大小", width=100, anchor=tk.CENTER)
         self.tree.column("时间", width=100, anchor=tk.CENTER)
         
-        # 创建垂直滚动条
-        v_scrollbar = ttk.Scrollbar(files_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=v_scrollbar.set)
+        # 创建垂直滚动条（由虚拟化视图驱动：Treeview 只承载可见窗口内的行）
+        v_scrollbar = ttk.Scrollbar(files_frame, orient="vertical")
+        self.file_view = VirtualFileView(self.root, self.tree, v_scrollbar)
         self.tree.bind("<Double-1>", self.on_tree_double_click)
         
         # 布局Treeview和滚动条
@@ -465,57 +519,9 @@ class LanzouDownloaderGUI:
         self.update_path_display()
         self.update_nav_buttons()
 
-    def _clear_tree(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        self.tree_item_meta = {}
-
-    def _reset_file_browser_state(self):
+    def _reset_file_browser_state(self, message=None):
         self.current_folder = ""
-        self.folder_children = {}
-        self.files_in_folder = {}
-        self.tree_item_meta = {}
-
-    def _normalize_folder_key(self, folder_key):
-        k = str(folder_key or "").replace("\\", "/")
-        k = re.sub(r"/{2,}", "/", k).strip("/")
-        if not k:
-            return ""
-        return k + "/"
-
-    def _register_folder_chain(self, folder_key):
-        normalized = self._normalize_folder_key(folder_key)
-        if not normalized:
-            return
-        parent = ""
-        for part in [p for p in normalized.strip("/").split("/") if p]:
-            self.folder_children.setdefault(parent, set()).add(part)
-            parent = f"{parent}{part}/"
-
-    def _ingest_file_for_browser(self, file_info):
-        relative_path = str(file_info.get("relative_path") or "").replace("\\", "/").strip("/")
-        folder_key = ""
-        if relative_path and "/" in relative_path:
-            parts = [p for p in relative_path.split("/") if p]
-            parent = ""
-            for part in parts[:-1]:
-                self.folder_children.setdefault(parent, set()).add(part)
-                parent = f"{parent}{part}/"
-            folder_key = parent
-        else:
-            folder_key = self._normalize_folder_key(file_info.get("folder_path"))
-            self._register_folder_chain(folder_key)
-
-        self.files_in_folder.setdefault(folder_key, []).append(file_info)
-
-    def _folder_parent(self, folder_key):
-        key = self._normalize_folder_key(folder_key)
-        if not key:
-            return ""
-        parts = [p for p in key.strip("/").split("/") if p]
-        if len(parts) <= 1:
-            return ""
-        return "/".join(parts[:-1]) + "/"
+        self.file_view.reset(message=message)
 
     def update_path_display(self):
         if not self.current_folder:
@@ -527,57 +533,18 @@ class LanzouDownloaderGUI:
         self.back_btn.configure(state=("normal" if self.current_folder else "disabled"))
 
     def render_current_folder(self):
-        self._clear_tree()
-
-        if self.current_folder:
-            item_id = self.tree.insert("", "end", values=("", "[返回上级]", "", ""))
-            self.tree_item_meta[item_id] = {"type": "up"}
-
-        child_folders = sorted(
-            list(self.folder_children.get(self.current_folder, set())),
-            key=lambda x: x.lower()
-        )
-        for folder_name in child_folders:
-            target_folder = f"{self.current_folder}{folder_name}/"
-            item_id = self.tree.insert("", "end", values=("", f"[文件夹] {folder_name}", "", ""))
-            self.tree_item_meta[item_id] = {
-                "type": "folder",
-                "folder_key": target_folder,
-                "name": folder_name,
-            }
-
-        files = self.files_in_folder.get(self.current_folder, [])
-        files_sorted = sorted(
-            files,
-            key=lambda f: int(f.get("index", 0)) if str(f.get("index", "")).isdigit() else 0
-        )
-        for file_info in files_sorted:
-            item_id = self.tree.insert("", "end", values=(
-                file_info.get("index", ""),
-                file_info.get("name", ""),
-                file_info.get("size", ""),
-                file_info.get("time", ""),
-            ))
-            self.tree_item_meta[item_id] = {"type": "file", "file": file_info}
-
-        if not child_folders and not files_sorted:
-            item_id = self.tree.insert("", "end", values=("", "当前目录暂无文件", "", ""))
-            self.tree_item_meta[item_id] = {"type": "empty"}
-
+        self.file_view.show_folder(self.current_folder)
         self.update_path_display()
         self.update_nav_buttons()
 
     def go_to_parent_folder(self):
         if not self.current_folder:
             return
-        self.current_folder = self._folder_parent(self.current_folder)
+        self.current_folder = folder_parent(self.current_folder)
         self.render_current_folder()
 
     def on_tree_double_click(self, event):
-        item_id = self.tree.identify_row(event.y)
-        if not item_id:
-            return
-        meta = self.tree_item_meta.get(item_id, {})
+        meta = self.file_view.meta_at(event.y)
         item_type = meta.get("type")
         if item_type == "up":
             self.go_to_parent_folder()
@@ -611,30 +578,20 @@ class LanzouDownloaderGUI:
         self.stop_event.clear()
         self.status_var.set("正在获取文件列表...")
         self.root.update()
-        self._reset_file_browser_state()
-
         # 在列表区域显示获取状态
-        self._clear_tree()
-        self.tree.insert("", "end", values=("", "正在获取文件列表中...", "", ""))
+        self._reset_file_browser_state(message="正在获取文件列表中...")
         self.update_path_display()
         self.update_nav_buttons()
         self.root.update()
 
-        def _add_batch(batch):
-            self._clear_tree()
-            for file_info in batch:
-                self._ingest_file_for_browser(file_info)
-            self.render_current_folder()
-
-        def _append_batch(batch):
-            for file_info in batch:
-                self._ingest_file_for_browser(file_info)
-            self.render_current_folder()
-
         def _on_batch(batch):
-            self.root.after(0, lambda b=batch: _append_batch(b))
+            # 只做有序插入，重绘由视图按帧合并
+            self.root.after(0, lambda b=batch: self.file_view.add_files(b))
             self.root.after(0, lambda: self.status_var.set(f"正在获取文件列表... 已加载 {len(self.downloader.files)} 个文件"))
 
+        # 勾选增量刷新时只翻到已知文件为止，其余条目取自本地目录清单；默认全量刷新并清理已删除的文件
+        incremental = bool(self.incremental_var.get())
+
         def _worker():
             try:
                 if self.custom_url:
@@ -642,15 +599,27 @@ class LanzouDownloaderGUI:
                         url=self.custom_url,
                         password=self.custom_password,
                         on_batch=_on_batch,
-                        stop_event=self.stop_event
+                        stop_event=self.stop_event,
+                        incremental=incremental,
                     )
                 else:
-                    self.downloader.login_and_get_files(on_batch=_on_batch, stop_event=self.stop_event)
-                self.root.after(0, self.render_current_folder)
+                    self.downloader.login_and_get_files(
+                        on_batch=_on_batch,
+                        stop_event=self.stop_event,
+                        incremental=incremental,
+                    )
+                self.root.after(0, lambda: self.file_view.set_message(None))
+                diff = self.downloader.last_list_diff or {}
+                diff_text = ""
+                if diff.get("added") or diff.get("removed") or diff.get("renamed"):
+                    diff_text = (
+                        f"（新增 {len(diff.get('added', []))}，删除 {len(diff.get('removed', []))}，"
+                        f"重命名 {len(diff.get('renamed', []))}）"
+                    )
                 if self.stop_event.is_set():
                     self.root.after(0, lambda: self.status_var.set(f"已停止加载 - 已加载 {len(self.downloader.files)} 个文件"))
                 else:
-                    self.root.after(0, lambda: self.status_var.set(f"就绪 - 共 {len(self.downloader.files)} 个文件"))
+                    self.root.after(0, lambda: self.status_var.set(f"就绪 - 共 {len(self.downloader.files)} 个文件{diff_text}"))
                 if show_popup:
                     self.root.after(0, lambda: messagebox.showinfo("提示", f"文件列表获取完成，共 {len(self.downloader.files)} 个文件"))
             except Exception as e:
@@ -773,9 +742,8 @@ class LanzouDownloaderGUI:
     
     def select_files(self):
         """选择要下载的文件"""
-        # 获取所有选中的项目
-        selected_items = self.tree.selection()
-        if not selected_items:
+        # 选择按行键保存在视图中（包括滚出可见窗口的行）
+        if not self.file_view.has_selection():
             messagebox.showwarning("警告", "请先选择要下载的文件")
             return
         
@@ -783,11 +751,7 @@ class LanzouDownloaderGUI:
         self.selected_files = []
         
         # 添加选中的文件到列表
-        for item in selected_items:
-            meta = self.tree_item_meta.get(item, {})
-            if meta.get("type") != "file":
-                continue
-            src = meta.get("file", {}) or {}
+        for src in self.file_view.selected_files():
             file_info = {
                 "index": src.get("index", ""),
                 "name": src.get("name", ""),
@@ -819,6 +783,9 @@ class LanzouDownloaderGUI:
     
     def start_download(self):
         """开始下载选中的文件"""
+        if self.is_downloading:
+            messagebox.showwarning("警告", "当前已有下载任务在进行中")
+            return
         if not self.selected_files:
             messagebox.showwarning("警告", "请先选择要下载的文件（点击'选择文件'按钮确认）")
             return
@@ -828,44 +795,75 @@ class LanzouDownloaderGUI:
             messagebox.showwarning("警告", "请选择下载目录")
             return
         
-        # 创建下载线程
+        # 创建下载线程（先清除上一批的取消信号，之后点击“停止下载”即使早于线程开始也会生效）
+        self.downloader.clear_cancel()
+        self.is_downloading = True
         thread = threading.Thread(target=self.download_files_thread, args=(download_dir,))
         thread.daemon = True
         thread.start()
+        self.root.after(0, self._pump_progress)
+
+    def on_schedule_policy_changed(self, event=None):
+        """切换下载顺序"""
+        label = self.schedule_policy_var.get()
+        policy = next((p for p, text in SCHEDULE_POLICY_LABELS if text == label), "selection")
+        self.downloader.set_schedule_policy(policy)
+        if self.is_downloading:
+            self.status_var.set(f"下载顺序已切换为“{label}”，对尚未开始的文件生效")
+
+    def prioritize_selected(self):
+        """把列表中当前选中的文件排到下载队列最前（下载前后均可使用）"""
+        files = self.file_view.selected_files()
+        if not files:
+            messagebox.showwarning("警告", "请先在列表中选择要优先下载的文件")
+            return
+        if self.is_downloading:
+            changed = self.downloader.prioritize_downloads(files)
+            if changed:
+                self.status_var.set(f"已将 {changed} 个排队中的文件调到最前")
+            else:
+                self.status_var.set("所选文件不在等待队列中（已开始、已完成或未加入本次下载）")
+            return
+        priority = self.downloader.next_download_priority()
+        links = {f.get("link") for f in files}
+        changed = 0
+        for file_info in self.selected_files:
+            if file_info.get("link") in links:
+                file_info["priority"] = priority
+                changed += 1
+        if changed:
+            self.status_var.set(f"已将 {changed} 个已选文件排到最前，开始下载后优先执行")
+        else:
+            messagebox.showwarning("警告", "所选文件尚未加入下载列表（请先点击'选择文件'）")
+
+    def stop_download(self):
+        """取消当前批量下载"""
+        if self.is_downloading:
+            self.downloader.cancel_downloads()
+            self.status_var.set("正在取消下载...")
     
     def download_files_thread(self, download_dir):
         """下载文件的线程函数"""
         try:
             self.root.after(0, lambda: self.status_var.set("正在下载..."))
-            
-            # 初始化浏览器（仅用于获取真实链接）
-            self.downloader.setup_driver()
-            
-            # 设置进度回调
-            self.downloader.set_progress_callback(self.update_progress)
+
+            # 浏览器只在首次需要兜底提链时由下载器按需启动，之后跨批次复用（见 ensure_driver）
+            # 逐块进度改由 _pump_progress 按频率拉取，下载线程不再逐块投递 Tk 事件
+            self.downloader.set_progress_callback(None)
+            self.downloader.set_global_progress_callback(self.update_total_progress)
             
             total_files = len(self.selected_files)
-            completed_files = 0
-            for i, file_info in enumerate(self.selected_files):
-                # 更新总体进度
-                self.root.after(0, lambda i=i, total=total_files:
-                    self.total_progress_var.set(f"{i}/{total_files} ({int(i/total*100)}%)"))
-
-                # 严格串行：当前文件实时提链并下载，不做预取
-                success = self.downloader.download_single_file_optimized(
-                    file_info,
-                    download_dir,
-                    prefetched_real_url=None
-                )
+            self.root.after(0, lambda: self._set_total_progress_text(f"0/{total_files} (0%)"))
 
-                if success:
-                    completed_files += 1
+            # 有界并发调度：同时下载 download_config.max_workers 个文件
+            result = self.downloader.download_files(list(self.selected_files), download_dir)
+            completed_files = result["succeeded"]
 
-                # 更新总体进度
-                self.root.after(0, lambda comp=completed_files, total=total_files:
-                    self.total_progress_var.set(f"{comp}/{total_files} ({int(comp/total*100)}%)"))
-            
-            self.root.after(0, lambda: self.status_var.set(f"下载完成 - {completed_files}/{total_files} 个文件"))
+            if result["cancelled"]:
+                self.root.after(0, lambda: self.status_var.set(
+                    f"下载已取消 - 完成 {completed_files}/{total_files} 个文件"))
+            else:
+                self.root.after(0, lambda: self.status_var.set(f"下载完成 - {completed_files}/{total_files} 个文件"))
 
             def _ask_open_download_dir():
                 if completed_files <= 0:
@@ -886,12 +884,35 @@ class LanzouDownloaderGUI:
             self.root.after(0, lambda: messagebox.showerror("错误", f"下载过程中出错: {str(e)}"))
             self.root.after(0, lambda: self.status_var.set("下载出错"))
         finally:
-            # 关闭浏览器
-            if self.downloader.driver:
-                try:
-                    self.downloader.driver.quit()
-                except:
-                    pass
+            self.root.after(0, lambda: setattr(self, "is_downloading", False))
+
+    def update_total_progress(self, finished, total, succeeded):
+        """总体进度回调（由调度器在每个文件结束后调用）"""
+        percent = int(finished / total * 100) if total else 100
+        self.root.after(0, lambda: self._set_total_progress_text(
+            f"{finished}/{total} ({percent}%) 成功 {succeeded}"))
+
+    def _set_total_progress_text(self, text):
+        self._total_progress_text = text
+        self.total_progress_var.set(text)
+
+    def _pump_progress(self):
+        """下载期间按固定频率从进度汇总取样刷新界面（每文件更新频率由 download_config 限制）"""
+        progress = self.downloader.progress
+        updates, summary = progress.poll()
+        if updates:
+            latest = updates[-1]
+            suffix = f"（同时下载 {summary['active']} 个）" if summary["active"] > 1 else ""
+            self.current_file_var.set(f"{latest['name']} - {latest['status']}{suffix}")
+            self.progress_var.set(latest["percent"])
+        rate_text = ""
+        if summary["active"] and summary["speed_bps"] > 0:
+            rate_text = f" | {_format_rate(summary['speed_bps'])}"
+            if summary["eta_s"] is not None:
+                rate_text += f" 预计剩余 {_format_eta(summary['eta_s'])}"
+        self.total_progress_var.set(self._total_progress_text + rate_text)
+        if self.is_downloading:
+            self.root.after(max(16, int(progress.min_interval_s * 1000)), self._pump_progress)
     
     def update_progress(self, filename, downloaded_size, filepath, status, progress):
         """更新进度回调"""
@@ -900,12 +921,8 @@ class LanzouDownloaderGUI:
     
     def on_closing(self):
         """关闭窗口时的处理"""
-        # 关闭浏览器
-        if self.downloader.driver:
-            try:
-                self.downloader.driver.quit()
-            except:
-                pass
+        # 关闭浏览器（仅在某次下载触发过兜底时才会启动）
+        self.downloader.close_browser()
         self.root.destroy()
 
 
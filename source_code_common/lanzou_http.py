@@ -0,0 +1,151 @@
+import threading
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+try:
+    from source_code_common.lanzou_types import HttpPoolConfig
+    from source_code_common.lanzou_ratelimit import HostConcurrencyLimiter
+except Exception:
+    from lanzou_types import HttpPoolConfig
+    from lanzou_ratelimit import HostConcurrencyLimiter
+
+
+HOST_CLASSES = ("share", "download", "asset")
+# 直链下载域名的常见特征（dom 返回的 CDN 主机），路径以 /file/ 开头的也按下载处理
+_DOWNLOAD_HOST_MARKERS = ("developer-oss", "downserver", "lanzoug")
+_ASSET_SUFFIXES = (".js", ".css")
+
+
+def classify_url(url):
+    """按 URL 归类连接池：share（分享页 / 列表 / 提链接口）、download（直链 CDN）、asset（外链脚本）。"""
+    try:
+        parsed = urlparse(url)
+    except Exception:
+        return "share"
+    path = (parsed.path or "").lower()
+    if path.endswith(_ASSET_SUFFIXES):
+        return "asset"
+    host = (parsed.hostname or "").lower()
+    if path.startswith("/file/") or any(m in host for m in _DOWNLOAD_HOST_MARKERS):
+        return "download"
+    return "share"
+
+
+class _RoutingAdapter(BaseAdapter):
+    """挂到每个会话上的转发适配器：按主机类别把请求交给共享的 HTTPAdapter。"""
+
+    def __init__(self, pool):
+        super().__init__()
+        self.pool = pool
+
+    def send(self, request, **kwargs):
+        host_class = classify_url(request.url)
+        self.pool._count(host_class)
+        limiter = self.pool.host_limiter
+        host = limiter.acquire(request.url)
+        try:
+            response = self.pool.adapters[host_class].send(request, **kwargs)
+        except BaseException:
+            limiter.release(host)
+            raise
+        if kwargs.get("stream"):
+            # 流式响应的连接在读完响应体之前仍被占用
+            limiter.hold_until_closed(response, host)
+            return response
+        # 非流式请求：Session.send 返回前本就会读完响应体，这里提前读取，
+        # 使名额覆盖整个响应体的下载，而不是在收到响应头时就释放
+        try:
+            response.content
+        finally:
+            limiter.release(host)
+        return response
+
+    def close(self):
+        # 会话关闭时不释放共享连接，由 HttpPool.close() 统一关闭
+        pass
+
+
+class HttpPool:
+    """跨会话共享的连接池：各会话保留独立 cookie，但复用同一组按主机类别划分的长连接。"""
+
+    def __init__(self, config=None):
+        self.config = config or HttpPoolConfig()
+        cfg = self.config
+        sizes = {
+            "share": cfg.share_pool_maxsize,
+            "download": cfg.download_pool_maxsize,
+            "asset": cfg.asset_pool_maxsize,
+        }
+        self.adapters = {
+            host_class: HTTPAdapter(
+                pool_connections=cfg.pool_hosts,
+                pool_maxsize=max(1, int(size)),
+                pool_block=cfg.pool_block,
+                max_retries=cfg.max_retries,
+            )
+            for host_class, size in sizes.items()
+        }
+        # 按主机的并发上限（各主机类别的默认值见 HttpPoolConfig.*_host_concurrency）
+        self.host_limiter = HostConcurrencyLimiter(
+            class_limits={
+                "share": cfg.share_host_concurrency,
+                "download": cfg.download_host_concurrency,
+                "asset": cfg.asset_host_concurrency,
+            },
+            classify_fn=classify_url,
+        )
+        self._router = _RoutingAdapter(self)
+        self._lock = threading.Lock()
+        self._requests = dict.fromkeys(HOST_CLASSES, 0)
+        self._sessions = 0
+
+    def _count(self, host_class):
+        with self._lock:
+            self._requests[host_class] += 1
+
+    def session(self):
+        """新建会话（独立 cookie 与请求头），连接来自共享池。"""
+        s = requests.Session()
+        s.trust_env = False
+        s.mount("https://", self._router)
+        s.mount("http://", self._router)
+        with self._lock:
+            self._sessions += 1
+        return s
+
+    def stats(self):
+        """连接池统计：每类请求数、新建连接数、空闲连接数与连接复用率。"""
+        with self._lock:
+            requests_by_class = dict(self._requests)
+            sessions = self._sessions
+        out = {"sessions": sessions, "classes": {}}
+        for host_class, adapter in self.adapters.items():
+            hosts = {}
+            manager = adapter.poolmanager
+            for key in list(manager.pools.keys()):
+                conn_pool = manager.pools.get(key)
+                if conn_pool is None:
+                    continue
+                host = f"{conn_pool.host}:{conn_pool.port}"
+                idle = conn_pool.pool.qsize() if conn_pool.pool is not None else 0
+                hosts[host] = {
+                    "connections_opened": conn_pool.num_connections,
+                    "requests": conn_pool.num_requests,
+                    "idle": idle,
+                    "maxsize": conn_pool.pool.maxsize if conn_pool.pool is not None else 0,
+                }
+            opened = sum(h["connections_opened"] for h in hosts.values())
+            sent = requests_by_class[host_class]
+            out["classes"][host_class] = {
+                "requests": sent,
+                "connections_opened": opened,
+                "reuse_ratio": round(1 - opened / sent, 3) if sent else None,
+                "hosts": hosts,
+            }
+        return out
+
+    def close(self):
+        for adapter in self.adapters.values():
+            adapter.close()
@@ -1,230 +1,499 @@
 import time
 import random
-import requests
-import re
-import html
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from queue import Queue, Full
 from urllib.parse import urlparse, parse_qs, urljoin
 
 try:
     from source_code_common.lanzou_errors import LanzouError, ErrorCode
+    from source_code_common.lanzou_page_scanner import scan_folder_links, scan_share_page
     from source_code_common.lanzou_types import FileItem
 except Exception:
     from lanzou_errors import LanzouError, ErrorCode
+    from lanzou_page_scanner import scan_folder_links, scan_share_page
     from lanzou_types import FileItem
 
 
+class _AdaptivePacer:
+    """列表翻页节奏（AIMD）：响应干净时缩短间隔、增加在途页数；zt=4/限流时成倍退避。"""
+
+    def __init__(self, config):
+        low, high = config.page_interval_s
+        self.interval_s = (low + high) / 2.0
+        self.jitter_s = max(0.0, (high - low) / 2.0)
+        self.min_interval_s = config.min_page_interval_s
+        self.max_interval_s = max(config.max_page_interval_s, self.interval_s)
+        self.step_s = config.page_interval_step_s
+        self.max_inflight = max(1, config.max_inflight_pages)
+        self.concurrency = 1
+        self.throttle_events = 0
+        self._clean_streak = 0
+        self._lock = threading.Lock()
+
+    def next_delay(self):
+        """下一次翻页前应等待的秒数（含抖动）；异步引擎用它配合 asyncio.sleep。"""
+        with self._lock:
+            base = self.interval_s
+            jitter = min(self.jitter_s, base / 2.0)
+        return max(0.0, base + jitter * (2.0 * random.random() - 1.0))
+
+    def wait(self):
+        time.sleep(self.next_delay())
+
+    def on_success(self):
+        with self._lock:
+            self.interval_s = max(self.min_interval_s, self.interval_s - self.step_s)
+            self._clean_streak += 1
+            if self._clean_streak >= 2 and self.concurrency < self.max_inflight:
+                self.concurrency += 1
+                self._clean_streak = 0
+
+    def on_throttle(self):
+        with self._lock:
+            self.throttle_events += 1
+            self._clean_streak = 0
+            self.interval_s = min(self.max_interval_s, max(self.interval_s, self.min_interval_s) * 2.0)
+            self.concurrency = max(1, self.concurrency // 2)
+
+
+class _AnyEvent:
+    """多个停止信号的“或”组合（调用方的 stop_event 与流式消费者的关闭信号）。"""
+
+    def __init__(self, *events):
+        self._events = [e for e in events if e is not None]
+
+    def is_set(self):
+        return any(e.is_set() for e in self._events)
+
+
+class _FolderNode:
+    """目录树中的一个目录：已解析、待编号的分页，以及按发现顺序登记的子目录。"""
+    __slots__ = ("prefix", "pages", "children", "closed", "drained")
+
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self.pages = deque()
+        self.children = []
+        self.closed = False  # 本目录已抓取结束（子目录均已登记）
+        self.drained = False  # 本目录及其子树均已编号输出
+
+
+_STREAM_DONE = object()
+
+
 class LanzouListFetcher:
     def __init__(self, downloader):
         self.d = downloader
 
-    def fetch(
-        self,
-        url=None,
-        password=None,
-        on_batch=None,
-        stop_event=None,
-        _visited_links=None,
-        _is_subfolder=False,
-        _folder_prefix="",
-    ):
-        """登录并获取文件列表（只做列表逻辑）。"""
-        if url is None:
-            url = self.d.default_url
-        if password is None:
-            password = self.d.default_password
-        if not _is_subfolder:
-            self.d.files = []
-            self.d.file_items = []
-        if _visited_links is None:
-            _visited_links = set()
+    @staticmethod
+    def _normalize_share_url(u):
+        try:
+            p = urlparse(u)
+            return f"{p.scheme}://{p.netloc}{p.path}"
+        except Exception:
+            return str(u or "").strip()
+
+    def _extract_subfolder_links(self, page_html, base_url):
+        """从分享页提取子目录链接，返回 [(url, name)]。"""
+        if not page_html:
+            return []
+        out = []
+        seen = set()
+        for href, name in scan_folder_links(page_html):
+            sub_url = urljoin(base_url, href)
+            norm = self._normalize_share_url(sub_url)
+            if not norm or norm in seen:
+                continue
+            seen.add(norm)
+            out.append((sub_url, name or norm.rsplit("/", 1)[-1]))
+        return out
+
+    @staticmethod
+    def _is_lanzou_share_link(share_url, page_html):
+        parsed = urlparse(share_url)
+        host = parsed.netloc.lower()
+        if "lanzou" in host:
+            return True
+        if not page_html:
+            return False
+        html_lower = page_html.lower()
+        strong_markers = ("filemoreajax.php", "/fn?", "ajaxm.php")
+        if any(m in html_lower for m in strong_markers):
+            return True
+        weak_markers = ("woozooo", "lanzou", "lanzoul", "lanzoui", "ta@lanzou.com", "© lanzou")
+        return sum(1 for m in weak_markers if m in html_lower) >= 2
+
+    def _extract_context(self, page_html, share_url):
+        """解析分享页中 filemoreajax.php 的上下文（fid/uid/t/k 与请求字段）。"""
+        parsed = urlparse(share_url)
+        origin = f"{parsed.scheme}://{parsed.netloc}"
+        q = parse_qs(parsed.query)
+        scanned = scan_share_page(page_html)
+        fid = q.get("file", [None])[0] or scanned["fid"]
+
+        fields = {"fid": fid, "uid": scanned["uid"], "t": scanned["t"], "k": scanned["k"]}
+        missing = [k for k, v in fields.items() if not v]
+        if missing:
+            raise LanzouError(ErrorCode.PARSE, f"页面参数提取失败，缺少: {', '.join(missing)}")
+
+        return {
+            "origin": origin,
+            **fields,
+            "payload_keys": scanned["payload_keys"],
+            "extra_values": scanned["extra_values"],
+        }
+
+    @staticmethod
+    def _build_page_payload(ctx, password, pg, rep=0, ls=1, up=1):
+        """按分享页声明的字段组装 filemoreajax.php 的翻页请求体。"""
+        payload = {}
+        keys = ctx.get("payload_keys") or {
+            "file", "lx", "fid", "uid", "pg", "rep", "t", "k", "up", "ls", "pwd"
+        }
+
+        def _set_if(key, value):
+            if key in keys:
+                payload[key] = value
+
+        _set_if("file", ctx["fid"])
+        _set_if("lx", 2)
+        _set_if("fid", ctx["fid"])
+        _set_if("uid", ctx["uid"])
+        _set_if("pg", pg)
+        _set_if("rep", rep)
+        _set_if("t", ctx["t"])
+        _set_if("k", ctx["k"])
+        _set_if("up", up)
+        if "ls" in keys:
+            payload["ls"] = ls if ls is not None else ctx.get("extra_values", {}).get("ls", 1)
+        if "pwd" in keys:
+            payload["pwd"] = password or ""
+        if "vip" in keys:
+            payload["vip"] = ctx.get("extra_values", {}).get("vip", "0")
+        if "webfoldersign" in keys:
+            payload["webfoldersign"] = ctx.get("extra_values", {}).get("webfoldersign", "")
+        return payload
+
+    @staticmethod
+    def _list_ajax_headers(ctx, referer, user_agent):
+        """filemoreajax.php 请求头。"""
+        return {
+            "User-Agent": user_agent,
+            "Accept": "application/json, text/javascript, */*",
+            "X-Requested-With": "XMLHttpRequest",
+            "Referer": ctx.get("referer_url") or referer,
+            "Origin": ctx["origin"],
+            "Cache-Control": "no-cache",
+            "Pragma": "no-cache",
+        }
+
+    @staticmethod
+    def _row_ajax_file_id(row):
+        """列表行中 ajaxm.php 使用的数字 file id（没有时返回 None）。"""
+        for k in ("file_id", "fid", "f_id", "down_id", "id"):
+            v = row.get(k)
+            s = str(v).strip() if v is not None else ""
+            if s.isdigit() and s != "0":
+                return s
+        for k, v in row.items():
+            ks = str(k).lower()
+            s = str(v).strip() if v is not None else ""
+            if ("id" in ks or ks in ("fid", "file")) and s.isdigit() and s != "0":
+                return s
+        return None
+
+    def _parse_page_rows(self, rows, origin, folder_prefix, seen_ids):
+        """把一页 JSON 行转换为目录条目（跳过无效与重复行），返回 (条目, 对应原始行)。"""
+        entries = []
+        kept_rows = []
+        for row in rows:
+            file_id = str(row.get("id", "")).strip()
+            if not file_id or file_id == "-1":
+                continue
+            if file_id in seen_ids:
+                continue
+            seen_ids.add(file_id)
+
+            if str(row.get("t", "0")) == "1" and file_id.startswith("http"):
+                file_link = file_id
+            else:
+                file_link = urljoin(f"{origin}/", file_id.lstrip("/"))
+            entries.append({
+                "file_id": file_id,
+                "name": row.get("name_all", ""),
+                "link": file_link,
+                "size": row.get("size", "未知大小"),
+                "time": row.get("time", "未知时间"),
+                "ajax_file_id": self._row_ajax_file_id(row),
+                "folder_path": folder_prefix,
+            })
+            kept_rows.append(row)
+        return entries, kept_rows
+
+    def fetch(self, url=None, password=None, on_batch=None, stop_event=None, incremental=None):
+        """登录并获取文件列表（只做列表逻辑），结果物化到 self.d.files / self.d.file_items。"""
+        self.d.files = []
+        self.d.file_items = []
+
+        def _sink(items):
+            batch = [item.to_dict() for item in items]
+            self.d.file_items.extend(items)
+            self.d.files.extend(batch)
+            if callable(on_batch):
+                try:
+                    on_batch(batch)
+                except Exception:
+                    pass
 
-        payload_debug_keys = None
-        discovered_subfolders = []
+        self._crawl(url, password, _sink, stop_event=stop_event, incremental=incremental)
+        return self.d.files
 
-        def _normalize_share_url(u):
-            try:
-                p = urlparse(u)
-                return f"{p.scheme}://{p.netloc}{p.path}"
-            except Exception:
-                return str(u or "").strip()
-
-        def _extract_subfolder_links(page_html, base_url):
-            if not page_html:
-                return []
-            out = []
-            seen = set()
-            for m in re.finditer(r"<a[^>]+href=['\"]([^'\"]+)['\"][^>]*>", page_html, re.I):
-                href = (m.group(1) or "").strip()
-                if not href:
-                    continue
-                if href.startswith("javascript:") or href.startswith("#"):
-                    continue
-                if not re.search(r"/b[0-9a-z]+", href, re.I):
-                    continue
-                start = max(0, m.start() - 260)
-                end = min(len(page_html), m.end() + 720)
-                snippet = page_html[start:end]
-                if "mbxfolder" not in snippet and "folderdown" not in snippet:
-                    continue
+    def iter_files(self, url=None, password=None, stop_event=None, incremental=None, max_pending_pages=None):
+        """逐页产出 FileItem 的生成器。
+
+        抓取在后台线程进行，最多缓冲 max_pending_pages 页，消费跟不上时抓取线程等待；
+        提前关闭生成器（break / close）即取消抓取。
+        """
+        pending = Queue(maxsize=max(1, max_pending_pages or self.d.list_config.stream_pending_pages))
+        closed = threading.Event()
 
-                sub_url = urljoin(base_url, href)
-                norm = _normalize_share_url(sub_url)
-                if not norm or norm in seen:
+        def _put(items):
+            while not closed.is_set():
+                try:
+                    pending.put(items, timeout=0.2)
+                    return
+                except Full:
                     continue
-                seen.add(norm)
 
-                name = ""
-                name_match = re.search(
-                    r"class=['\"]filename['\"][^>]*>(.*?)<div[^>]*class=['\"]filesize['\"]",
-                    snippet,
-                    re.I | re.S,
+        error = self._start_stream(url, password, _put, closed, stop_event, incremental)
+        try:
+            while True:
+                items = pending.get()
+                if items is _STREAM_DONE:
+                    break
+                yield from items
+            if error:
+                raise error[0]
+        finally:
+            closed.set()
+
+    async def aiter_files(self, url=None, password=None, stop_event=None, incremental=None, max_pending_pages=None):
+        """iter_files 的异步版本（async for），背压与取消语义相同。"""
+        loop = asyncio.get_running_loop()
+        pending = asyncio.Queue(maxsize=max(1, max_pending_pages or self.d.list_config.stream_pending_pages))
+        closed = threading.Event()
+
+        def _put(items):
+            fut = asyncio.run_coroutine_threadsafe(pending.put(items), loop)
+            while True:
+                try:
+                    fut.result(timeout=0.2)
+                    return
+                except FutureTimeoutError:
+                    if closed.is_set():
+                        fut.cancel()
+                        return
+
+        error = self._start_stream(url, password, _put, closed, stop_event, incremental)
+        try:
+            while True:
+                items = await pending.get()
+                if items is _STREAM_DONE:
+                    break
+                for item in items:
+                    yield item
+            if error:
+                raise error[0]
+        finally:
+            closed.set()
+
+    def _start_stream(self, url, password, put, closed, stop_event, incremental):
+        """后台线程运行抓取，每页通过 put 投递，结束时投递 _STREAM_DONE；返回错误容器。"""
+        error = []
+
+        def _run():
+            try:
+                self._crawl(url, password, put, stop_event=_AnyEvent(stop_event, closed), incremental=incremental)
+            except Exception as e:
+                error.append(e)
+            finally:
+                put(_STREAM_DONE)
+
+        threading.Thread(target=_run, name="lanzou-list-stream", daemon=True).start()
+        return error
+
+    def _crawl(self, url, password, sink, stop_event=None, incremental=None):
+        """抓取整棵目录树，以 FileItem 列表分批调用 sink（串行调用，序号连续）。
+
+        根目录失败直接抛出；子目录按广度优先交给有界线程池并发抓取，单个子目录失败不影响其它目录。
+        序号按目录树的深度优先顺序（本目录文件在前，其后依次为各子目录）分配，与抓取完成的先后无关，
+        每次运行保持一致；排在前面的目录尚未抓完时，后面目录的分页先缓冲。
+        incremental 为 True 时，某页全部是目录清单中的已知文件即停止翻页，其余条目由清单补齐；
+        清单从未完整或距上次完整扫描超过 list_config.incremental_max_age_s 的目录仍按全量获取。
+        """
+        if url is None:
+            url = self.d.default_url
+        if password is None:
+            password = self.d.default_password
+        if incremental is None:
+            incremental = self.d.list_config.incremental
+
+        pacer = _AdaptivePacer(self.d.list_config)
+        share_key = self._normalize_share_url(url)
+        visited = {share_key}
+        visited_lock = threading.Lock()
+        catalog = self.d.get_catalog()
+        root = _FolderNode()
+        crawl = {
+            "sink": sink,
+            "lock": threading.Lock(),  # 多个目录并发时串行化序号分配与 sink 调用
+            "root": root,
+            "count": 0,
+            "catalog": catalog,
+            "share": share_key,
+            "incremental": bool(incremental),
+            "diff": {"added": [], "removed": [], "renamed": []},
+        }
+        failed_folders = 0
+        root_subfolders = self._fetch_folder(url, password, crawl, stop_event, "", pacer, root)
+
+        def _stopped():
+            return stop_event is not None and stop_event.is_set()
+
+        def _close(node):
+            # 子目录登记完毕后才关闭：编号越过该目录时，其子目录的先后已经确定
+            with crawl["lock"]:
+                node.closed = True
+                self._drain(crawl, root)
+
+        workers = max(1, self.d.list_config.folder_workers)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = {}
+
+            def _submit(subfolders, parent):
+                for sub_url, sub_name in subfolders:
+                    sub_norm = self._normalize_share_url(sub_url)
+                    with visited_lock:
+                        if not sub_norm or sub_norm in visited:
+                            continue
+                        visited.add(sub_norm)
+                    node = _FolderNode(f"{parent.prefix}{sub_name}/")
+                    parent.children.append(node)
+                    print(f"调试: 进入子目录 {sub_name} -> {sub_norm}")
+                    fut = pool.submit(self._fetch_folder, sub_url, password, crawl, stop_event, node.prefix, pacer, node)
+                    pending[fut] = (sub_norm, node)
+
+            if not _stopped():
+                _submit(root_subfolders, root)
+            _close(root)
+            while pending:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    sub_norm, node = pending.pop(fut)
+                    try:
+                        subfolders = fut.result()
+                    except Exception as sub_err:
+                        # 子目录失败不影响主目录流程，尽量继续抓取其它子目录
+                        print(f"调试: 子目录抓取失败，已跳过 {sub_norm}，原因: {sub_err}")
+                        failed_folders += 1
+                        _close(node)
+                        continue
+                    if not _stopped():
+                        _submit(subfolders, node)
+                    _close(node)
+
+        if len(visited) > 1:
+            print(f"调试: 目录抓取完成，共 {len(visited)} 个目录，{crawl['count']} 个文件")
+        if catalog is not None:
+            diff = crawl["diff"]
+            if not failed_folders and not _stopped():
+                # 只有整棵目录树都走完才能确认哪些子目录已被删除
+                try:
+                    diff["removed"].extend(catalog.prune_folders(share_key, visited))
+                except Exception as e:
+                    print(f"调试: 目录清单清理失败: {e}")
+            self.d.last_list_diff = diff
+            print(
+                f"目录变化: 新增 {len(diff['added'])}，删除 {len(diff['removed'])}，重命名 {len(diff['renamed'])}"
+            )
+        return crawl["count"]
+
+    def _drain(self, crawl, node):
+        """按深度优先顺序为已就绪的分页编号并交给 sink（调用方持 crawl["lock"]），返回该子树是否已全部输出。"""
+        if node.drained:
+            return True
+        while node.pages:
+            entries = node.pages.popleft()
+            first = crawl["count"] + 1
+            items = [
+                FileItem(
+                    index=first + i,
+                    name=e["name"],
+                    link=e["link"],
+                    size=e["size"],
+                    time=e["time"],
+                    ajax_file_id=e["ajax_file_id"],
+                    folder_path=node.prefix,
+                    relative_path=f"{node.prefix}{e['name']}" if node.prefix else "",
                 )
-                if name_match:
-                    raw = re.sub(r"<[^>]+>", "", name_match.group(1))
-                    name = html.unescape(raw).strip()
-                if not name:
-                    name = norm.rsplit("/", 1)[-1]
-                out.append((sub_url, name))
-            return out
-
-        def _is_lanzou_share_link(share_url, page_html):
-            parsed = urlparse(share_url)
-            host = parsed.netloc.lower()
-            if "lanzou" in host:
-                return True
-            if not page_html:
+                for i, e in enumerate(entries)
+            ]
+            crawl["count"] += len(items)
+            crawl["sink"](items)
+        if not node.closed:
+            return False
+        for child in node.children:
+            if not self._drain(crawl, child):
                 return False
-            html_lower = page_html.lower()
-            strong_markers = ("filemoreajax.php", "/fn?", "ajaxm.php")
-            if any(m in html_lower for m in strong_markers):
-                return True
-            weak_markers = ("woozooo", "lanzou", "lanzoul", "lanzoui", "ta@lanzou.com", "© lanzou")
-            return sum(1 for m in weak_markers if m in html_lower) >= 2
+        node.drained = True
+        return True
 
-        def _extract_context(page_html, share_url):
-            parsed = urlparse(share_url)
-            origin = f"{parsed.scheme}://{parsed.netloc}"
-            q = parse_qs(parsed.query)
-            fid = q.get("file", [None])[0]
-
-            if not fid:
-                m = re.search(r"/filemoreajax\.php\?file=(\d+)", page_html)
-                fid = m.group(1) if m else None
-            if not fid:
-                m = re.search(r"'fid'\s*:\s*(\d+)", page_html)
-                fid = m.group(1) if m else None
-
-            uid_match = re.search(r"'uid'\s*:\s*'?(\d+)'?", page_html)
-            uid = uid_match.group(1) if uid_match else None
-
-            t_name_match = re.search(r"'t'\s*:\s*([A-Za-z_][A-Za-z0-9_]*)", page_html)
-            k_name_match = re.search(r"'k'\s*:\s*([A-Za-z_][A-Za-z0-9_]*)", page_html)
-
-            def _pick_var_value(var_name):
-                if not var_name:
-                    return None
-                var_match = re.search(
-                    rf"var\s+{re.escape(var_name)}\s*=\s*['\"]([^'\"]+)['\"]",
-                    page_html
-                )
-                return var_match.group(1) if var_match else None
-
-            t_val = _pick_var_value(t_name_match.group(1) if t_name_match else None)
-            k_val = _pick_var_value(k_name_match.group(1) if k_name_match else None)
-
-            if not t_val:
-                m = re.search(r"'t'\s*:\s*'([^']+)'", page_html)
-                t_val = m.group(1) if m else None
-            if not k_val:
-                m = re.search(r"'k'\s*:\s*'([^']+)'", page_html)
-                k_val = m.group(1) if m else None
-
-            def _extract_payload_spec(html_text):
-                base_keys = {"file", "lx", "fid", "uid", "pg", "rep", "t", "k", "up"}
-                optional_keys = {"ls", "pwd", "vip", "webfoldersign"}
-                found_keys = set()
-                extra_values = {}
-
-                for m in re.finditer(r"filemoreajax\.php", html_text):
-                    start = max(0, m.start() - 500)
-                    end = min(len(html_text), m.end() + 800)
-                    snippet = html_text[start:end]
-                    obj_match = re.search(r"data\s*:\s*\{([^}]+)\}", snippet, re.S)
-                    if obj_match:
-                        obj_text = obj_match.group(1)
-                        for key_match in re.finditer(r"['\"]?([A-Za-z0-9_]+)['\"]?\s*:", obj_text):
-                            found_keys.add(key_match.group(1))
-                        break
+    def _fetch_folder(self, url, password, crawl, stop_event=None, _folder_prefix="", pacer=None, node=None):
+        """抓取单个目录的全部分页，返回发现的子目录 [(url, name)]；分页条目交给目录树中的 node 按序编号。"""
+        payload_debug_keys = None
+        discovered_subfolders = []
+        _normalize_share_url = self._normalize_share_url
+        _extract_subfolder_links = self._extract_subfolder_links
+        _is_lanzou_share_link = self._is_lanzou_share_link
 
-                if not found_keys:
-                    found_keys = set(base_keys)
-                    for k in optional_keys:
-                        if re.search(rf"\b{k}\b", html_text):
-                            found_keys.add(k)
-
-                def _pick_scalar(name):
-                    m1 = re.search(rf"(?:var\s+)?{re.escape(name)}\s*=\s*['\"]([^'\"]+)['\"]", html_text)
-                    if m1:
-                        return m1.group(1)
-                    m2 = re.search(rf"(?:var\s+)?{re.escape(name)}\s*=\s*(\d+)", html_text)
-                    if m2:
-                        return m2.group(1)
-                    return None
-
-                for key in ("ls", "vip", "webfoldersign"):
-                    v = _pick_scalar(key)
-                    if v is not None:
-                        extra_values[key] = v
-
-                return found_keys, extra_values
-
-            missing = [k for k, v in {"fid": fid, "uid": uid, "t": t_val, "k": k_val}.items() if not v]
-            if missing:
-                raise LanzouError(ErrorCode.PARSE, f"页面参数提取失败，缺少: {', '.join(missing)}")
-
-            payload_keys, extra_values = _extract_payload_spec(page_html)
-            try:
-                key_preview = ",".join(sorted(payload_keys))
-            except Exception:
-                key_preview = str(payload_keys)
+        def _extract_context(page_html, share_url):
             nonlocal payload_debug_keys
+            ctx = self._extract_context(page_html, share_url)
+            key_preview = ",".join(sorted(ctx["payload_keys"]))
             if payload_debug_keys != key_preview:
                 payload_debug_keys = key_preview
                 print(f"调试: 列表接口字段 => {key_preview}")
-                if extra_values:
-                    print(f"调试: 额外字段取值 => {extra_values}")
-            return {
-                "origin": origin,
-                "fid": fid,
-                "uid": uid,
-                "t": t_val,
-                "k": k_val,
-                "payload_keys": payload_keys,
-                "extra_values": extra_values,
-            }
+                if ctx["extra_values"]:
+                    print(f"调试: 额外字段取值 => {ctx['extra_values']}")
+            return ctx
 
         try:
             print(f"正在访问链接: {self.d._mask_url(url)}")
-            session = requests.Session()
-            session.trust_env = False
+            session = self.d.http_pool.session()
             common_headers = self.d._make_common_headers()
 
             parsed = urlparse(url)
-            host = parsed.netloc
+            host = parsed.hostname or parsed.netloc
 
             def _get_share_page(cache_bust=False):
                 req_url = url
                 if cache_bust:
                     sep = "&" if "?" in req_url else "?"
                     req_url = f"{req_url}{sep}t={int(time.time()*1000)}"
-                resp = session.get(req_url, headers=common_headers, timeout=20)
+                with self.d.metrics.span("list_share_page", http=True):
+                    resp = session.get(req_url, headers=common_headers, timeout=20)
                 resp.raise_for_status()
                 body = resp.text
                 if self.d._is_html_challenge_response(resp, body):
                     token = self.d._solve_acw_sc_v2(body)
                     if token:
                         session.cookies.set("acw_sc__v2", token, domain=host, path="/")
-                        resp = session.get(req_url, headers=common_headers, timeout=20)
+                        with self.d.metrics.span("list_share_page", http=True):
+                            resp = session.get(req_url, headers=common_headers, timeout=20)
                         resp.raise_for_status()
                         body = resp.text
                 session.cookies.set("codelen", "1", domain=host, path="/")
@@ -268,7 +537,8 @@ class LanzouListFetcher:
                     "Origin": ctx["origin"],
                 }
                 try:
-                    probe = session.post(ajax_url, data=payload, headers=ajax_headers, timeout=12)
+                    with self.d.metrics.span("list_probe", http=True):
+                        probe = session.post(ajax_url, data=payload, headers=ajax_headers, timeout=12)
                     probe.raise_for_status()
                     data = probe.json()
                     return isinstance(data, dict) and ("zt" in data)
@@ -278,72 +548,56 @@ class LanzouListFetcher:
             if not _validate_lanzou_api():
                 raise LanzouError(ErrorCode.LIST_API_UNAVAILABLE, "链接不是蓝奏云分享页或列表接口不可用")
 
+            if pacer is None:
+                pacer = _AdaptivePacer(self.d.list_config)
+
             def _new_session():
-                s = requests.Session()
-                s.trust_env = False
-                return s
+                # 换新 cookie，连接仍来自共享池
+                return self.d.http_pool.session()
+
+            ctx_lock = threading.RLock()
 
             def _refresh_context(force_new_session=False, cache_bust=False):
                 nonlocal session, ctx
-                if force_new_session:
-                    session = _new_session()
-                refresh_resp, refresh_html, share_url = _get_share_page(cache_bust=cache_bust)
-                ctx = _extract_context(refresh_html, url)
-                ctx["share_url"] = share_url
-                ctx["referer_url"] = url
+                # 并发翻页时串行化上下文刷新
+                with ctx_lock:
+                    if force_new_session:
+                        session = _new_session()
+                    refresh_resp, refresh_html, share_url = _get_share_page(cache_bust=cache_bust)
+                    new_ctx = _extract_context(refresh_html, url)
+                    new_ctx["share_url"] = share_url
+                    new_ctx["referer_url"] = url
+                    ctx = new_ctx
 
             def _post_page(pg, rep=0, ls=1, up=1):
-                payload = {}
-                keys = ctx.get("payload_keys") or {
-                    "file", "lx", "fid", "uid", "pg", "rep", "t", "k", "up", "ls", "pwd"
-                }
-
-                def _set_if(key, value):
-                    if key in keys:
-                        payload[key] = value
-
-                _set_if("file", ctx["fid"])
-                _set_if("lx", 2)
-                _set_if("fid", ctx["fid"])
-                _set_if("uid", ctx["uid"])
-                _set_if("pg", pg)
-                _set_if("rep", rep)
-                _set_if("t", ctx["t"])
-                _set_if("k", ctx["k"])
-                _set_if("up", up)
-                if "ls" in keys:
-                    payload["ls"] = ls if ls is not None else ctx.get("extra_values", {}).get("ls", 1)
-                if "pwd" in keys:
-                    payload["pwd"] = password or ""
-                if "vip" in keys:
-                    payload["vip"] = ctx.get("extra_values", {}).get("vip", "0")
-                if "webfoldersign" in keys:
-                    payload["webfoldersign"] = ctx.get("extra_values", {}).get("webfoldersign", "")
-                ajax_headers = {
-                    "User-Agent": common_headers["User-Agent"],
-                    "Accept": "application/json, text/javascript, */*",
-                    "X-Requested-With": "XMLHttpRequest",
-                    "Referer": ctx.get("referer_url") or url,
-                    "Origin": ctx["origin"],
-                    "Cache-Control": "no-cache",
-                    "Pragma": "no-cache",
-                }
-                page_resp = session.post(ajax_url, data=payload, headers=ajax_headers, timeout=20)
+                payload = self._build_page_payload(ctx, password, pg, rep=rep, ls=ls, up=up)
+                ajax_headers = self._list_ajax_headers(ctx, url, common_headers["User-Agent"])
+                with self.d.metrics.span("list_page", http=True):
+                    page_resp = session.post(ajax_url, data=payload, headers=ajax_headers, timeout=20)
                 body = page_resp.text or ""
-                if self.d._is_html_challenge_response(page_resp, body) or "http_ratelimit" in page_resp.headers.get("x-tengine-error", ""):
+                rate_limited = "http_ratelimit" in page_resp.headers.get("x-tengine-error", "")
+                if rate_limited:
+                    self.d.metrics.inc("list_ratelimit")
+                    pacer.on_throttle()
+                if self.d._is_html_challenge_response(page_resp, body) or rate_limited:
                     token = self.d._solve_acw_sc_v2(body)
                     if token:
                         session.cookies.set("acw_sc__v2", token, domain=host, path="/")
                         time.sleep(0.6 + (0.6 * random.random()))
-                        page_resp = session.post(ajax_url, data=payload, headers=ajax_headers, timeout=20)
+                        with self.d.metrics.span("list_page", http=True):
+                            page_resp = session.post(ajax_url, data=payload, headers=ajax_headers, timeout=20)
                         body = page_resp.text or ""
                 page_resp.raise_for_status()
                 try:
                     data = page_resp.json()
                 except Exception:
                     info = "rate limit challenge" if self.d._is_html_challenge_response(page_resp, body) else "non-json response"
+                    self.d.metrics.inc("list_zt4")
                     return {"zt": "4", "info": info}, "4"
-                return data, str(data.get("zt", ""))
+                zt = str(data.get("zt", ""))
+                if zt == "4":
+                    self.d.metrics.inc("list_zt4")
+                return data, zt
 
             def _post_page_simple(pg, tries=6):
                 last_data = None
@@ -413,156 +667,214 @@ class LanzouListFetcher:
 
                 return last_data, last_zt
 
-            index = len(self.d.files) + 1
+            folder_key = _normalize_share_url(url)
+            catalog = crawl["catalog"]
+            known, known_complete = {}, False
+            if catalog is not None:
+                try:
+                    known, known_complete = catalog.load_folder(
+                        crawl["share"], folder_key, max_age_s=self.d.list_config.incremental_max_age_s
+                    )
+                except Exception as e:
+                    print(f"调试: 目录清单读取失败，按全量获取: {e}")
+            incremental = crawl["incremental"] and known_complete
+            if crawl["incremental"] and known and not known_complete:
+                print(f"调试: 目录清单未完整或距上次完整扫描过久，本次全量获取: {_folder_prefix or '根目录'}")
+            catalog_entries = []
+            reached_end = False
+            stopped_incrementally = False
+
+            folder_node = node if node is not None else crawl["root"]
+
+            def _emit(entries):
+                """把一页条目交给目录树：轮到本目录时立即编号输出，否则先缓冲。"""
+                if not entries:
+                    return
+                with crawl["lock"]:
+                    folder_node.pages.append(entries)
+                    self._drain(crawl, crawl["root"])
+                if catalog is not None:
+                    catalog_entries.extend(entries)
+
             page = 1
             max_pages = self.d.list_config.max_pages
             seen_ids = set()
+            listed = 0  # 本目录已解析的条目数
             simple_mode = False
             zt4_global = 0
             last_ctx_refresh = 0.0
+            state_lock = threading.Lock()
 
-            while page <= max_pages:
-                if stop_event is not None and stop_event.is_set():
-                    print("调试: 已收到停止加载信号，提前结束")
-                    break
-                self.d._sleep_range(self.d.list_config.page_interval_s)
-                print(f"调试: 正在获取第 {page} 页")
+            def _load_page(target_page, speculative=False):
+                """单页完整重试流程，返回 (data, zt, 是否一次成功)。"""
+                nonlocal zt4_global, last_ctx_refresh
+                throttle_before = pacer.throttle_events
                 data, zt = None, ""
+                if speculative:
+                    # 预取页先只发一次请求：越过末页时 zt=2 不再走 simple_mode 的多次重试
+                    try:
+                        data, zt = _post_page(target_page, rep=0, ls=1, up=1)
+                    except Exception:
+                        data, zt = None, ""
+                    if zt in ("1", "2", "3"):
+                        return data, zt, pacer.throttle_events == throttle_before
                 max_page_attempts = 4 if simple_mode else 8
                 for page_attempt in range(1, max_page_attempts + 1):
+                    if stop_event is not None and stop_event.is_set():
+                        break
                     if simple_mode:
-                        data, zt = _post_page_simple(page, tries=6)
+                        data, zt = _post_page_simple(target_page, tries=6)
                         if zt != "1":
-                            data, zt = _fetch_page_with_retry(page, max_attempts=24, allow_warmup=True)
+                            data, zt = _fetch_page_with_retry(target_page, max_attempts=24, allow_warmup=True)
                     else:
-                        data, zt = _fetch_page_with_retry(page, max_attempts=24, allow_warmup=True)
+                        data, zt = _fetch_page_with_retry(target_page, max_attempts=24, allow_warmup=True)
 
                     if zt == "1" or zt == "2" or zt == "3":
                         break
                     if zt == "4":
-                        zt4_global = min(12, zt4_global + 1)
+                        with state_lock:
+                            zt4_global = min(12, zt4_global + 1)
+                        pacer.on_throttle()
                         self.d._sleep_range(self.d.list_config.zt4_wait_s)
-                        print(f"调试: 第 {page} 页 zt=4，随机等待后重试")
+                        print(f"调试: 第 {target_page} 页 zt=4，随机等待后重试")
                         now = time.time()
-                        if now - last_ctx_refresh > self.d.list_config.ctx_refresh_cooldown_s:
+                        with state_lock:
+                            should_refresh = now - last_ctx_refresh > self.d.list_config.ctx_refresh_cooldown_s
+                            if should_refresh:
+                                last_ctx_refresh = now
+                        if should_refresh:
                             try:
                                 _refresh_context(force_new_session=False, cache_bust=True)
-                                last_ctx_refresh = now
                             except Exception:
                                 pass
                         continue
                     time.sleep(0.3)
+                return data, zt, pacer.throttle_events == throttle_before
 
-                if zt == "2":
-                    print(f"调试: 第 {page} 页 zt=2，列表结束")
-                    break
-                if zt != "1":
-                    raise LanzouError(ErrorCode.UNKNOWN, f"第 {page} 页请求失败，zt={zt}, info={data.get('info', '') if data else ''}")
-                if zt4_global > 0:
-                    zt4_global = max(0, zt4_global - 1)
-
-                rows = data.get("text") or []
-                if not rows:
+            while page <= max_pages:
+                if stop_event is not None and stop_event.is_set():
+                    print("调试: 已收到停止加载信号，提前结束")
                     break
-                if page == 1:
-                    simple_mode = True
-
-                added_count = 0
-                batch = []
-                for row in rows:
-                    file_id = str(row.get("id", "")).strip()
-                    if not file_id or file_id == "-1":
-                        continue
-                    if file_id in seen_ids:
-                        continue
-                    seen_ids.add(file_id)
-
-                    if str(row.get("t", "0")) == "1" and file_id.startswith("http"):
-                        file_link = file_id
-                    else:
-                        file_link = urljoin(f"{ctx['origin']}/", file_id.lstrip("/"))
-
-                    ajax_file_id = None
-                    for k in ("file_id", "fid", "f_id", "down_id", "id"):
-                        v = row.get(k)
-                        s = str(v).strip() if v is not None else ""
-                        if s.isdigit() and s != "0":
-                            ajax_file_id = s
+                pacer.wait()
+                # 第 1 页串行（用于判定 simple_mode），之后按自适应并发预取后续页
+                window = 1 if page == 1 else max(1, min(pacer.concurrency, max_pages - page + 1))
+                if window == 1:
+                    print(f"调试: 正在获取第 {page} 页")
+                    results = [(page, _load_page(page))]
+                else:
+                    print(f"调试: 正在获取第 {page}-{page + window - 1} 页（并发 {window}）")
+                    with ThreadPoolExecutor(max_workers=window) as pool:
+                        futures = [
+                            (pg, pool.submit(_load_page, pg, pg != page))
+                            for pg in range(page, page + window)
+                        ]
+                        results = []
+                        for pg, fut in futures:
+                            try:
+                                results.append((pg, fut.result()))
+                            except Exception as e:
+                                results.append((pg, (None, "", False)))
+                                print(f"调试: 第 {pg} 页请求异常: {e}")
+
+                finished = False
+                next_page = page + len(results)
+                for pg, (data, zt, clean) in results:
+                    if stop_event is not None and stop_event.is_set():
+                        finished = True
+                        break
+                    if zt == "2" and pg != page:
+                        # 前一页是满页却提前收到 zt=2：回到该页走完整重试流程确认
+                        next_page = pg
+                        break
+                    if zt == "2":
+                        print(f"调试: 第 {pg} 页 zt=2，列表结束")
+                        reached_end = True
+                        finished = True
+                        break
+                    if zt != "1":
+                        raise LanzouError(ErrorCode.UNKNOWN, f"第 {pg} 页请求失败，zt={zt}, info={data.get('info', '') if data else ''}")
+                    if clean:
+                        pacer.on_success()
+                    with state_lock:
+                        if zt4_global > 0:
+                            zt4_global = max(0, zt4_global - 1)
+
+                    rows = data.get("text") or []
+                    if not rows:
+                        reached_end = True
+                        finished = True
+                        break
+                    if pg == 1:
+                        simple_mode = True
+
+                    page_entries, page_rows = self._parse_page_rows(rows, ctx["origin"], _folder_prefix, seen_ids)
+                    new_count = sum(1 for e in page_entries if e["file_id"] not in known)
+                    added_count = len(page_entries)
+                    first = listed + 1
+                    listed += len(page_entries)
+                    _emit(page_entries)
+                    # 预览只针对根目录（其序号即全局序号）
+                    for index, (entry, row) in enumerate(zip(page_entries, page_rows), start=first):
+                        if _folder_prefix or index > 50:
                             break
-                    if not ajax_file_id:
-                        for k, v in row.items():
-                            ks = str(k).lower()
-                            s = str(v).strip() if v is not None else ""
-                            if ("id" in ks or ks in ("fid", "file")) and s.isdigit() and s != "0":
-                                ajax_file_id = s
-                                break
-                    if index <= 3:
-                        key_preview = ", ".join(list(row.keys())[:12])
-                        print(f"调试: 列表行键预览[{index}] => {key_preview}")
-                        if ajax_file_id:
-                            print(f"调试: 列表提取ajax_file_id[{index}] => {ajax_file_id}")
-                        else:
-                            print(f"调试: 列表未提取到ajax_file_id[{index}]")
-
-                    item = FileItem(
-                        index=index,
-                        name=row.get("name_all", ""),
-                        link=file_link,
-                        size=row.get("size", "未知大小"),
-                        time=row.get("time", "未知时间"),
-                        ajax_file_id=ajax_file_id,
-                    )
-                    self.d.file_items.append(item)
-                    file_info = item.to_dict()
-                    if _folder_prefix:
-                        file_info["folder_path"] = _folder_prefix
-                        file_info["relative_path"] = f"{_folder_prefix}{file_info['name']}"
-                    self.d.files.append(file_info)
-                    batch.append(file_info)
-                    if index <= 50:
-                        print(f"  {index:3d}. {file_info['name']} ({file_info['size']})")
-                    index += 1
-                    added_count += 1
-                if batch and callable(on_batch):
-                    try:
-                        on_batch(batch)
-                    except Exception:
-                        pass
-
-                if added_count == 0:
-                    print(f"调试: 第 {page} 页无新增文件，停止翻页以避免循环")
-                    break
-                if len(rows) < self.d.list_config.page_size:
-                    print(f"调试: 第 {page} 页条目数 {len(rows)} < {self.d.list_config.page_size}，视为最后一页")
+                        if index <= 3:
+                            key_preview = ", ".join(list(row.keys())[:12])
+                            print(f"调试: 列表行键预览[{index}] => {key_preview}")
+                            if entry["ajax_file_id"]:
+                                print(f"调试: 列表提取ajax_file_id[{index}] => {entry['ajax_file_id']}")
+                            else:
+                                print(f"调试: 列表未提取到ajax_file_id[{index}]")
+                        print(f"  {index:3d}. {entry['name']} ({entry['size']})")
+
+                    if added_count == 0:
+                        print(f"调试: 第 {pg} 页无新增文件，停止翻页以避免循环")
+                        reached_end = True
+                        finished = True
+                        break
+                    if len(rows) < self.d.list_config.page_size:
+                        print(f"调试: 第 {pg} 页条目数 {len(rows)} < {self.d.list_config.page_size}，视为最后一页")
+                        reached_end = True
+                        finished = True
+                        break
+                    if incremental and new_count == 0:
+                        print(f"调试: 第 {pg} 页均为已知文件，增量模式停止翻页，其余条目取自目录清单")
+                        stopped_incrementally = True
+                        finished = True
+                        break
+                if finished:
                     break
-                page += 1
+                page = next_page
+
+            if stopped_incrementally:
+                page_size = self.d.list_config.page_size
+                rest = [
+                    dict(entry, folder_path=_folder_prefix)
+                    for file_id, entry in known.items()
+                    if file_id not in seen_ids
+                ]
+                for i in range(0, len(rest), page_size):
+                    _emit(rest[i:i + page_size])
+
+            if catalog is not None and (reached_end or stopped_incrementally):
+                try:
+                    # 只有扫描到末页才记为完整并判定删除；增量停止只合并新增，保留上次完整扫描的时间
+                    folder_diff = catalog.save_folder(
+                        crawl["share"], folder_key, _folder_prefix, catalog_entries, complete=reached_end,
+                    )
+                    with crawl["lock"]:
+                        for k, v in folder_diff.items():
+                            crawl["diff"][k].extend(v)
+                except Exception as e:
+                    print(f"调试: 目录清单写入失败: {e}")
 
-            print(f"直连获取完成，共 {len(self.d.files)} 个文件")
+            if _folder_prefix:
+                print(f"子目录 {_folder_prefix} 获取完成，累计 {crawl['count']} 个文件")
+            else:
+                print(f"直连获取完成，共 {crawl['count']} 个文件")
 
         except LanzouError:
             raise
         except Exception as e:
             raise LanzouError(ErrorCode.UNKNOWN, f"获取文件列表时出错: {e}")
 
-        current_norm = _normalize_share_url(url)
-        _visited_links.add(current_norm)
-        for sub_url, sub_name in discovered_subfolders:
-            sub_norm = _normalize_share_url(sub_url)
-            if not sub_norm or sub_norm in _visited_links:
-                continue
-            print(f"调试: 进入子目录 {sub_name} -> {sub_norm}")
-            try:
-                self.fetch(
-                    url=sub_url,
-                    password=password,
-                    on_batch=on_batch,
-                    stop_event=stop_event,
-                    _visited_links=_visited_links,
-                    _is_subfolder=True,
-                    _folder_prefix=f"{_folder_prefix}{sub_name}/",
-                )
-            except Exception as sub_err:
-                # 子目录失败不影响主目录流程，尽量继续抓取其它子目录
-                print(f"调试: 子目录抓取失败，已跳过 {sub_norm}，原因: {sub_err}")
-
-        return self.d.files
+        return discovered_subfolders
@@ -0,0 +1,197 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+
+
+# 阶段耗时直方图的桶上限（秒）
+DEFAULT_BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+_PREFIX = "lanzou_"
+
+
+class _NullSpan:
+    """未启用统计时的空计时段，进入/退出不做任何事。"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **labels):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("metrics", "phase", "labels", "http", "started")
+
+    def __init__(self, metrics, phase, labels, http):
+        self.metrics = metrics
+        self.phase = phase
+        self.labels = labels
+        self.http = http
+        self.started = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        labels = dict(self.labels, phase=self.phase)
+        labels.setdefault("outcome", "error" if exc_type else "ok")
+        self.metrics.observe("phase_seconds", elapsed, **labels)
+        if self.http:
+            self.metrics.inc("http_requests", phase=self.phase)
+        return False
+
+    def set(self, **labels):
+        """在计时段内补充标签（如 outcome="html"）。"""
+        self.labels.update(labels)
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一格为 +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape_label(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs, extra=()):
+    items = list(pairs) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in items) + "}"
+
+
+class Metrics:
+    """进程内计时与计数：计时段写入阶段耗时直方图，计数器按标签累加；可导出 JSON / Prometheus 文本。
+
+    未启用时 span() 返回共享的空计时段，inc()/observe() 直接返回，几乎没有开销。
+    """
+
+    def __init__(self, enabled=False, buckets=DEFAULT_BUCKETS_S):
+        self.enabled = enabled
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+            self.started_at = time.time()
+
+    def span(self, phase, http=False, **labels):
+        """计时段：with metrics.span("fn_page", http=True): ...；http=True 时同时计一次 HTTP 请求。"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, phase, labels, http)
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = _Histogram(self.buckets)
+            hist.observe(value)
+
+    def counter_total(self, name, **match):
+        """按名称（及部分标签）汇总计数器。"""
+        want = {(k, str(v)) for k, v in match.items()}
+        with self._lock:
+            return sum(v for (n, labels), v in self._counters.items() if n == name and want <= set(labels))
+
+    def snapshot(self):
+        """导出为可 JSON 序列化的字典（含每文件请求数等派生指标）。"""
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            histograms = []
+            for (name, labels), hist in sorted(self._histograms.items()):
+                histograms.append({
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": hist.count,
+                    "sum": round(hist.sum, 6),
+                    "buckets": {str(le): c for le, c in zip(self.buckets + ("+Inf",), hist.counts)},
+                })
+        files = self.counter_total("files")
+        requests_total = self.counter_total("http_requests")
+        return {
+            "started_at": self.started_at,
+            "counters": counters,
+            "histograms": histograms,
+            "derived": {
+                "files": files,
+                "http_requests": requests_total,
+                "requests_per_file": round(requests_total / files, 3) if files else None,
+            },
+        }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=indent)
+
+    def to_prometheus(self):
+        """Prometheus 文本格式（计数器带 _total 后缀，直方图为累计桶）。"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((k, (list(h.counts), h.count, h.sum)) for k, h in self._histograms.items())
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f"{_PREFIX}{name}_total"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_format_labels(labels)} {value}")
+        for (name, labels), (counts, count, total) in histograms:
+            metric = f"{_PREFIX}{name}"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for le, c in zip(self.buckets + ("+Inf",), counts):
+                cumulative += c
+                lines.append(f"{metric}_bucket{_format_labels(labels, [('le', str(le))])} {cumulative}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """按扩展名写出：.prom / .txt 为 Prometheus 文本，其余为 JSON。"""
+        text = self.to_prometheus() if path.lower().endswith((".prom", ".txt")) else self.to_json()
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write(text)
+        return path
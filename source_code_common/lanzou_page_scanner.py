@@ -0,0 +1,296 @@
+"""页面扫描：正则只在导入时编译一次，每个字段只扫一遍页面，提取分享页上下文、fn 页链接与 ajaxm 参数。
+
+每条正则都以固定字面量开头，re 模块可以先按字面量快速定位再尝试匹配；把所有字段并成一条交替正则
+反而会让 re 在每个字符上逐个分支尝试，实测更慢。变量名引用改为按名缓存的正则，附近窗口用 pos/endpos 检查而不切片。
+"""
+
+import html
+import re
+from functools import lru_cache
+
+
+# ---- 分享页（目录） ----
+
+_AJAX_URL_RE = re.compile(r"filemoreajax\.php(?:\?file=(\d+))?")
+_CONTEXT_KEY_RE = re.compile(r"'(fid|uid|t|k)'\s*:\s*(?:'([^']+)'|(\d+)|([A-Za-z_][A-Za-z0-9_]*))")
+_AJAX_DATA_RE = re.compile(r"data\s*:\s*\{([^}]+)\}", re.S)
+_PAYLOAD_KEY_RE = re.compile(r"['\"]?([A-Za-z0-9_]+)['\"]?\s*:")
+_OPTIONAL_KEY_RES = {name: re.compile(rf"{name}\b") for name in ("ls", "pwd", "vip", "webfoldersign")}
+_SCALAR_RES = {
+    name: re.compile(rf"{name}\s*=\s*(?:['\"]([^'\"]+)['\"]|(\d+))") for name in ("ls", "vip", "webfoldersign")
+}
+_ANCHOR_RE = re.compile(r"<a[^>]+href=['\"]([^'\"]+)['\"][^>]*>", re.I)
+_FOLDER_HREF_RE = re.compile(r"/b[0-9a-z]+", re.I)
+_FOLDER_NAME_RE = re.compile(r"class=['\"]filename['\"][^>]*>(.*?)<div[^>]*class=['\"]filesize['\"]", re.I | re.S)
+_TAG_RE = re.compile(r"<[^>]+>")
+
+BASE_PAYLOAD_KEYS = frozenset({"file", "lx", "fid", "uid", "pg", "rep", "t", "k", "up"})
+
+
+@lru_cache(maxsize=256)
+def _var_string_re(name):
+    return re.compile(rf"var\s+{re.escape(name)}\s*=\s*['\"]([^'\"]+)['\"]")
+
+
+def _word_start(text, pos):
+    return pos == 0 or not (text[pos - 1].isalnum() or text[pos - 1] == "_")
+
+
+def scan_share_page(page_html):
+    """分享页扫描：fid / uid / t / k、列表接口字段与额外字段取值（子目录链接见 scan_folder_links）。
+
+    缺失的字段为 None；fid 优先取 /filemoreajax.php?file=，t / k 优先取变量引用对应的 var 字符串。
+    """
+    page_html = page_html or ""
+    ajax_spans = []
+    fid = None
+    for m in _AJAX_URL_RE.finditer(page_html):
+        ajax_spans.append((m.start(), m.start() + len("filemoreajax.php")))
+        if fid is None and m.group(1) and m.start() > 0 and page_html[m.start() - 1] == "/":
+            fid = m.group(1)
+
+    first = {}  # (字段, 取值形式) -> 首个命中
+    for m in _CONTEXT_KEY_RE.finditer(page_html):
+        key = m.group(1)
+        for form in (2, 3, 4):
+            if m.group(form) is not None:
+                first.setdefault((key, form), m.group(form))
+                break
+        if key == "uid" and ("uid", 0) not in first:
+            value = m.group(2) or m.group(3) or ""
+            if value.isdigit():
+                first["uid", 0] = value
+
+    def _indirect(key):
+        name = first.get((key, 4))
+        if name:
+            m = _var_string_re(name).search(page_html)
+            if m:
+                return m.group(1)
+        return first.get((key, 2))
+
+    return {
+        "fid": fid or first.get(("fid", 3)),
+        "uid": first.get(("uid", 0)),
+        "t": _indirect("t"),
+        "k": _indirect("k"),
+        "payload_keys": _scan_payload_keys(page_html, ajax_spans),
+        "extra_values": _scan_extra_values(page_html),
+    }
+
+
+def _scan_payload_keys(page_html, ajax_spans):
+    """filemoreajax.php 附近 data:{...} 声明的字段；找不到时取基础字段 + 页面出现过的可选字段。"""
+    for start, end in ajax_spans:
+        m = _AJAX_DATA_RE.search(page_html, max(0, start - 500), min(len(page_html), end + 800))
+        if m:
+            keys = {k.group(1) for k in _PAYLOAD_KEY_RE.finditer(m.group(1))}
+            if keys:
+                return keys
+            break
+    keys = set(BASE_PAYLOAD_KEYS)
+    for name, pattern in _OPTIONAL_KEY_RES.items():
+        if any(_word_start(page_html, m.start()) for m in pattern.finditer(page_html)):
+            keys.add(name)
+    return keys
+
+
+def _scan_extra_values(page_html):
+    """ls / vip / webfoldersign 的赋值：字符串赋值优先于数字赋值，只认完整的变量名（class= 不算 ls=）。"""
+    out = {}
+    for name, pattern in _SCALAR_RES.items():
+        number = None
+        for m in pattern.finditer(page_html):
+            if not _word_start(page_html, m.start()):
+                continue
+            if m.group(1) is not None:
+                out[name] = m.group(1)
+                break
+            if number is None:
+                number = m.group(2)
+        else:
+            if number is not None:
+                out[name] = number
+    return out
+
+
+def scan_folder_links(page_html):
+    """分享页中的子目录链接（附近有 mbxfolder / folderdown 标记），返回 [(href, 目录名)]，href 未做 urljoin。"""
+    page_html = page_html or ""
+    out = []
+    size = len(page_html)
+    for m in _ANCHOR_RE.finditer(page_html):
+        href = m.group(1).strip()
+        if not href or href.startswith("javascript:") or href.startswith("#"):
+            continue
+        if not _FOLDER_HREF_RE.search(href):
+            continue
+        start = max(0, m.start() - 260)
+        end = min(size, m.end() + 720)
+        if page_html.find("mbxfolder", start, end) < 0 and page_html.find("folderdown", start, end) < 0:
+            continue
+        # 先在链接之后找目录名，避免相邻目录时取到前一个目录的名字
+        name_match = _FOLDER_NAME_RE.search(page_html, m.end(), end) or _FOLDER_NAME_RE.search(page_html, start, end)
+        name = html.unescape(_TAG_RE.sub("", name_match.group(1))).strip() if name_match else ""
+        out.append((href, name))
+    return out
+
+
+# ---- 文件页 → fn 页链接 ----
+
+_IFRAME_SRC_RE = re.compile(r"<iframe[^>]+src=['\"]([^'\"]+)", re.I)
+_FN_RE = re.compile(r"((?:https?://[^\s'\"]+)?/?fn\?[A-Za-z0-9_\-+=/%?&]+)", re.I)
+_FN_LOOSE_RE = re.compile(r"(/fn\?[^'\"\s]+)", re.I)
+_JS_REDIRECT_RE = re.compile(r"location\.href\s*=\s*['\"]([^'\"]+)['\"]")
+# 解码只会改变含这些片段的页面
+_ESCAPE_MARKERS = ("&", "\\/", "\\u002", "\\x2", "\\u003")
+
+
+def _clean_url(raw):
+    return html.unescape(raw).replace("\\/", "/").strip()
+
+
+def _fn_search_start(text):
+    """fn? 链接可能的最早起点：首个 fn?（不区分大小写）往前退到空白或引号处；没有 fn? 时返回 -1。"""
+    hits = [i for i in (text.find(s) for s in ("fn?", "Fn?", "fN?", "FN?")) if i >= 0]
+    if not hits:
+        return -1
+    pos = min(hits)
+    while pos > 0 and not (text[pos - 1].isspace() or text[pos - 1] in "'\""):
+        pos -= 1
+    return pos
+
+
+def _find_fn_url(text):
+    m = _IFRAME_SRC_RE.search(text)
+    if m:
+        src = _clean_url(m.group(1))
+        if "fn?" in src:
+            return src
+    # _FN_RE 以可选的 http 前缀开头，无法按字面量定位，整页扫描很慢；先用 str.find 找到起点
+    start = _fn_search_start(text)
+    if start < 0:
+        return None
+    m = _FN_RE.search(text, start) or _FN_LOOSE_RE.search(text, start)
+    return _clean_url(m.group(1)) if m else None
+
+
+def decode_escaped_html(text):
+    """还原页面中转义过的斜杠与冒号（\\/、\\u002F、\\x2f 等）。"""
+    if not text:
+        return ""
+    s = html.unescape(text)
+    s = s.replace("\\/", "/")
+    s = s.replace("\\u002F", "/").replace("\\u002f", "/")
+    s = s.replace("\\x2f", "/").replace("\\x2F", "/")
+    s = s.replace("\\u003a", ":").replace("\\u003A", ":")
+    return s
+
+
+def scan_fn_url(page_html):
+    """文件页中的 fn 页链接：原始 HTML 找不到且含转义片段时，才在解码副本上再找一次。"""
+    if not page_html:
+        return None
+    found = _find_fn_url(page_html)
+    if found or not any(marker in page_html for marker in _ESCAPE_MARKERS):
+        return found
+    return _find_fn_url(decode_escaped_html(page_html))
+
+
+def scan_js_redirect(page_html):
+    """页面中 location.href = '...' 的跳转目标（未做 urljoin）。"""
+    m = _JS_REDIRECT_RE.search(page_html or "")
+    return _clean_url(m.group(1)) if m else None
+
+
+# ---- fn 页 / 脚本 → ajaxm 参数 ----
+
+# 每个字段按优先级排列，取第一条命中的正则
+_FILE_ID_RES = (
+    re.compile(r"url\s*:\s*['\"]/ajaxm\.php\?file=(\d{6,})['\"]"),
+    re.compile(r"/ajaxm\.php\?file=(\d{6,})"),
+    re.compile(r"\bfile\s*[:=]\s*['\"]?(\d{6,})"),
+    re.compile(r"\bfid\s*[:=]\s*['\"]?(\d{6,})"),
+)
+_FILE_ID_VAR_RE = re.compile(r"/ajaxm\.php\?file=['\"]\s*\+\s*([A-Za-z_][A-Za-z0-9_]*)")
+_AJAX_PARAM_RES = (
+    ("ajaxdata", (
+        re.compile(r"var\s+ajaxdata\s*=\s*['\"]([^'\"]+)['\"]", re.I),
+        re.compile(r"websignkey\s*[:=]\s*['\"]([^'\"]+)['\"]", re.I),
+        re.compile(r"signs\s*[:=]\s*['\"]([^'\"]+)['\"]", re.I),
+    )),
+    ("wp_sign", (
+        re.compile(r"var\s+wp_sign\s*=\s*['\"]([^'\"]+)['\"]", re.I),
+        re.compile(r"\bsign\s*[:=]\s*['\"]([^'\"]+)['\"]", re.I),
+    )),
+    ("websign", (  # 部分站点要求固定值，如 "2"
+        re.compile(r"var\s+websign\s*=\s*['\"]([^'\"]*)['\"]", re.I),
+        re.compile(r"['\"]websign['\"]\s*[:=]\s*['\"]([^'\"]*)['\"]", re.I),
+        re.compile(r"['\"]websign['\"]\s*[:=]\s*(\d+)", re.I),
+    )),
+)
+_SCRIPT_BODY_RE = re.compile(r"<script[^>]*>([\s\S]*?)</script>", re.I)
+_SCRIPT_SRC_RE = re.compile(r"<script[^>]+src=['\"]([^'\"]+)['\"]", re.I)
+# 不含这些片段（不区分大小写）的脚本不可能提取出参数，直接跳过
+_AJAX_MARKERS = ("ajaxm", "file", "fid", "sign", "ajaxdata")
+
+
+@lru_cache(maxsize=64)
+def _var_number_re(name):
+    return re.compile(rf"\b(?:var\s+)?{re.escape(name)}\s*=\s*['\"]?(\d{{6,}})")
+
+
+def scan_ajax_file_id(text):
+    """JS 文本中 ajaxm.php 的 file 参数（含 '/ajaxm.php?file=' + 变量 的拼接写法）。"""
+    if not text:
+        return None
+    for pattern in _FILE_ID_RES:
+        m = pattern.search(text)
+        if m:
+            return m.group(1)
+    m = _FILE_ID_VAR_RE.search(text)
+    if m:
+        m = _var_number_re(m.group(1)).search(text)
+        if m:
+            return m.group(1)
+    return None
+
+
+def scan_ajax_params(text):
+    """从一段 JS 文本中提取 downprocess 参数（file_id / ajaxdata / wp_sign / websign）。"""
+    if not text:
+        return {}
+    out = {}
+    file_id = scan_ajax_file_id(text)
+    if file_id:
+        out["file_id"] = file_id
+    for field, patterns in _AJAX_PARAM_RES:
+        for pattern in patterns:
+            m = pattern.search(text)
+            if m:
+                out[field] = html.unescape(m.group(1)).strip()
+                break
+    return out
+
+
+def scan_inline_ajax_params(fn_html):
+    """逐个内联脚本提取参数并合并（先出现者优先），凑齐 file_id / ajaxdata / wp_sign 即停止。"""
+    best = {}
+    for m in _SCRIPT_BODY_RE.finditer(fn_html or ""):
+        body = m.group(1)
+        if not body:
+            continue
+        lowered = body.lower()
+        if not any(marker in lowered for marker in _AJAX_MARKERS):
+            continue
+        for key, value in scan_ajax_params(body).items():
+            if value and key not in best:
+                best[key] = value
+        if all(best.get(k) for k in ("file_id", "ajaxdata", "wp_sign")):
+            break
+    return best
+
+
+def scan_script_srcs(fn_html):
+    """fn 页外链脚本的 src（原样，未做 urljoin）。"""
+    return _SCRIPT_SRC_RE.findall(fn_html or "")
@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import deque
+
+
+class _FileProgress:
+    __slots__ = (
+        "key", "name", "path", "downloaded", "initial", "total", "status", "percent",
+        "done", "seq", "updated_at", "polled_seq", "polled_at", "callback_at",
+    )
+
+    def __init__(self, key, name, downloaded):
+        self.key = key
+        self.name = name  # 仅用于显示；不同子目录可能有同名文件
+        self.path = None
+        self.downloaded = downloaded
+        self.initial = downloaded  # 首次上报时已有的字节（续传/跳过），不计入吞吐
+        self.total = 0
+        self.status = ""
+        self.percent = 0
+        self.done = False
+        self.seq = 0
+        self.updated_at = 0.0
+        self.polled_seq = 0
+        self.polled_at = 0.0
+        self.callback_at = 0.0
+
+
+class ProgressAggregator:
+    """下载进度汇总：工作线程只改写共享计数（不排队、不等 UI），界面按固定频率拉取快照。
+
+    条目按目标路径区分（没有路径时才退回文件名），不同子目录下的同名文件各自计数。
+    """
+
+    def __init__(self, max_updates_per_s=8.0, speed_window_s=3.0):
+        self.min_interval_s = 1.0 / max(0.1, float(max_updates_per_s))
+        self.speed_window_s = float(speed_window_s)
+        self._lock = threading.Lock()  # 仅在新建文件条目与 UI 取样时使用
+        self.begin()
+
+    def begin(self, expected_bytes=0):
+        """开始一批下载；expected_bytes 为列表大小估算的总字节数（未知为 0），用于 ETA。"""
+        with self._lock:
+            self._files = {}
+            self._samples = deque()
+            self.expected_bytes = int(expected_bytes or 0)
+            self.abandoned_bytes = 0  # 失败/取消文件未下载的部分，不再计入剩余量
+            self.started_at = time.monotonic()
+
+    @staticmethod
+    def key_for(file_name, file_path=None):
+        return file_path or file_name
+
+    def _entry(self, key, file_name, downloaded):
+        st = self._files.get(key)
+        if st is None:
+            with self._lock:
+                st = self._files.setdefault(key, _FileProgress(key, file_name, downloaded))
+        return st
+
+    def publish(self, file_name, downloaded, total=0, status="下载中...", file_path=None, percent=None, done=False):
+        """工作线程上报进度，只做几次属性赋值。"""
+        st = self._entry(self.key_for(file_name, file_path), file_name, downloaded)
+        if downloaded < st.initial:
+            st.initial = downloaded  # 重新下载时从更小的位置起算
+        st.downloaded = downloaded
+        if total:
+            st.total = total
+        if file_path:
+            st.path = file_path
+        st.status = status
+        if percent is not None:
+            st.percent = percent
+        elif st.total:
+            st.percent = int(downloaded * 100 / st.total)
+        st.done = done
+        st.updated_at = time.monotonic()
+        st.seq += 1
+
+    def finish(self, key, status):
+        """标记文件结束（失败/取消），已计字节保持不变；key 为目标路径（见 key_for）。"""
+        st = self._files.get(key)
+        if st is None or st.done:
+            return
+        if st.total:
+            with self._lock:
+                self.abandoned_bytes += max(0, st.total - st.downloaded)
+        st.status = status
+        st.done = True
+        st.updated_at = time.monotonic()
+        st.seq += 1
+
+    def should_emit(self, key, now=None):
+        """旧式回调的每文件频率限制：距上次转发不足最小间隔时返回 False。"""
+        st = self._files.get(key)
+        if st is None:
+            return True
+        now = time.monotonic() if now is None else now
+        if now - st.callback_at < self.min_interval_s:
+            return False
+        st.callback_at = now
+        return True
+
+    def poll(self, now=None):
+        """UI 侧取样，返回 (有变化的文件列表, 汇总)。
+
+        每个文件最多每 min_interval_s 出现一次，完成/状态变化不受限；文件按最近更新时间排序。
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            files = list(self._files.values())
+        updates = []
+        downloaded = transferred = remaining = active = 0
+        for st in files:
+            downloaded += st.downloaded
+            transferred += max(0, st.downloaded - st.initial)
+            if not st.done:
+                active += 1
+                if st.total:
+                    remaining += max(0, st.total - st.downloaded)
+            if st.seq == st.polled_seq:
+                continue
+            if not st.done and now - st.polled_at < self.min_interval_s:
+                continue
+            st.polled_seq = st.seq
+            st.polled_at = now
+            updates.append({
+                "key": st.key,
+                "name": st.name,
+                "path": st.path,
+                "downloaded": st.downloaded,
+                "total": st.total,
+                "percent": st.percent,
+                "status": st.status,
+                "done": st.done,
+                "updated_at": st.updated_at,
+            })
+        updates.sort(key=lambda u: u["updated_at"])
+
+        with self._lock:
+            self._samples.append((now, transferred))
+            while len(self._samples) > 2 and now - self._samples[0][0] > self.speed_window_s:
+                self._samples.popleft()
+            t0, b0 = self._samples[0]
+        speed = (transferred - b0) / (now - t0) if now > t0 else 0.0
+        if self.expected_bytes:
+            remaining = max(remaining, self.expected_bytes - downloaded - self.abandoned_bytes)
+        eta = remaining / speed if speed > 0 and remaining else None
+        return updates, {
+            "active": active,
+            "downloaded": downloaded,
+            "transferred": transferred,
+            "expected": self.expected_bytes,
+            "speed_bps": max(0.0, speed),
+            "eta_s": eta,
+        }
@@ -0,0 +1,281 @@
+import threading
+import time
+import weakref
+from collections import defaultdict
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """令牌桶：每秒补充 rate_bps 个字节令牌，最多攒 burst_s 秒；rate_bps 为 0 表示不限。
+
+    预约式扣减：令牌不足时记为欠账，返回还清欠账所需的等待秒数，由调用方自行等待（线程 sleep 或 asyncio.sleep）。
+    """
+
+    def __init__(self, rate_bps=0, burst_s=1.0):
+        self.burst_s = max(0.05, float(burst_s))
+        self.rate_bps = 0
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.set_rate(rate_bps)
+
+    def set_rate(self, rate_bps):
+        self.rate_bps = max(0, int(rate_bps or 0))
+        # 调整限速时清掉欠账与积攒，新速率从当前时刻开始生效
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+
+    def reserve(self, n, now):
+        """扣减 n 个令牌（调用方持锁），返回需要等待的秒数。"""
+        if not self.rate_bps:
+            return 0.0
+        capacity = self.rate_bps * self.burst_s
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * self.rate_bps)
+        self.updated = now
+        self.tokens -= n
+        return -self.tokens / self.rate_bps if self.tokens < 0 else 0.0
+
+
+class BandwidthLimiter:
+    """全局与按文件的下载限速（字节/秒，运行中可调）；文件按目标路径区分，同一文件的各分段共用一个文件级令牌桶。"""
+
+    def __init__(self, global_bps=0, per_file_bps=0, burst_s=1.0, metrics=None):
+        self.burst_s = burst_s
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._global = TokenBucket(global_bps, burst_s)
+        self.per_file_bps = max(0, int(per_file_bps or 0))
+        self._file_rates = {}  # 单独设置过限速的文件
+        self._files = {}  # 目标路径 -> TokenBucket（下载结束后 forget）
+        self._gen = 0  # 限速变化时递增，等待中的线程据此提前结束等待
+
+    @property
+    def global_bps(self):
+        return self._global.rate_bps
+
+    def set_global_rate(self, bps):
+        with self._lock:
+            self._global.set_rate(bps)
+            self._gen += 1
+
+    def set_per_file_rate(self, bps):
+        """默认的单文件限速（未单独设置的文件）。"""
+        with self._lock:
+            self.per_file_bps = max(0, int(bps or 0))
+            for key, bucket in self._files.items():
+                if key not in self._file_rates:
+                    bucket.set_rate(self.per_file_bps)
+            self._gen += 1
+
+    def set_file_rate(self, key, bps):
+        """单独设置某个文件的限速；bps 为 None 时恢复默认。"""
+        with self._lock:
+            if bps is None:
+                self._file_rates.pop(key, None)
+            else:
+                self._file_rates[key] = max(0, int(bps))
+            bucket = self._files.get(key)
+            if bucket is not None:
+                bucket.set_rate(self._file_rates.get(key, self.per_file_bps))
+            self._gen += 1
+
+    def forget(self, key):
+        """文件下载结束后释放其令牌桶（单独设置的限速保留）。"""
+        with self._lock:
+            self._files.pop(key, None)
+
+    @property
+    def active(self):
+        return bool(self._global.rate_bps or self.per_file_bps or self._file_rates)
+
+    def reserve(self, key, n):
+        """为 key 预约 n 字节，返回需要等待的秒数（取文件级与全局中较长者）。"""
+        if not self.active:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            bucket = self._files.get(key)
+            if bucket is None:
+                bucket = self._files[key] = TokenBucket(self._file_rates.get(key, self.per_file_bps), self.burst_s)
+            delay = max(bucket.reserve(n, now), self._global.reserve(n, now))
+        if delay and self.metrics is not None:
+            self.metrics.observe("throttle_wait_s", delay)
+        return delay
+
+    def throttle(self, key, n, cancel_event=None):
+        """预约并阻塞等待；取消或限速被调整时提前返回。"""
+        delay = self.reserve(key, n)
+        if delay <= 0:
+            return
+        gen = self._gen
+        deadline = time.monotonic() + delay
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or gen != self._gen or (cancel_event is not None and cancel_event.is_set()):
+                return
+            time.sleep(min(remaining, 0.2))
+
+    async def athrottle(self, key, n, cancel_event=None):
+        """throttle() 的协程版：分片 asyncio.sleep 等待，同样在取消或限速被调整时提前返回。"""
+        import asyncio
+
+        delay = self.reserve(key, n)
+        if delay <= 0:
+            return
+        gen = self._gen
+        deadline = time.monotonic() + delay
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or gen != self._gen or (cancel_event is not None and cancel_event.is_set()):
+                return
+            await asyncio.sleep(min(remaining, 0.2))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "global_bps": self._global.rate_bps,
+                "per_file_bps": self.per_file_bps,
+                "file_rates": dict(self._file_rates),
+                "active_files": len(self._files),
+            }
+
+
+def _default_host_key(url):
+    try:
+        return urlparse(url).netloc.lower().strip()
+    except Exception:
+        return ""
+
+
+class HostConcurrencyLimiter:
+    """按主机限制同时在途的请求数（流式响应在关闭前一直占用名额），上限运行中可调。
+
+    上限按主机单独设置，未设置时取所属主机类别（share / download / asset）的默认值；0 表示不限。
+    """
+
+    def __init__(self, class_limits=None, key_fn=None, classify_fn=None, metrics=None):
+        self.class_limits = dict(class_limits or {})
+        self.host_limits = {}
+        self.key_fn = key_fn or _default_host_key
+        self.classify_fn = classify_fn
+        self.metrics = metrics
+        self._cond = threading.Condition()
+        self._active = defaultdict(int)
+
+    def set_limit(self, host_or_class, limit):
+        """设置某个主机（或主机类别）的并发上限；主机级 limit 为 None 时恢复按类别取值。"""
+        with self._cond:
+            if host_or_class in self.class_limits:
+                self.class_limits[host_or_class] = max(0, int(limit or 0))
+            elif limit is None:
+                self.host_limits.pop(host_or_class, None)
+            else:
+                self.host_limits[host_or_class] = max(0, int(limit))
+            self._cond.notify_all()
+
+    def _limit_for(self, host, host_class):
+        if host in self.host_limits:
+            return self.host_limits[host]
+        return self.class_limits.get(host_class, 0)
+
+    def _try_take(self, host, host_class):
+        """调用方持锁：有空位则占用并返回 True。"""
+        limit = self._limit_for(host, host_class)
+        if limit and self._active[host] >= limit:
+            return False
+        self._active[host] += 1
+        return True
+
+    def _observe_wait(self, started, host_class):
+        if started is not None and self.metrics is not None:
+            self.metrics.observe("host_slot_wait_s", time.monotonic() - started, host_class=host_class)
+
+    def acquire(self, url):
+        """占用 url 所在主机的一个名额（必要时等待），返回 release() 用的主机名。"""
+        host = self.key_fn(url)
+        host_class = self.classify_fn(url) if self.classify_fn else ""
+        started = None
+        with self._cond:
+            while not self._try_take(host, host_class):
+                if started is None:
+                    started = time.monotonic()
+                self._cond.wait(0.5)
+        self._observe_wait(started, host_class)
+        return host
+
+    async def acquire_async(self, url, poll_s=0.05):
+        """acquire() 的协程版：名额已满时用 asyncio.sleep 轮询，不阻塞事件循环；与线程请求共用同一份计数。"""
+        import asyncio
+
+        host = self.key_fn(url)
+        host_class = self.classify_fn(url) if self.classify_fn else ""
+        started = None
+        while True:
+            with self._cond:
+                if self._try_take(host, host_class):
+                    break
+            if started is None:
+                started = time.monotonic()
+            await asyncio.sleep(poll_s)
+        self._observe_wait(started, host_class)
+        return host
+
+    def slot(self, url):
+        """async with limiter.slot(url): 占用名额，退出时释放（asyncio 引擎用）。"""
+        return _AsyncHostSlot(self, url)
+
+    def release(self, host):
+        with self._cond:
+            self._active[host] = max(0, self._active[host] - 1)
+            if not self._active[host]:
+                del self._active[host]
+            self._cond.notify_all()
+
+    def hold_until_closed(self, response, host):
+        """流式响应：名额保留到 response.close()（或响应被回收）时释放，只释放一次。"""
+        pending = [host]  # list.pop 是原子的：close 与回收同时发生时也只释放一次
+
+        def _release():
+            try:
+                self.release(pending.pop())
+            except IndexError:
+                pass
+
+        # 只持有弱引用与类上的 close，避免响应与包装函数成环而推迟回收
+        ref = weakref.ref(response)
+        close = type(response).close
+
+        def _close():
+            r = ref()
+            try:
+                if r is not None:
+                    close(r)
+            finally:
+                _release()
+
+        response.close = _close
+        weakref.finalize(response, _release)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "active": dict(self._active),
+                "class_limits": dict(self.class_limits),
+                "host_limits": dict(self.host_limits),
+            }
+
+
+class _AsyncHostSlot:
+    __slots__ = ("limiter", "url", "host")
+
+    def __init__(self, limiter, url):
+        self.limiter = limiter
+        self.url = url
+        self.host = None
+
+    async def __aenter__(self):
+        self.host = await self.limiter.acquire_async(self.url)
+        return self.host
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.limiter.release(self.host)
+        return False
@@ -0,0 +1,266 @@
+import os
+import re
+import threading
+
+try:
+    from source_code_common.lanzou_errors import is_cancelled
+except Exception:
+    from lanzou_errors import is_cancelled
+
+
+# 出队策略：selection 按选择顺序；shortest_first 小文件优先（大小未知的排最后）；
+# folder 按目录（目录名自然排序）成组；fair 大小文件交替，大文件同时只占 fair_large_workers 个线程
+SCHEDULE_POLICIES = ("selection", "shortest_first", "folder", "fair")
+
+
+def _natural_key(text):
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", text or "")]
+
+
+def _queue_key(file_info):
+    return file_info.get("link") or file_info.get("index")
+
+
+class DownloadQueue:
+    """按调度策略出队的待下载队列（线程安全）；file_info["priority"] 越大越先出队，可在运行中调整。"""
+
+    def __init__(self, files, policy="selection", size_of=None, fair_large_bytes=64 * 1024 * 1024,
+                 fair_small_per_large=4, fair_large_workers=1):
+        if policy not in SCHEDULE_POLICIES:
+            raise ValueError(f"未知的调度策略: {policy}")
+        self.policy = policy
+        self.fair_large_bytes = int(fair_large_bytes)
+        self.fair_small_per_large = max(0, int(fair_small_per_large))
+        self.fair_large_workers = max(1, int(fair_large_workers))
+        self._lock = threading.Lock()
+        self._pending = []
+        for pos, file_info in enumerate(files):
+            self._pending.append({
+                "pos": pos,
+                "file": file_info,
+                "size": size_of(file_info.get("size")) if size_of else None,
+                "folder": _natural_key(file_info.get("folder_path", "")),
+                "priority": int(file_info.get("priority") or 0),
+            })
+        self._large_active = 0
+        self._small_since_large = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _is_large(self, entry):
+        return entry["size"] is not None and entry["size"] >= self.fair_large_bytes
+
+    def _choose(self, pending, small_since_large, large_active):
+        top = max(e["priority"] for e in pending)
+        cands = [e for e in pending if e["priority"] == top]
+        if self.policy == "shortest_first":
+            return min(cands, key=lambda e: (e["size"] is None, e["size"] or 0, e["pos"]))
+        if self.policy == "folder":
+            return min(cands, key=lambda e: (e["folder"], e["pos"]))
+        if self.policy == "fair":
+            small = [e for e in cands if not self._is_large(e)]
+            large = [e for e in cands if self._is_large(e)]
+            # 小文件先走；攒够 fair_small_per_large 个小文件且大文件线程未占满时放一个大文件，小文件取完后不再限制
+            take_large = large and (
+                not small
+                or (large_active < self.fair_large_workers and small_since_large >= self.fair_small_per_large)
+            )
+            return min(large if take_large else small, key=lambda e: e["pos"])
+        return min(cands, key=lambda e: e["pos"])
+
+    def _taken(self, entry, state):
+        if self._is_large(entry):
+            state[0] = 0
+            state[1] += 1
+        else:
+            state[0] += 1
+
+    def pop(self):
+        """取出下一个 (pos, file_info, 是否大文件)；队列为空时返回 None。"""
+        with self._lock:
+            if not self._pending:
+                return None
+            entry = self._choose(self._pending, self._small_since_large, self._large_active)
+            self._pending.remove(entry)
+            state = [self._small_since_large, self._large_active]
+            self._taken(entry, state)
+            self._small_since_large, self._large_active = state
+            return entry["pos"], entry["file"], self._is_large(entry)
+
+    def done(self, large):
+        """pop() 取出的文件结束后调用（fair 策略据此释放大文件线程名额）。"""
+        if large:
+            with self._lock:
+                self._large_active = max(0, self._large_active - 1)
+
+    def ordered(self):
+        """按当前策略与优先级预计的出队顺序 [(pos, file_info)]（假设进行中的文件都不结束）。"""
+        with self._lock:
+            pending = list(self._pending)
+            state = [self._small_since_large, self._large_active]
+            out = []
+            while pending:
+                entry = self._choose(pending, state[0], state[1])
+                pending.remove(entry)
+                self._taken(entry, state)
+                out.append((entry["pos"], entry["file"]))
+            return out
+
+    def set_priority(self, files, priority):
+        """调整仍在排队的文件的优先级，返回调整的数量。"""
+        keys = {_queue_key(f) for f in files}
+        keys.discard(None)
+        changed = 0
+        with self._lock:
+            for entry in self._pending:
+                if _queue_key(entry["file"]) in keys:
+                    entry["priority"] = int(priority)
+                    changed += 1
+        return changed
+
+    def set_policy(self, policy):
+        if policy not in SCHEDULE_POLICIES:
+            raise ValueError(f"未知的调度策略: {policy}")
+        with self._lock:
+            self.policy = policy
+
+
+class LanzouDownloadScheduler:
+    """有界工作线程池下载调度（GUI 与无界面调用方共用）。"""
+
+    def __init__(self, downloader, max_workers=None):
+        self.d = downloader
+        if max_workers is None:
+            max_workers = downloader.download_config.max_workers
+        self.max_workers = max(1, int(max_workers or 1))
+        self._lock = threading.Lock()
+        self.queue = None
+        self._prefetcher = None
+
+    def reorder(self, files=None, priority=None, policy=None):
+        """运行中调整排队文件的优先级或出队策略，并按新顺序重排预取；返回调整的文件数。"""
+        queue = self.queue
+        if queue is None:
+            return 0
+        changed = 0
+        if policy is not None:
+            queue.set_policy(policy)
+        if files:
+            changed = queue.set_priority(files, priority or 0)
+        prefetcher = self._prefetcher
+        if prefetcher is not None:
+            prefetcher.reorder([f for _, f in queue.ordered()])
+        return changed
+
+    def run(self, files, download_dir="downloads", on_file_done=None):
+        """并发下载 files，返回统计结果；取消通过 downloader.cancel_event 触发。
+
+        取消信号由调用方在开始时清除（clear_cancel），这里不清除，开始前发出的取消同样生效；
+        被取消中断或未执行的文件在结果中为 None，计入 cancelled 而不是 failed。
+        """
+        d = self.d
+        files = list(files or [])
+        total = len(files)
+        results = [None] * total
+        state = {"finished": 0, "succeeded": 0}
+        stop_event = d.cancel_event
+
+        work = d.create_download_queue(files)
+        self.queue = work
+
+        d.progress.begin(sum(d.parse_size_bytes(f.get("size")) or 0 for f in files))
+
+        cfg = d.download_config
+        prefetcher = None
+        if cfg.prefetch_window > 0 and total > 1:
+            def _prefetch_resolve(file_info):
+                # 目标文件已存在（重复运行）时不提链，下载时直接跳过
+                if os.path.exists(d.download_core._resolve_target_path(file_info, download_dir)[0]):
+                    return None
+                return d.resolve_real_url(file_info, download_dir)
+
+            prefetcher = d.create_prefetch_manager(resolve_fn=_prefetch_resolve)
+            prefetcher.feed([f for _, f in work.ordered()])
+            prefetcher.start()
+            self._prefetcher = prefetcher
+
+        def _report(file_info, success):
+            with self._lock:
+                state["finished"] += 1
+                if success:
+                    state["succeeded"] += 1
+                finished, succeeded = state["finished"], state["succeeded"]
+            if d.global_progress_callback:
+                try:
+                    d.global_progress_callback(finished, total, succeeded)
+                except Exception:
+                    pass
+            if callable(on_file_done):
+                try:
+                    on_file_done(file_info, success)
+                except Exception:
+                    pass
+
+        def _worker():
+            while not stop_event.is_set():
+                item = work.pop()
+                if item is None:
+                    return
+                pos, file_info, large = item
+                cancelled = False
+                try:
+                    real_url = None
+                    if prefetcher is not None:
+                        real_url = prefetcher.take(file_info, wait_s=cfg.prefetch_wait_s)
+                    success = bool(d.download_single_file_optimized(
+                        file_info,
+                        download_dir,
+                        prefetched_real_url=real_url,
+                    ))
+                except Exception as e:
+                    # 只有下载链路因取消而停止才算取消；取消前已经发生的错误仍计入失败
+                    cancelled = is_cancelled(e)
+                    if not cancelled:
+                        print(f"调度下载 {file_info.get('name')} 时出错: {e}")
+                    success = False
+                work.done(large)
+                if not success:
+                    file_path = d.download_core._resolve_target_path(file_info, download_dir)[0]
+                    d.progress.finish(file_path, "已取消" if cancelled else "下载失败")
+                    if cancelled:
+                        # 中途取消：结果保持 None，计入 cancelled
+                        continue
+                results[pos] = success
+                _report(file_info, success)
+
+        worker_count = min(self.max_workers, total) if total else 0
+        print(f"下载调度: 共 {total} 个文件，并发 {worker_count}，顺序 {work.policy}")
+        threads = [
+            threading.Thread(target=_worker, name=f"lanzou-dl-{i}", daemon=True)
+            for i in range(worker_count)
+        ]
+        try:
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            if prefetcher is not None:
+                prefetcher.stop()
+            self._prefetcher = None
+
+        cancelled = sum(1 for r in results if r is None)
+        if cancelled:
+            print(f"下载调度: 已取消 {cancelled} 个文件（未开始或中途中断）")
+        return {
+            "total": total,
+            "succeeded": state["succeeded"],
+            "failed": state["finished"] - state["succeeded"],
+            "cancelled": cancelled,
+            "results": [
+                {"file": f, "success": r}
+                for f, r in zip(files, results)
+            ],
+        }
@@ -11,9 +11,11 @@ class FileItem:
     size: str
     time: str
     ajax_file_id: Optional[str] = None
+    folder_path: str = ""  # 所在子目录（如 "卷1/"），根目录为空
+    relative_path: str = ""  # 子目录内文件的相对路径，根目录为空
 
     def to_dict(self):
-        return {
+        out = {
             "index": self.index,
             "name": self.name,
             "link": self.link,
@@ -21,13 +23,96 @@ class FileItem:
             "time": self.time,
             "ajax_file_id": self.ajax_file_id,
         }
+        if self.folder_path:
+            out["folder_path"] = self.folder_path
+            out["relative_path"] = self.relative_path
+        return out
 
 
 @dataclass
 class ListFetchConfig:
     """列表获取的节奏与策略配置。"""
-    page_interval_s: Tuple[float, float] = (1.0, 2.0)  # 模拟“点更多”
+    page_interval_s: Tuple[float, float] = (1.0, 2.0)  # 模拟“点更多”（自适应节奏的初始值）
     zt4_wait_s: Tuple[float, float] = (1.0, 2.0)
     max_pages: int = 500
     page_size: int = 50
     ctx_refresh_cooldown_s: float = 3.0
+    min_page_interval_s: float = 0.2  # 自适应节奏：间隔下限
+    max_page_interval_s: float = 8.0  # 自适应节奏：退避上限
+    page_interval_step_s: float = 0.2  # 每次干净响应缩短的间隔
+    max_inflight_pages: int = 3  # 同时在途的翻页请求上限（1 表示严格串行）
+    folder_workers: int = 4  # 并发抓取的子目录数
+    catalog_enabled: bool = True  # 持久化目录清单（增量刷新与变化比对）
+    incremental: bool = False  # 默认是否增量刷新（某页全为已知文件即停止翻页）
+    incremental_max_age_s: float = 24 * 3600.0  # 距上次扫描到末页超过该时长时，增量刷新改为全量（发现已删除的文件）
+    stream_pending_pages: int = 4  # iter_files 最多缓冲的未消费页数（背压）
+
+
+@dataclass
+class DownloadConfig:
+    """下载调度相关配置。"""
+    max_workers: int = 3  # 同时进行的下载数
+    schedule_policy: str = "selection"  # 出队顺序（见 lanzou_scheduler.SCHEDULE_POLICIES）
+    fair_large_bytes: int = 64 * 1024 * 1024  # fair 策略中视为大文件的大小
+    fair_small_per_large: int = 4  # fair 策略每放行一个大文件前先下载的小文件数
+    fair_large_workers: int = 1  # fair 策略中小文件未取完时大文件最多占用的下载线程数
+    prefetch_window: int = 4  # 提前解析直链的前瞻窗口（0 表示关闭预取）
+    prefetch_workers: int = 2  # 预取解析线程数
+    prefetch_ttl_s: float = 300.0  # 直链会失效，超过该时长的预取结果视为过期
+    prefetch_wait_s: float = 20.0  # 当前文件正在预取时的最长等待
+    max_resume_attempts: int = 3  # 单次下载内断线后按 Range 续传的次数
+    segment_count: int = 4  # 大文件分段连接数（1 表示关闭分段下载）
+    segment_threshold_bytes: int = 32 * 1024 * 1024  # 超过该大小才启用分段
+    segment_retries: int = 3  # 单个分段失败后的重试次数
+    segment_refresh_after: int = 2  # 同一直链上连续失败这么多次才重新提链（403/404/410/HTML 立即重新提链）
+    segment_checkpoint_bytes: int = 8 * 1024 * 1024  # 分段下载每写入这么多字节保存一次断点元数据
+    segment_checkpoint_s: float = 2.0  # 或距上次保存超过该秒数
+    prevalidate: bool = False  # 下载前单独校验直链（HEAD / Range 0-0）；关闭时由下载请求的首个响应校验
+    validation_policy_ttl_s: float = 7 * 86400.0  # 持久化的按域名校验策略有效期
+    url_cache_enabled: bool = True  # 下载目录下持久化缓存已解析直链
+    url_cache_ttl_s: float = 1200.0
+    url_cache_max_entries: int = 5000
+    script_cache_max_entries: int = 64  # fn 页外链脚本缓存
+    script_cache_max_bytes: int = 4 * 1024 * 1024
+    script_cache_ttl_s: float = 1800.0  # 无缓存头时的默认有效期
+    script_cache_honor_http: bool = True  # 遵循 Cache-Control / ETag / Last-Modified
+    browser_tabs: int = 3  # 浏览器兜底的标签页池大小（同时进行的兜底提链数），setup_driver 时预先打开
+    browser_tab_wait_s: float = 30.0  # 等待空闲标签页的上限
+    browser_anchor_wait_s: float = 10.0  # 等待下载链接出现的上限（出现即返回，不再固定休眠）
+    io_chunk_min_bytes: int = 64 * 1024  # 读缓冲区初始/下限
+    io_chunk_max_bytes: int = 4 * 1024 * 1024  # 读缓冲区上限（按观测吞吐自适应增长）
+    io_target_interval_s: float = 0.1  # 单次读满缓冲区的目标耗时（兼顾取消与进度的响应速度）
+    progress_updates_per_s: float = 8.0  # 每个文件每秒最多推送的界面进度更新
+    progress_speed_window_s: float = 3.0  # 汇总吞吐的滑动窗口
+    max_download_bps: int = 0  # 全局下载限速（字节/秒，0 表示不限），运行中用 set_bandwidth_limit 调整
+    max_file_bps: int = 0  # 单文件下载限速（字节/秒，0 表示不限）
+    metrics_enabled: bool = False  # 记录分阶段耗时与请求计数（见 lanzou_metrics）
+
+
+@dataclass
+class HttpPoolConfig:
+    """按主机类别划分的连接池大小（见 lanzou_http.HttpPool）。"""
+    share_pool_maxsize: int = 16  # 分享页 / 列表 / 提链接口：并发目录 × 在途页 + 预取解析
+    download_pool_maxsize: int = 32  # 直链 CDN：并发下载 × 分段数
+    asset_pool_maxsize: int = 4  # fn 页外链脚本
+    pool_hosts: int = 8  # 每类最多保留连接池的主机数
+    pool_block: bool = False  # 连接用尽时阻塞等待（False 为临时新建、用完丢弃）
+    max_retries: int = 0  # 连接级重试（业务重试在上层处理）
+    share_host_concurrency: int = 16  # 每个分享页 / 提链主机同时在途的请求上限（0 表示不限）
+    download_host_concurrency: int = 16  # 每个直链 CDN 主机同时在传的连接上限（含分段）
+    asset_host_concurrency: int = 4  # 每个外链脚本主机的上限
+
+
+@dataclass
+class AsyncEngineConfig:
+    """asyncio 引擎的并发与重试配置（见 lanzou_async_engine.AsyncLanzouEngine）。"""
+    resolve_concurrency: int = 64  # 同时在途的提链数（协程，开销远低于线程）
+    download_concurrency: int = 8  # 同时传输的文件数
+    per_host_limit: int = 16  # aiohttp 连接器的单主机连接上限（在途请求数另受 HttpPool 的按主机上限约束）
+    max_connections: int = 128  # 连接器总连接数上限
+    request_retries: int = 3  # 网络错误 / 5xx 的请求级重试次数
+    backoff_base_s: float = 0.5  # 指数退避起点（asyncio.sleep，不占线程）
+    backoff_max_s: float = 8.0
+    connect_timeout_s: float = 15.0
+    read_timeout_s: float = 30.0
+    chunk_bytes: int = 256 * 1024  # 下载流单次读取大小
@@ -0,0 +1,104 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+class ResolvedUrlCache:
+    """已解析直链的持久化缓存（SQLite），按 (分享链接, ajax_file_id) 索引，TTL 过期 + LRU 限量。"""
+
+    def __init__(self, db_path, ttl_s=1200.0, max_entries=5000):
+        self.db_path = db_path
+        self.ttl_s = float(ttl_s)
+        self.max_entries = max(1, int(max_entries))
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS resolved_urls (
+                    file_link TEXT NOT NULL,
+                    ajax_file_id TEXT NOT NULL,
+                    real_url TEXT NOT NULL,
+                    resolved_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (file_link, ajax_file_id)
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_resolved_urls_last_used ON resolved_urls(last_used)"
+            )
+            self._evict_expired_locked()
+
+    @staticmethod
+    def _key(file_link, ajax_file_id):
+        return str(file_link or ""), str(ajax_file_id or "")
+
+    def _evict_expired_locked(self):
+        self._conn.execute(
+            "DELETE FROM resolved_urls WHERE resolved_at < ?",
+            (time.time() - self.ttl_s,),
+        )
+
+    def get(self, file_link, ajax_file_id=None):
+        link, fid = self._key(file_link, ajax_file_id)
+        if not link:
+            return None
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT real_url, resolved_at FROM resolved_urls WHERE file_link = ? AND ajax_file_id = ?",
+                (link, fid),
+            ).fetchone()
+            if not row:
+                return None
+            if now - row[1] > self.ttl_s:
+                self._conn.execute(
+                    "DELETE FROM resolved_urls WHERE file_link = ? AND ajax_file_id = ?",
+                    (link, fid),
+                )
+                return None
+            self._conn.execute(
+                "UPDATE resolved_urls SET last_used = ? WHERE file_link = ? AND ajax_file_id = ?",
+                (now, link, fid),
+            )
+            return row[0]
+
+    def put(self, file_link, ajax_file_id, real_url):
+        link, fid = self._key(file_link, ajax_file_id)
+        if not link or not real_url:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO resolved_urls "
+                "(file_link, ajax_file_id, real_url, resolved_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (link, fid, real_url, now, now),
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM resolved_urls").fetchone()[0]
+            if count > self.max_entries:
+                self._evict_expired_locked()
+                count = self._conn.execute("SELECT COUNT(*) FROM resolved_urls").fetchone()[0]
+                self._conn.execute(
+                    "DELETE FROM resolved_urls WHERE rowid IN ("
+                    "SELECT rowid FROM resolved_urls ORDER BY last_used ASC LIMIT ?)",
+                    (max(0, count - self.max_entries),),
+                )
+
+    def invalidate(self, file_link, ajax_file_id=None):
+        link, fid = self._key(file_link, ajax_file_id)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM resolved_urls WHERE file_link = ? AND ajax_file_id = ?",
+                (link, fid),
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM resolved_urls").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,332 @@
+"""端到端基准：分阶段（列表 / 提链 / 下载）测量耗时、请求数、吞吐、CPU 与峰值内存。
+
+替身服务（lanzou_fake_server）在独立子进程中运行，每个场景的客户端也在独立子进程中运行，
+CPU 与峰值内存只统计客户端。结果写入 JSON，可跨提交对比：
+    python source_code_dev/lanzou_bench.py --files 200,1000 --folders 0,3 --workers 1,4 --out bench_new.json
+    python source_code_dev/lanzou_bench.py --compare bench_old.json bench_new.json --threshold 0.15
+"""
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+_PROJECT_ROOT = os.path.dirname(_THIS_DIR)
+for _p in (_PROJECT_ROOT, _THIS_DIR):
+    if _p not in sys.path:
+        sys.path.insert(0, _p)
+
+import requests
+
+try:
+    import resource  # Windows 没有该模块，峰值内存记为 None
+except ImportError:
+    resource = None
+
+from lanzou_fake_server import FakeServerConfig, make_server
+
+
+PHASES = ("list", "resolve", "download")
+# 对比时判定回退的指标：耗时按比例阈值，请求数只要增加即视为回退
+_COMPARE_METRICS = ("wall_s", "requests_per_file")
+
+
+def _serve(config_kwargs, port_queue):
+    server = make_server(FakeServerConfig(**config_kwargs))
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+def _server_stats(base_url):
+    return requests.get(f"{base_url}/__stats", timeout=10, proxies={"http": None, "https": None}).json()
+
+
+def _stats_delta(before, after):
+    routes = {k: after.get(k, 0) - before.get(k, 0) for k in after if k != "bytes_sent"}
+    routes = {k: v for k, v in routes.items() if v}
+    return routes, after.get("bytes_sent", 0) - before.get("bytes_sent", 0)
+
+
+def _peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # macOS 单位为字节
+
+
+def _measure(base_url, items, fn):
+    """执行一个阶段，返回 (fn 结果, 指标)。"""
+    before = _server_stats(base_url)
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    result = fn()
+    wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+    routes, sent = _stats_delta(before, _server_stats(base_url))
+    n = items() if callable(items) else items
+    total_requests = sum(routes.values())
+    return result, {
+        "items": n,
+        "wall_s": round(wall, 4),
+        "cpu_s": round(cpu, 4),
+        "requests": total_requests,
+        "requests_per_file": round(total_requests / n, 3) if n else None,
+        "routes": routes,
+        "bytes": sent,
+        "bytes_per_s": round(sent / wall, 1) if wall > 0 and sent else 0,
+    }
+
+
+def _run_client(scenario, base_url, password, result_queue):
+    """子进程：对替身服务依次执行列表、提链、下载三个阶段。"""
+    from source_code_common.lanzou_core import OptimizedLanzouDownloader
+
+    log = sys.stdout if scenario["verbose"] else open(os.devnull, "w", encoding="utf-8")
+    try:
+        with contextlib.redirect_stdout(log), tempfile.TemporaryDirectory() as tmp:
+            d = OptimizedLanzouDownloader(
+                default_url=f"{base_url}/{scenario['root_code']}",
+                default_password=password,
+                engine=scenario["engine"],
+            )
+            d.cache_dir = os.path.join(tmp, "cache")  # 目录清单写到临时目录，每轮从空清单开始
+            d.metrics.enabled = True
+            # 替身服务只有一个主机：放开按主机的并发上限，由 workers 决定并发
+            d.set_host_concurrency(d._get_host(base_url), 0)
+            if not scenario["real_pacing"]:
+                # 去掉模拟“点更多”的等待，只测代码与网络本身
+                d.list_config.page_interval_s = (0.0, 0.0)
+                d.list_config.min_page_interval_s = 0.0
+                d.list_config.zt4_wait_s = (0.05, 0.1)
+            workers = scenario["workers"]
+            phases = {}
+
+            files, phases["list"] = _measure(base_url, lambda: len(d.files), lambda: d.login_and_get_files())
+            sample = files[: scenario["sample"]] if scenario["sample"] else files
+            download_dir = os.path.join(tmp, "downloads")
+
+            if scenario["engine"] == "asyncio":
+                # 协程引擎：workers 为同时在途的提链 / 下载协程数；替身服务只有一个主机，主机上限随之放开
+                d.async_config.per_host_limit = max(d.async_config.per_host_limit, workers)
+                d.async_config.max_connections = max(d.async_config.max_connections, workers)
+                async def _bounded(engine, fn, items):
+                    limit = asyncio.Semaphore(workers)
+
+                    async def _one(item):
+                        async with limit:
+                            return await fn(engine, item)
+                    return await asyncio.gather(*(_one(item) for item in items))
+
+                def _resolve_all():
+                    return d.run_async(lambda e: _bounded(
+                        e, lambda e, f: e.get_real_download_url(f["link"], f.get("ajax_file_id")), sample
+                    ))
+
+                def _download_all():
+                    return d.run_async(lambda e: _bounded(
+                        e, lambda e, pair: e.download_file(pair[0], download_dir, real_url=pair[1]),
+                        list(zip(sample, real_urls)),
+                    ))
+            else:
+                def _resolve_all():
+                    with ThreadPoolExecutor(max_workers=workers) as pool:
+                        return list(pool.map(lambda f: d.get_real_download_url(f["link"], f.get("ajax_file_id")), sample))
+
+                def _download_all():
+                    with ThreadPoolExecutor(max_workers=workers) as pool:
+                        return list(pool.map(
+                            lambda pair: d.download_single_file_optimized(pair[0], download_dir, prefetched_real_url=pair[1]),
+                            zip(sample, real_urls),
+                        ))
+
+            real_urls, phases["resolve"] = _measure(base_url, len(sample), _resolve_all)
+            phases["resolve"]["failed"] = sum(1 for u in real_urls if not u)
+
+            ok, phases["download"] = _measure(base_url, len(sample), _download_all)
+            phases["download"]["failed"] = sum(1 for r in ok if not r)
+            result_queue.put({
+                "phases": phases,
+                "peak_rss_kb": _peak_rss_kb(),
+                "metrics": d.metrics.snapshot(),
+                "http_pool": d.get_http_stats(),
+            })
+    except Exception as e:
+        result_queue.put({"error": repr(e)})
+    finally:
+        if log is not sys.stdout:
+            log.close()
+
+
+def _scenario_key(s):
+    key = f"files={s['files']},folders={s['folders']},depth={s['depth']},workers={s['workers']},latency={s['latency']}"
+    # 线程引擎沿用旧键，便于与引入 asyncio 引擎之前的结果对比
+    engine = s.get("engine", "threads")
+    return key if engine == "threads" else f"{key},engine={engine}"
+
+
+def run_scenario(scenario, password="1234"):
+    config_kwargs = dict(
+        files_per_folder=scenario["files"],
+        subfolders=scenario["folders"],
+        depth=scenario["depth"],
+        file_size_bytes=scenario["size"],
+        latency_s=scenario["latency"],
+        zt4_rate=scenario["zt4_rate"],
+        password=password,
+    )
+    # 根目录码由种子确定，本进程构建一次状态即可拿到，不必启动服务
+    scenario = dict(scenario, root_code=make_server(FakeServerConfig(**config_kwargs)).state.root.code)
+
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_serve, args=(config_kwargs, port_queue), daemon=True)
+    server.start()
+    try:
+        base_url = f"http://127.0.0.1:{port_queue.get(timeout=30)}"
+        result_queue = multiprocessing.Queue()
+        client = multiprocessing.Process(target=_run_client, args=(scenario, base_url, password, result_queue))
+        client.start()
+        result = result_queue.get(timeout=scenario["timeout"])
+        client.join(10)
+    finally:
+        server.terminate()
+        server.join(5)
+    if "error" in result:
+        raise RuntimeError(f"{_scenario_key(scenario)}: {result['error']}")
+    return result
+
+
+def _median_run(runs):
+    """多轮取各阶段耗时中位数的那一轮，避免混合不同轮次的指标。"""
+    if len(runs) == 1:
+        return runs[0]
+    total = [sum(r["phases"][p]["wall_s"] for p in PHASES) for r in runs]
+    median = statistics.median_low(total)
+    return runs[total.index(median)]
+
+
+def _git_info():
+    def _git(*args):
+        try:
+            return subprocess.run(
+                ["git", *args], cwd=_PROJECT_ROOT, capture_output=True, text=True, timeout=10
+            ).stdout.strip()
+        except Exception:
+            return ""
+    return {"commit": _git("rev-parse", "--short", "HEAD"), "dirty": bool(_git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def _int_list(text):
+    return [int(x) for x in str(text).split(",") if x.strip()]
+
+
+def _float_list(text):
+    return [float(x) for x in str(text).split(",") if x.strip()]
+
+
+def compare(base_path, new_path, threshold):
+    """对比两份结果，打印每个场景 / 阶段的变化；存在回退时返回 1。"""
+    with open(base_path, encoding="utf-8") as fh:
+        base = json.load(fh)
+    with open(new_path, encoding="utf-8") as fh:
+        new = json.load(fh)
+    base_by_key = {r["key"]: r for r in base["results"]}
+    print(f"基线 {base['meta'].get('commit')} -> 新 {new['meta'].get('commit')}，耗时回退阈值 {threshold:.0%}")
+    regressions = 0
+    for r in new["results"]:
+        old = base_by_key.get(r["key"])
+        if old is None:
+            print(f"  {r['key']}: 基线中无此场景，跳过")
+            continue
+        print(f"  {r['key']}")
+        for phase in PHASES:
+            a, b = old["phases"][phase], r["phases"][phase]
+            marks = []
+            for metric in _COMPARE_METRICS:
+                va, vb = a.get(metric), b.get(metric)
+                if va is None or vb is None:
+                    continue
+                if metric == "wall_s":
+                    bad = va > 0 and vb > va * (1 + threshold)
+                    change = f"{(vb / va - 1) * 100:+.1f}%" if va > 0 else "n/a"
+                else:
+                    bad = vb > va + 1e-9
+                    change = f"{vb - va:+.3f}"
+                regressions += bad
+                marks.append(f"{metric} {va} -> {vb} ({change}){' 回退' if bad else ''}")
+            print(f"    {phase:<8} " + "；".join(marks))
+    print(f"回退项: {regressions}")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="列表 / 提链 / 下载分阶段基准")
+    parser.add_argument("--files", default="200", help="每个目录的文件数，逗号分隔多值")
+    parser.add_argument("--folders", default="0", help="每层子目录数，逗号分隔多值")
+    parser.add_argument("--depth", default="1", help="子目录嵌套层数，逗号分隔多值")
+    parser.add_argument("--workers", default="1,4", help="提链 / 下载并发数，逗号分隔多值")
+    parser.add_argument("--latency", default="0,0.02", help="替身服务单请求延迟（秒），逗号分隔多值")
+    parser.add_argument("--engine", default="threads", help="执行引擎 threads / asyncio，逗号分隔多值")
+    parser.add_argument("--size", type=int, default=256 * 1024, help="单文件字节数")
+    parser.add_argument("--sample", type=int, default=100, help="提链 / 下载阶段取前 N 个文件（0 为全部）")
+    parser.add_argument("--zt4-rate", type=float, default=0.0)
+    parser.add_argument("--real-pacing", action="store_true", help="保留列表翻页的模拟等待")
+    parser.add_argument("--rounds", type=int, default=1, help="每个场景重复次数，取总耗时中位数的一轮")
+    parser.add_argument("--timeout", type=float, default=1800.0, help="单个场景超时（秒）")
+    parser.add_argument("--out", default="", help="结果 JSON 路径（默认 bench_<commit>.json）")
+    parser.add_argument("--verbose", action="store_true", help="显示下载器日志")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="对比两份结果")
+    parser.add_argument("--threshold", type=float, default=0.15, help="耗时回退阈值（比例）")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return compare(args.compare[0], args.compare[1], args.threshold)
+
+    meta = dict(
+        _git_info(),
+        python=platform.python_version(),
+        platform=platform.platform(),
+        cpu_count=os.cpu_count(),
+        started_at=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        args=vars(args),
+    )
+    results = []
+    grid = itertools.product(
+        _int_list(args.files), _int_list(args.folders), _int_list(args.depth),
+        _int_list(args.workers), _float_list(args.latency), [e.strip() for e in args.engine.split(",") if e.strip()],
+    )
+    for files, folders, depth, workers, latency, engine in grid:
+        scenario = dict(
+            files=files, folders=folders, depth=depth, workers=workers, latency=latency, engine=engine,
+            size=args.size, sample=args.sample, zt4_rate=args.zt4_rate,
+            real_pacing=args.real_pacing, verbose=args.verbose, timeout=args.timeout,
+        )
+        key = _scenario_key(scenario)
+        print(f"场景 {key} ...", flush=True)
+        best = _median_run([run_scenario(scenario) for _ in range(max(1, args.rounds))])
+        results.append({"key": key, "scenario": scenario, **best})
+        for phase in PHASES:
+            m = best["phases"][phase]
+            print(
+                f"  {phase:<8} {m['wall_s']:8.3f}s  CPU {m['cpu_s']:7.3f}s  "
+                f"{m['items']:5d} 个  请求/文件 {m['requests_per_file']}  {m['bytes_per_s'] / 1048576:7.2f} MB/s"
+            )
+        print(f"  峰值内存 {best['peak_rss_kb']} KB")
+
+    out = args.out or f"bench_{meta['commit'] or 'unknown'}.json"
+    with open(out, "w", encoding="utf-8") as fh:
+        json.dump({"meta": meta, "results": results}, fh, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,558 @@
+"""本地蓝奏云替身服务：离线、可复现地压测列表 / 提链 / 下载链路。
+
+模拟内容：
+- 分享页（含 filemoreajax.php 上下文变量与子目录）、分页 JSON（zt=1/2/3/4）
+- 文件页 -> fn 页（内联脚本 + 外链脚本）-> ajaxm.php -> 直链
+- acw_sc__v2 挑战页、支持 Range 的文件下载
+- 可配置延迟、带宽上限与故障注入
+
+用法：
+    python source_code_dev/lanzou_fake_server.py --folders 3 --files 120 --latency 0.02
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote
+
+
+@dataclass
+class FakeServerConfig:
+    """替身服务的数据规模、延迟与故障注入配置。"""
+    files_per_folder: int = 120
+    subfolders: int = 0  # 根目录下的子目录数
+    depth: int = 1  # 子目录嵌套层数（仅 subfolders > 0 时生效）
+    file_size_bytes: int = 256 * 1024
+    page_size: int = 50
+    password: str = "1234"
+    latency_s: float = 0.0  # 每个请求的额外延迟
+    bandwidth_bps: int = 0  # 单连接下载带宽上限（0 表示不限）
+    zt4_rate: float = 0.0  # 列表接口随机返回 zt=4 的概率
+    ratelimit_rate: float = 0.0  # 列表接口随机返回 http_ratelimit 的概率
+    challenge: bool = False  # 分享页首访返回 acw_sc__v2 挑战
+    error_rate: float = 0.0  # ajaxm.php / 文件下载随机 5xx 的概率
+    drop_rate: float = 0.0  # 文件下载中途断流的概率
+    range_supported: bool = True
+    link_ttl_s: float = 0.0  # 直链有效期（0 表示不过期），过期返回 403
+    script_max_age_s: int = 600  # 外链脚本 Cache-Control max-age
+    seed: int = 20240601
+
+
+@dataclass
+class _FakeFile:
+    code: str
+    name: str
+    size: int
+    file_id: str
+    sign: str
+
+
+@dataclass
+class _FakeFolder:
+    code: str
+    name: str
+    fid: str
+    files: list = field(default_factory=list)
+    subfolders: list = field(default_factory=list)
+
+
+_ACW_KEY = "3000176000856006061501533003690027800375"
+_ACW_PERM = [0xf, 0x23, 0x1d, 0x18, 0x21, 0x10, 0x1, 0x26, 0xa, 0x9, 0x13, 0x1f, 0x28, 0x1b, 0x16, 0x17,
+             0x19, 0xd, 0x6, 0xb, 0x27, 0x12, 0x14, 0x8, 0xe, 0x15, 0x20, 0x1a, 0x2, 0x1e, 0x7, 0x4,
+             0x11, 0x5, 0x3, 0x1c, 0x22, 0x25, 0xc, 0x24]
+
+
+def _encode_acw_item(text):
+    """与 OptimizedLanzouDownloader._decode_acw_item 对应的编码（大小写互换、无填充的 base64）。"""
+    return base64.b64encode(text.encode("utf-8")).decode("ascii").swapcase().rstrip("=")
+
+
+def build_acw_challenge(rng):
+    """生成 acw_sc__v2 挑战页，返回 (html, 期望 cookie 值)。"""
+    u = "".join(rng.choice("0123456789abcdef") for _ in range(40))
+    arg1 = [""] * 40
+    for z, val in enumerate(_ACW_PERM):
+        arg1[val - 1] = u[z]
+    arg1 = "".join(arg1)
+    token = "".join(f"{int(u[i:i + 2], 16) ^ int(_ACW_KEY[i:i + 2], 16):02x}" for i in range(0, 40, 2))
+    items = ",".join(f"'{_encode_acw_item(x)}'" for x in ("toString", _ACW_KEY, "cookie", "reload"))
+    perm = ",".join(hex(x) for x in _ACW_PERM)
+    page = (
+        "<html><script>\n"
+        f"var arg1='{arg1}';\n"
+        f"var N=[{items}];a0i=function(){{return N}};\n"
+        f"var m=[{perm}];\n"
+        "document.cookie='acw_sc__v2='+x;location.reload();\n"
+        "</script></html>"
+    )
+    return page, token
+
+
+class FakeLanzouState:
+    """替身服务数据与统计（线程安全）。"""
+
+    def __init__(self, config):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.bytes_sent = 0
+        self.folders = {}  # code -> _FakeFolder
+        self.folders_by_fid = {}
+        self.files = {}  # code -> _FakeFile
+        self.files_by_id = {}
+        self.tokens = {}  # direct token -> (file code, issued_at)
+        self.acw_tokens = set()
+        self.root = self._build_folder("根目录", config.depth if config.subfolders else 0, "")
+        self.script_text = (
+            "/* common.js */\n"
+            "function down_r(){ return 1; }\n"
+            "var websign = '';\n"
+        )
+
+    def _new_code(self, prefix):
+        return prefix + "".join(self.rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(10))
+
+    def _build_folder(self, name, depth, prefix):
+        folder = _FakeFolder(
+            code=self._new_code("b0"),
+            name=name,
+            fid=str(self.rng.randint(1000000, 9999999)),
+        )
+        self.folders[folder.code] = folder
+        self.folders_by_fid[folder.fid] = folder
+        for i in range(self.config.files_per_folder):
+            f = _FakeFile(
+                code=self._new_code("i"),
+                name=f"{prefix}vol_{i + 1:04d}.zip",
+                size=self.config.file_size_bytes,
+                file_id=str(self.rng.randint(100000000, 999999999)),
+                sign=self._new_code("s"),
+            )
+            folder.files.append(f)
+            self.files[f.code] = f
+            self.files_by_id[f.file_id] = f
+        if depth > 0:
+            for j in range(self.config.subfolders):
+                sub = self._build_folder(f"{prefix}卷{j + 1}", depth - 1, f"{prefix}s{j + 1}_")
+                folder.subfolders.append(sub)
+        return folder
+
+    def count(self, route):
+        with self.lock:
+            self.stats[route] = self.stats.get(route, 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            out = dict(self.stats)
+            out["bytes_sent"] = self.bytes_sent
+            return out
+
+    def all_files(self):
+        return list(self.files.values())
+
+    def file_bytes(self, f, start, end):
+        """文件内容按文件码确定性生成，支持任意区间。"""
+        block = hashlib.sha256(f.code.encode("ascii")).digest() * 2048  # 64KB
+        n = len(block)
+        out = bytearray()
+        pos = start
+        while pos <= end:
+            off = pos % n
+            take = min(n - off, end - pos + 1)
+            out += block[off:off + take]
+            pos += take
+        return bytes(out)
+
+
+def _human_size(n):
+    if n >= 1024 * 1024:
+        return f"{n / 1024 / 1024:.1f} M"
+    return f"{n / 1024:.1f} K"
+
+
+def render_share_page(folder):
+    """分享页（目录）：子目录链接 + filemoreajax.php 的上下文变量（t/k 经变量名间接引用）。"""
+    sub_html = "".join(
+        f'<div id="folder"><div class="mbxfolder"><a href="/{sub.code}" class="mlink minPx-top">'
+        f'<div class="filename">{sub.name}<div class="filesize"></div></div></a></div></div>\n'
+        for sub in folder.subfolders
+    )
+    return f"""<!DOCTYPE html><html><head><title>{folder.name} - 蓝奏云</title></head><body>
+<div id="sub_folder">{sub_html}</div>
+<div id="infos"></div>
+<script type="text/javascript">
+var pgs;
+var ib2f3 = '{int(time.time())}';
+var _h3k = '{hashlib.md5(folder.code.encode()).hexdigest()}';
+var pwd;
+function more(){{
+$.ajax({{
+    type : 'post',
+    url : '/filemoreajax.php?file={folder.fid}',
+    data : {{
+        'lx':2,
+        'fid':{folder.fid},
+        'uid':'1797216',
+        'pg':pgs,
+        'rep':'0',
+        't':ib2f3,
+        'k':_h3k,
+        'up':1,
+        'ls':1,
+        'pwd':pwd
+    }},
+    dataType : 'json'
+}});
+}}
+</script>
+<div class="tj">© lanzou</div>
+</body></html>"""
+
+
+def render_file_page(code):
+    """文件页：iframe 指向 fn 页。"""
+    return f"""<!DOCTYPE html><html><body>
+<div class="n_box"><div class="d"><iframe class="ifr2" name="{code[:6]}" src="/fn?{code}_sig" frameborder="0" scrolling="no"></iframe></div></div>
+</body></html>"""
+
+
+def render_fn_page(f):
+    """fn 页：外链公共脚本 + 内联 ajaxm.php 参数。"""
+    return f"""<!DOCTYPE html><html><head>
+<script type="text/javascript" src="/assets/common.js"></script>
+</head><body>
+<script type="text/javascript">
+var ajaxdata = '?ctdf';
+var wp_sign = '{f.sign}';
+var ciucjdsdc = '';
+$.ajax({{
+type : 'post',
+url : '/ajaxm.php?file={f.file_id}',
+data : {{ 'action':'downprocess','websignkey':ajaxdata,'signs':ajaxdata,'sign':wp_sign,'websign':ciucjdsdc,'kd':1,'ves':1 }},
+dataType : 'json'
+}});
+</script></body></html>"""
+
+
+class FakeLanzouHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "Tengine"
+    # 响应头与正文分两次写出，开启 Nagle 时会与客户端的延迟 ACK 叠加出约 40ms 停顿
+    disable_nagle_algorithm = True
+    state = None  # FakeLanzouState，由 make_server 注入
+
+    def log_message(self, fmt, *args):
+        pass
+
+    # ---- 通用 ----
+    def _origin(self):
+        host = self.headers.get("Host") or f"127.0.0.1:{self.server.server_port}"
+        return f"http://{host}"
+
+    def _delay(self):
+        if self.state.config.latency_s > 0:
+            time.sleep(self.state.config.latency_s)
+
+    def _send(self, status, body, ctype="text/html; charset=utf-8", headers=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_json(self, obj, headers=None):
+        self._send(200, json.dumps(obj, ensure_ascii=False), "application/json; charset=utf-8", headers)
+
+    def _cookies(self):
+        out = {}
+        for part in (self.headers.get("Cookie") or "").split(";"):
+            if "=" in part:
+                k, v = part.split("=", 1)
+                out[k.strip()] = v.strip()
+        return out
+
+    def _read_form(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length).decode("utf-8") if length else ""
+        return {k: v[0] for k, v in parse_qs(raw, keep_blank_values=True).items()}
+
+    # ---- 路由 ----
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        path = parsed.path
+        if path == "/__stats":
+            return self._send_json(self.state.snapshot())  # 压测脚本跨进程读取计数，不计入统计与延迟
+        self._delay()
+        if path.startswith("/b0"):
+            return self._share_page(path[1:])
+        if path == "/fn":
+            return self._fn_page(parsed.query)
+        if path == "/assets/common.js":
+            self.state.count("script")
+            return self._send(200, self.state.script_text, "application/javascript",
+                              {"Cache-Control": f"max-age={self.state.config.script_max_age_s}", "ETag": '"common-v1"'})
+        if path.startswith("/file/"):
+            return self._file_body(parse_qs(parsed.query))
+        if path.startswith("/i") and path[1:] in self.state.files:
+            return self._file_page(path[1:])
+        self.state.count("not_found")
+        self._send(404, "not found")
+
+    def do_HEAD(self):
+        parsed = urlparse(self.path)
+        if parsed.path.startswith("/file/"):
+            return self._file_body(parse_qs(parsed.query))
+        self._send(405, "")
+
+    def do_POST(self):
+        self._delay()
+        parsed = urlparse(self.path)
+        form = self._read_form()
+        query = parse_qs(parsed.query)
+        if parsed.path == "/filemoreajax.php":
+            return self._list_api(query, form)
+        if parsed.path == "/ajaxm.php":
+            return self._ajaxm(query, form)
+        self._send(404, "not found")
+
+    # ---- 分享页与列表 ----
+    def _share_page(self, code):
+        st = self.state
+        folder = st.folders.get(code)
+        if folder is None:
+            st.count("not_found")
+            return self._send(404, "not found")
+        if st.config.challenge and self._cookies().get("acw_sc__v2") not in st.acw_tokens:
+            st.count("challenge")
+            page, token = build_acw_challenge(st.rng)
+            with st.lock:
+                st.acw_tokens.add(token)
+            return self._send(200, page)
+        st.count("share_page")
+        self._send(200, render_share_page(folder))
+
+    def _list_api(self, query, form):
+        st = self.state
+        cfg = st.config
+        st.count("list_api")
+        folder = st.folders_by_fid.get((query.get("file") or [""])[0])
+        if folder is None:
+            return self._send_json({"zt": 0, "info": "参数错误"})
+        if cfg.ratelimit_rate and st.rng.random() < cfg.ratelimit_rate:
+            st.count("list_ratelimit")
+            return self._send(200, "<html>busy</html>", headers={"x-tengine-error": "denied by http_ratelimit"})
+        if cfg.zt4_rate and st.rng.random() < cfg.zt4_rate:
+            st.count("list_zt4")
+            return self._send_json({"zt": 4, "info": "请刷新，重试", "text": []})
+        if cfg.password and form.get("pwd", "") != cfg.password:
+            return self._send_json({"zt": 3, "info": "密码不正确", "text": []})
+        try:
+            pg = max(1, int(form.get("pg") or 1))
+        except ValueError:
+            pg = 1
+        rows = folder.files[(pg - 1) * cfg.page_size: pg * cfg.page_size]
+        if not rows:
+            return self._send_json({"zt": 2, "info": "没有了", "text": []})
+        self._send_json({
+            "zt": 1,
+            "info": "sucess",
+            "text": [
+                {
+                    "icon": "zip",
+                    "t": 0,
+                    "id": f.code,
+                    "name_all": f.name,
+                    "size": _human_size(f.size),
+                    "time": "2024-06-01",
+                    "duan": f.code[1:6],
+                    "p_ico": 0,
+                }
+                for f in rows
+            ],
+        })
+
+    # ---- 提链链路 ----
+    def _file_page(self, code):
+        self.state.count("file_page")
+        self._send(200, render_file_page(code))
+
+    def _fn_page(self, query):
+        st = self.state
+        st.count("fn_page")
+        code = query.split("_sig", 1)[0]
+        f = st.files.get(code)
+        if f is None:
+            return self._send(404, "not found")
+        self._send(200, render_fn_page(f))
+
+    def _ajaxm(self, query, form):
+        st = self.state
+        st.count("ajaxm")
+        if st.config.error_rate and st.rng.random() < st.config.error_rate:
+            st.count("ajaxm_error")
+            return self._send(502, "bad gateway")
+        f = st.files_by_id.get((query.get("file") or [""])[0])
+        if f is None or form.get("sign") != f.sign:
+            return self._send_json({"zt": 0, "inf": "sign error"})
+        token = hashlib.sha1(f"{f.code}{time.time()}{st.rng.random()}".encode()).hexdigest()[:16]
+        with st.lock:
+            st.tokens[token] = (f.code, time.time())
+        self._send_json({"zt": 1, "dom": self._origin(), "url": f"?f={quote(f.code)}&t={token}", "inf": 0})
+
+    # ---- 文件下载 ----
+    def _file_body(self, query):
+        st = self.state
+        cfg = st.config
+        route = "file_head" if self.command == "HEAD" else "file"
+        st.count(route)
+        token = (query.get("t") or [""])[0]
+        with st.lock:
+            entry = st.tokens.get(token)
+        if entry is None or (cfg.link_ttl_s and time.time() - entry[1] > cfg.link_ttl_s):
+            st.count("file_expired")
+            return self._send(403, "<html>链接已失效</html>")
+        if self.command != "HEAD" and cfg.error_rate and st.rng.random() < cfg.error_rate:
+            st.count("file_error")
+            return self._send(503, "service unavailable")
+        f = st.files[entry[0]]
+        start, end = 0, f.size - 1
+        status = 200
+        rng = self.headers.get("Range")
+        if rng and cfg.range_supported:
+            m = re.match(r"bytes=(\d+)-(\d*)", rng)
+            if m:
+                start = int(m.group(1))
+                end = min(end, int(m.group(2))) if m.group(2) else end
+                if start >= f.size:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{f.size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                status = 206
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end - start + 1))
+        if cfg.range_supported:
+            self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{f.size}")
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        drop_at = None
+        if cfg.drop_rate and st.rng.random() < cfg.drop_rate:
+            drop_at = start + (end - start + 1) // 2
+        pos = start
+        chunk = 64 * 1024
+        try:
+            while pos <= end:
+                take = min(chunk, end - pos + 1)
+                if drop_at is not None and pos + take > drop_at:
+                    st.count("file_dropped")
+                    self.close_connection = True
+                    return
+                self.wfile.write(st.file_bytes(f, pos, pos + take - 1))
+                with st.lock:
+                    st.bytes_sent += take
+                pos += take
+                if cfg.bandwidth_bps > 0:
+                    time.sleep(take / cfg.bandwidth_bps)
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+
+class FakeLanzouServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 默认积压队列只有 5，高并发客户端一次建立上百连接时会被丢 SYN（1s 起的重传）
+    request_queue_size = 1024
+
+    def __init__(self, state, host="127.0.0.1", port=0):
+        handler = type("BoundFakeLanzouHandler", (FakeLanzouHandler,), {"state": state})
+        super().__init__((host, port), handler)
+        self.state = state
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    @property
+    def share_url(self):
+        return f"{self.base_url}/{self.state.root.code}"
+
+    def start_background(self):
+        t = threading.Thread(target=self.serve_forever, name="fake-lanzou", daemon=True)
+        t.start()
+        return t
+
+
+def make_server(config=None, host="127.0.0.1", port=0):
+    """创建替身服务（未启动）；调用 start_background() 后台运行。"""
+    return FakeLanzouServer(FakeLanzouState(config or FakeServerConfig()), host=host, port=port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地蓝奏云替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--files", type=int, default=120, help="每个目录的文件数")
+    parser.add_argument("--folders", type=int, default=0, help="每层子目录数")
+    parser.add_argument("--depth", type=int, default=1)
+    parser.add_argument("--size", type=int, default=256 * 1024, help="单文件字节数")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--bandwidth", type=int, default=0, help="单连接字节/秒，0 不限")
+    parser.add_argument("--zt4-rate", type=float, default=0.0)
+    parser.add_argument("--ratelimit-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--challenge", action="store_true")
+    parser.add_argument("--no-range", action="store_true")
+    parser.add_argument("--link-ttl", type=float, default=0.0)
+    parser.add_argument("--password", default="1234")
+    args = parser.parse_args(argv)
+
+    config = FakeServerConfig(
+        files_per_folder=args.files,
+        subfolders=args.folders,
+        depth=args.depth,
+        file_size_bytes=args.size,
+        password=args.password,
+        latency_s=args.latency,
+        bandwidth_bps=args.bandwidth,
+        zt4_rate=args.zt4_rate,
+        ratelimit_rate=args.ratelimit_rate,
+        challenge=args.challenge,
+        error_rate=args.error_rate,
+        drop_rate=args.drop_rate,
+        range_supported=not args.no_range,
+        link_ttl_s=args.link_ttl,
+    )
+    server = make_server(config, host=args.host, port=args.port)
+    print(f"替身服务已启动: {server.share_url}  密码: {config.password}")
+    print(f"共 {len(server.state.files)} 个文件，{len(server.state.folders)} 个目录")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.state.snapshot(), ensure_ascii=False))
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
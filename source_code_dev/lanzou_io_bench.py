@@ -0,0 +1,134 @@
+"""下载写入路径基准：对比旧版 iter_content(8192) 与自适应 readinto 路径的吞吐与 CPU 开销。
+
+本地子进程提供 HTTP 数据源（不访问蓝奏云），CPU 只统计下载进程本身：
+    python source_code_dev/lanzou_io_bench.py --size-mb 512 --rounds 3
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+_THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+_PROJECT_ROOT = os.path.dirname(_THIS_DIR)
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
+
+import requests
+
+from source_code_common.lanzou_download_core import LanzouDownloadCore
+from source_code_common.lanzou_types import DownloadConfig
+
+
+_BLOCK = bytes(range(256)) * 4096  # 1MB
+
+
+class _BytesHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_GET(self):
+        size = int(self.path.rsplit("/", 1)[-1])
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(size))
+        self.end_headers()
+        sent = 0
+        while sent < size:
+            take = min(len(_BLOCK), size - sent)
+            self.wfile.write(_BLOCK[:take])
+            sent += take
+
+
+def _serve(port_queue):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _BytesHandler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def _legacy_write(core, response, fh, total_size):
+    """旧版写入循环（8KB 块 + 每块计算进度）。"""
+    downloaded = 0
+    for chunk in response.iter_content(chunk_size=8192):
+        if chunk:
+            fh.write(chunk)
+            downloaded += len(chunk)
+            if total_size > 0:
+                int((downloaded / total_size) * 100)
+    return downloaded
+
+
+def _adaptive_write(core, response, fh, total_size):
+    downloaded = 0
+    for chunk in core._iter_body(response):
+        fh.write(chunk)
+        downloaded += len(chunk)
+        if total_size > 0:
+            int((downloaded / total_size) * 100)
+    return downloaded
+
+
+MODES = {"iter_content_8k": _legacy_write, "adaptive_readinto": _adaptive_write}
+
+
+def run_once(mode, url, size, out_path):
+    core = LanzouDownloadCore(SimpleNamespace(download_config=DownloadConfig()))
+    session = requests.Session()
+    session.trust_env = False
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    with session.get(url, stream=True, timeout=30) as response:
+        response.raise_for_status()
+        with open(out_path, "wb") as fh:
+            got = MODES[mode](core, response, fh, size)
+    wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+    if got != size:
+        raise RuntimeError(f"{mode}: 字节数不符 {got}/{size}")
+    gb = size / (1024 ** 3)
+    return {"mode": mode, "mb_per_s": size / (1024 ** 2) / wall, "cpu_s_per_gb": cpu / gb, "wall_s": wall}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="下载写入路径基准")
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--devnull", action="store_true", help="写入 os.devnull，排除磁盘影响")
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    args = parser.parse_args(argv)
+
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_serve, args=(port_queue,), daemon=True)
+    server.start()
+    port = port_queue.get(timeout=10)
+    size = args.size_mb * 1024 * 1024
+    url = f"http://127.0.0.1:{port}/bytes/{size}"
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        out_path = os.devnull if args.devnull else os.path.join(tmp, "bench.bin")
+        try:
+            for mode in MODES:
+                runs = [run_once(mode, url, size, out_path) for _ in range(args.rounds)]
+                best = max(runs, key=lambda r: r["mb_per_s"])
+                best["cpu_s_per_gb"] = min(r["cpu_s_per_gb"] for r in runs)
+                results.append(best)
+        finally:
+            server.terminate()
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print(f"数据量 {args.size_mb} MB，每种模式 {args.rounds} 轮取最好成绩")
+        for r in results:
+            print(f"  {r['mode']:<20} {r['mb_per_s']:8.1f} MB/s   CPU {r['cpu_s_per_gb']:6.2f} s/GB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
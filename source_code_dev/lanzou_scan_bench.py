@@ -0,0 +1,352 @@
+"""页面解析基准：对比旧版逐条 re.search 与 lanzou_page_scanner 扫描器的每页 CPU 耗时。
+
+页面样本由 lanzou_fake_server 的模板生成，并补上样式、导航与统计脚本，接近真实页面大小：
+    python source_code_dev/lanzou_scan_bench.py --iterations 2000
+先校验两种实现在所有样本上的提取结果一致，再计时。
+"""
+
+import argparse
+import html
+import json
+import os
+import re
+import sys
+import time
+
+_THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+_PROJECT_ROOT = os.path.dirname(_THIS_DIR)
+for _p in (_PROJECT_ROOT, _THIS_DIR):
+    if _p not in sys.path:
+        sys.path.insert(0, _p)
+
+from lanzou_fake_server import (
+    FakeLanzouState,
+    FakeServerConfig,
+    render_file_page,
+    render_fn_page,
+    render_share_page,
+)
+from source_code_common import lanzou_page_scanner as scanner
+
+
+# ---- 旧版实现（逐条 re.search，每次调用都查编译缓存、切片窗口） ----
+
+def _legacy_share_context(page_html):
+    fid = None
+    m = re.search(r"/filemoreajax\.php\?file=(\d+)", page_html)
+    fid = m.group(1) if m else None
+    if not fid:
+        m = re.search(r"'fid'\s*:\s*(\d+)", page_html)
+        fid = m.group(1) if m else None
+    uid_match = re.search(r"'uid'\s*:\s*'?(\d+)'?", page_html)
+    uid = uid_match.group(1) if uid_match else None
+    t_name_match = re.search(r"'t'\s*:\s*([A-Za-z_][A-Za-z0-9_]*)", page_html)
+    k_name_match = re.search(r"'k'\s*:\s*([A-Za-z_][A-Za-z0-9_]*)", page_html)
+
+    def _pick_var_value(var_name):
+        if not var_name:
+            return None
+        var_match = re.search(rf"var\s+{re.escape(var_name)}\s*=\s*['\"]([^'\"]+)['\"]", page_html)
+        return var_match.group(1) if var_match else None
+
+    t_val = _pick_var_value(t_name_match.group(1) if t_name_match else None)
+    k_val = _pick_var_value(k_name_match.group(1) if k_name_match else None)
+    if not t_val:
+        m = re.search(r"'t'\s*:\s*'([^']+)'", page_html)
+        t_val = m.group(1) if m else None
+    if not k_val:
+        m = re.search(r"'k'\s*:\s*'([^']+)'", page_html)
+        k_val = m.group(1) if m else None
+
+    base_keys = {"file", "lx", "fid", "uid", "pg", "rep", "t", "k", "up"}
+    optional_keys = {"ls", "pwd", "vip", "webfoldersign"}
+    found_keys = set()
+    extra_values = {}
+    for m in re.finditer(r"filemoreajax\.php", page_html):
+        snippet = page_html[max(0, m.start() - 500):min(len(page_html), m.end() + 800)]
+        obj_match = re.search(r"data\s*:\s*\{([^}]+)\}", snippet, re.S)
+        if obj_match:
+            for key_match in re.finditer(r"['\"]?([A-Za-z0-9_]+)['\"]?\s*:", obj_match.group(1)):
+                found_keys.add(key_match.group(1))
+            break
+    if not found_keys:
+        found_keys = set(base_keys)
+        for k in optional_keys:
+            if re.search(rf"\b{k}\b", page_html):
+                found_keys.add(k)
+
+    def _pick_scalar(name):
+        m1 = re.search(rf"(?:var\s+)?{re.escape(name)}\s*=\s*['\"]([^'\"]+)['\"]", page_html)
+        if m1:
+            return m1.group(1)
+        m2 = re.search(rf"(?:var\s+)?{re.escape(name)}\s*=\s*(\d+)", page_html)
+        return m2.group(1) if m2 else None
+
+    for key in ("ls", "vip", "webfoldersign"):
+        v = _pick_scalar(key)
+        if v is not None:
+            extra_values[key] = v
+    return {"fid": fid, "uid": uid, "t": t_val, "k": k_val, "payload_keys": found_keys, "extra_values": extra_values}
+
+
+def _legacy_subfolder_links(page_html):
+    out = []
+    for m in re.finditer(r"<a[^>]+href=['\"]([^'\"]+)['\"][^>]*>", page_html, re.I):
+        href = (m.group(1) or "").strip()
+        if not href or href.startswith("javascript:") or href.startswith("#"):
+            continue
+        if not re.search(r"/b[0-9a-z]+", href, re.I):
+            continue
+        start = max(0, m.start() - 260)
+        end = min(len(page_html), m.end() + 720)
+        snippet = page_html[start:end]
+        if "mbxfolder" not in snippet and "folderdown" not in snippet:
+            continue
+        name = ""
+        name_pattern = r"class=['\"]filename['\"][^>]*>(.*?)<div[^>]*class=['\"]filesize['\"]"
+        name_match = re.search(name_pattern, page_html[m.end():end], re.I | re.S)
+        if not name_match:
+            name_match = re.search(name_pattern, snippet, re.I | re.S)
+        if name_match:
+            name = html.unescape(re.sub(r"<[^>]+>", "", name_match.group(1))).strip()
+        out.append((href, name))
+    return out
+
+
+def _legacy_decode_escaped_html(text):
+    if not text:
+        return ""
+    s = html.unescape(text)
+    s = s.replace("\\/", "/")
+    s = s.replace("\\u002F", "/").replace("\\u002f", "/")
+    s = s.replace("\\x2f", "/").replace("\\x2F", "/")
+    s = s.replace("\\u003a", ":").replace("\\u003A", ":")
+    return s
+
+
+def _legacy_find_fn_url(text):
+    if not text:
+        return None
+    m_iframe = re.search(r'<iframe[^>]+src=[\'"]([^\'"]+)', text, re.I)
+    if m_iframe:
+        src_val = html.unescape(m_iframe.group(1)).replace("\\/", "/").strip()
+        if "fn?" in src_val:
+            return src_val
+    m_fn = re.search(r'((?:https?://[^\s\'"]+)?/?fn\?[A-Za-z0-9_\-+=/%\?&]+)', text, re.I)
+    if m_fn:
+        return html.unescape(m_fn.group(1)).replace("\\/", "/").strip()
+    m_fn2 = re.search(r'(/fn\?[^\'"\s]+)', text, re.I)
+    if m_fn2:
+        return html.unescape(m_fn2.group(1)).replace("\\/", "/").strip()
+    return None
+
+
+def _legacy_fn_url_in_page(page_html):
+    return _legacy_find_fn_url(page_html) or _legacy_find_fn_url(_legacy_decode_escaped_html(page_html))
+
+
+def _legacy_file_id(text):
+    def _ok(v):
+        s = str(v).strip()
+        return s if s.isdigit() and s != "1" and len(s) >= 6 else None
+
+    for p in [
+        r"url\s*:\s*['\"]/ajaxm\.php\?file=(\d{6,})['\"]",
+        r"/ajaxm\.php\?file=(\d{6,})",
+        r"\bfile\s*[:=]\s*['\"]?(\d{6,})['\"]?",
+        r"\bfid\s*[:=]\s*['\"]?(\d{6,})['\"]?",
+    ]:
+        m = re.search(p, text)
+        if m and _ok(m.group(1)):
+            return _ok(m.group(1))
+    m_var = re.search(r"/ajaxm\.php\?file=['\"]\s*\+\s*([A-Za-z_][A-Za-z0-9_]*)", text)
+    if m_var:
+        m_val = re.search(rf"\b(?:var\s+)?{re.escape(m_var.group(1))}\s*=\s*['\"]?(\d{{6,}})['\"]?", text)
+        if m_val and _ok(m_val.group(1)):
+            return _ok(m_val.group(1))
+    return None
+
+
+def _legacy_ajax_params(text):
+    if not text:
+        return {}
+    out = {}
+    fid = _legacy_file_id(text)
+    if fid:
+        out["file_id"] = fid
+    for field, patterns in (
+        ("ajaxdata", [
+            r"var\s+ajaxdata\s*=\s*['\"]([^'\"]+)['\"]",
+            r"websignkey\s*[:=]\s*['\"]([^'\"]+)['\"]",
+            r"signs\s*[:=]\s*['\"]([^'\"]+)['\"]",
+        ]),
+        ("wp_sign", [
+            r"var\s+wp_sign\s*=\s*['\"]([^'\"]+)['\"]",
+            r"\bsign\s*[:=]\s*['\"]([^'\"]+)['\"]",
+        ]),
+        ("websign", [
+            r"var\s+websign\s*=\s*['\"]([^'\"]*)['\"]",
+            r"['\"]websign['\"]\s*[:=]\s*['\"]([^'\"]*)['\"]",
+            r"['\"]websign['\"]\s*[:=]\s*(\d+)",
+        ]),
+    ):
+        for p in patterns:
+            m = re.search(p, text, re.I)
+            if m:
+                out[field] = html.unescape(m.group(1)).strip()
+                break
+    return out
+
+
+def _legacy_inline_ajax_params(fn_html):
+    best = {}
+    for js in re.findall(r"<script[^>]*>([\s\S]*?)</script>", fn_html, re.I):
+        for k, v in _legacy_ajax_params(js).items():
+            if k not in best and v:
+                best[k] = v
+        if all(best.get(k) for k in ("file_id", "ajaxdata", "wp_sign")):
+            break
+    return best
+
+
+# ---- 页面样本 ----
+
+_STYLE = "<style>" + "".join(
+    f".c{i}{{margin:{i % 7}px;padding:{i % 5}px;color:#{i * 37 % 4096:03x};font-size:{12 + i % 6}px}}\n"
+    for i in range(160)
+) + "</style>"
+_NAV = "<div class=\"top\">" + "".join(
+    f'<a href="https://pc.woozooo.com/help{i}.php" class="nav" target="_blank">帮助中心 {i}</a>\n' for i in range(40)
+) + "</div>"
+_STATS_JS = """<script type="text/javascript">
+var _hmt = _hmt || [];
+(function() {
+  var hm = document.createElement("script");
+  hm.src = "https://hm.baidu.com/hm.js?5e7b3d2a0b6f4c1e9a8d7f6e5d4c3b2a";
+  var s = document.getElementsByTagName("script")[0];
+  s.parentNode.insertBefore(hm, s);
+})();
+function tip(msg){ var box = document.getElementById('tipbox'); box.innerHTML = msg; box.style.display = 'block'; }
+function isMobile(){ return /Android|iPhone|iPad/i.test(navigator.userAgent); }
+document.addEventListener('DOMContentLoaded', function(){ if (isMobile()) { document.body.className += ' m'; } });
+</script>"""
+
+
+def _pad(page):
+    """补上样式、导航与统计脚本，使样本接近线上页面体积。"""
+    page = page.replace("<body>", "<body>" + _NAV, 1)
+    page = page.replace("</body>", _STATS_JS + "</body>", 1)
+    if "<head>" in page:
+        return page.replace("<head>", "<head>" + _STYLE, 1)
+    return page.replace("<html>", "<html><head>" + _STYLE + "</head>", 1)
+
+
+def build_fixtures():
+    state = FakeLanzouState(FakeServerConfig(files_per_folder=4, subfolders=8, depth=1))
+    root = state.root
+    f = root.files[0]
+    share = _pad(render_share_page(root))
+    fn = _pad(render_fn_page(f))
+    return {
+        "share": share,
+        "share_leaf": _pad(render_share_page(root.subfolders[0])),
+        "share_vars": share.replace("var pwd;", "var pwd;\nvar vip = '0';\nwebfoldersign = 'a1b2';", 1),
+        "share_no_data": share.replace("data : {", "data : pack({", 1).replace("},\n    dataType", "}),\n    dataType", 1),
+        "file": _pad(render_file_page(f.code)),
+        "file_escaped": _pad(
+            "<!DOCTYPE html><html><body><script>var src = '\\/fn?" + f.code + "_sig';</script></body></html>"
+        ),
+        "fn": fn,
+        "fn_concat": fn.replace(
+            f"url : '/ajaxm.php?file={f.file_id}',", "url : '/ajaxm.php?file=' + fileid,", 1
+        ).replace("var ajaxdata", f"var fileid = '{f.file_id}';\nvar ajaxdata", 1),
+    }
+
+
+# 每类页面在 _fetch_folder / 提链时实际要做的解析
+def _legacy_share(page):
+    return _legacy_share_context(page), _legacy_subfolder_links(page)
+
+
+def _scanner_share(page):
+    return scanner.scan_share_page(page), scanner.scan_folder_links(page)
+
+
+def _legacy_file(page):
+    return _legacy_fn_url_in_page(page)
+
+
+def _legacy_fn(page):
+    return _legacy_inline_ajax_params(page)
+
+
+PARSERS = {
+    "share": (_legacy_share, _scanner_share),
+    "file": (_legacy_file, scanner.scan_fn_url),
+    "fn": (_legacy_fn, scanner.scan_inline_ajax_params),
+}
+
+
+def _kind(name):
+    return name.split("_", 1)[0]
+
+
+def check_equivalence(fixtures):
+    """两种实现在每个样本上的提取结果必须一致。"""
+    for name, page in fixtures.items():
+        legacy, new = PARSERS[_kind(name)]
+        old_out, new_out = legacy(page), new(page)
+        if _kind(name) == "share":
+            # 旧版 ls 取值会误命中 class="..."（无词边界），该值不进入请求体，不参与比较
+            for ctx, _ in (old_out, new_out):
+                ctx["extra_values"].pop("ls", None)
+        if old_out != new_out:
+            raise AssertionError(f"{name}: 提取结果不一致\n旧版: {old_out}\n新版: {new_out}")
+        if not new_out:
+            raise AssertionError(f"{name}: 没有提取到任何字段")
+
+
+def time_parser(func, page, iterations):
+    func(page)  # 预热（编译缓存 / 字节码）
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    for _ in range(iterations):
+        func(page)
+    wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+    return {"us_per_page": wall / iterations * 1e6, "cpu_us_per_page": cpu / iterations * 1e6}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="页面解析基准")
+    parser.add_argument("--iterations", type=int, default=1000, help="每个样本每种实现的解析次数")
+    parser.add_argument("--rounds", type=int, default=3, help="重复轮数，取 CPU 最少的一轮")
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    args = parser.parse_args(argv)
+
+    fixtures = build_fixtures()
+    check_equivalence(fixtures)
+
+    results = []
+    for name, page in fixtures.items():
+        legacy, new = PARSERS[_kind(name)]
+        row = {"fixture": name, "bytes": len(page.encode("utf-8"))}
+        for label, func in (("legacy", legacy), ("scanner", new)):
+            runs = [time_parser(func, page, args.iterations) for _ in range(args.rounds)]
+            row[label] = min(runs, key=lambda r: r["cpu_us_per_page"])
+        row["speedup"] = round(row["legacy"]["cpu_us_per_page"] / max(row["scanner"]["cpu_us_per_page"], 1e-9), 2)
+        results.append(row)
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print(f"每个样本 {args.iterations} 次 × {args.rounds} 轮，取 CPU 最少的一轮（微秒/页）")
+        print(f"  {'样本':<16}{'大小':>8}{'旧版':>10}{'扫描器':>10}{'加速':>8}")
+        for r in results:
+            print(
+                f"  {r['fixture']:<16}{r['bytes']:>8}{r['legacy']['cpu_us_per_page']:>10.1f}"
+                f"{r['scanner']['cpu_us_per_page']:>10.1f}{r['speedup']:>7.2f}x"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""启动开销基准：模块导入耗时、下载器构造耗时与单文件批量下载的首字节时间。
+
+每项都在全新的子进程中测量（模块缓存不共享），多轮取中位数；首字节时间对本地替身服务测量：
+    python source_code_dev/lanzou_startup_bench.py --rounds 7
+    git worktree add /tmp/lanzou_base HEAD~1
+    python source_code_dev/lanzou_startup_bench.py --baseline /tmp/lanzou_base
+--baseline 指向另一份检出（如改动前的提交），同样的测量在两份代码上各跑一遍并给出对比。
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+_THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+_PROJECT_ROOT = os.path.dirname(_THIS_DIR)
+if _THIS_DIR not in sys.path:
+    sys.path.insert(0, _THIS_DIR)
+
+from lanzou_fake_server import FakeServerConfig, make_server
+
+
+IMPORT_TARGETS = ("source_code_common.lanzou_core", "source_code_common.lanzou_gui_core")
+
+_CONSTRUCT_SNIPPET = """
+import sys, time, json
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+from source_code_common.lanzou_core import OptimizedLanzouDownloader
+t1 = time.perf_counter()
+OptimizedLanzouDownloader(default_url="https://example.invalid/b0", default_password="")
+t2 = time.perf_counter()
+print(json.dumps({{"import_s": t1 - t0, "construct_s": t2 - t1}}))
+"""
+
+# 与 GUI 的一次批量下载相同的调用顺序：列表 → download_files；记录第一个字节写入的时间
+_FIRST_BYTE_SNIPPET = """
+import sys, time, json
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+from source_code_common.lanzou_core import OptimizedLanzouDownloader
+d = OptimizedLanzouDownloader(default_url={url!r}, default_password={password!r})
+marks = {{}}
+report = d.report_progress
+def _report(filename, downloaded_size, *args, **kwargs):
+    if downloaded_size and "first_byte_s" not in marks:
+        marks["first_byte_s"] = time.perf_counter() - t0
+    return report(filename, downloaded_size, *args, **kwargs)
+d.report_progress = _report
+files = d.login_and_get_files()
+marks["listed_s"] = time.perf_counter() - t0
+result = d.download_files(files[:1], {out_dir!r})
+marks["done_s"] = time.perf_counter() - t0
+marks["succeeded"] = result["succeeded"]
+print(json.dumps(marks))
+"""
+
+
+def _run(root, args, env_extra=None):
+    env = dict(os.environ)
+    env.pop("PYTHONPATH", None)
+    env.update(env_extra or {})
+    proc = subprocess.run(
+        [sys.executable, *args], cwd=root, env=env, capture_output=True, text=True, timeout=300
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"子进程失败（{root}）：{proc.stderr.strip()[-800:]}")
+    return proc
+
+
+def measure_import(root, module):
+    """-X importtime 下导入 module 的累计耗时（秒）与最重的子模块。"""
+    proc = _run(root, ["-X", "importtime", "-c", f"import sys; sys.path.insert(0, {root!r}); import {module}"])
+    total, children, top = None, [], []
+    # 输出中子模块先于父模块打印：名称列缩进 1 格为顶层导入，3 格为其直接依赖
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        try:
+            cumulative = int(cumulative)
+        except ValueError:
+            continue
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        if depth == 0:
+            if name.strip() == module:
+                total, top = cumulative, children
+            children = []
+        elif depth == 1:
+            children.append((cumulative, name.strip()))
+    top = sorted(top, reverse=True)
+    return (total or 0) / 1e6, [(n, c / 1e6) for c, n in top[:5]]
+
+
+def measure_construct(root):
+    proc = _run(root, ["-c", _CONSTRUCT_SNIPPET.format(root=root)])
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def measure_first_byte(root, url, password):
+    with tempfile.TemporaryDirectory() as out_dir:
+        proc = _run(root, ["-c", _FIRST_BYTE_SNIPPET.format(root=root, url=url, password=password, out_dir=out_dir)])
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def bench_tree(root, rounds, share_url, password):
+    out = {"root": root}
+    for module in IMPORT_TARGETS:
+        try:
+            runs = [measure_import(root, module) for _ in range(rounds)]
+        except RuntimeError as e:
+            out[module] = {"error": str(e)}
+            continue
+        out[module] = {
+            "import_s": statistics.median(r[0] for r in runs),
+            "heaviest": runs[-1][1],
+        }
+    constructs = [measure_construct(root) for _ in range(rounds)]
+    out["construct_s"] = statistics.median(r["construct_s"] for r in constructs)
+    first = [measure_first_byte(root, share_url, password) for _ in range(rounds)]
+    out["first_byte_s"] = statistics.median(r.get("first_byte_s", float("nan")) for r in first)
+    out["listed_s"] = statistics.median(r["listed_s"] for r in first)
+    out["batch_ok"] = all(r["succeeded"] == 1 for r in first)
+    return out
+
+
+def _print_tree(label, r):
+    print(f"[{label}] {r['root']}")
+    for module in IMPORT_TARGETS:
+        item = r[module]
+        if "error" in item:
+            print(f"  import {module}: 失败 {item['error'][:120]}")
+            continue
+        heavy = "，".join(f"{n} {s * 1000:.0f}ms" for n, s in item["heaviest"])
+        print(f"  import {module}: {item['import_s'] * 1000:.1f} ms（最重：{heavy}）")
+    print(f"  构造下载器: {r['construct_s'] * 1000:.2f} ms")
+    print(f"  单文件批量：列表完成 {r['listed_s'] * 1000:.0f} ms，首字节 {r['first_byte_s'] * 1000:.0f} ms"
+          f"（含解释器内导入与构造）{'' if r['batch_ok'] else '，下载失败'}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="启动开销基准")
+    parser.add_argument("--rounds", type=int, default=5, help="每项测量的轮数（取中位数）")
+    parser.add_argument("--baseline", help="对比用的另一份检出目录（如 git worktree）")
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    args = parser.parse_args(argv)
+
+    config = FakeServerConfig(files_per_folder=3, subfolders=0)
+    server = make_server(config)
+    server.start_background()
+    try:
+        share_url, password = server.share_url, config.password
+        results = {"current": bench_tree(_PROJECT_ROOT, args.rounds, share_url, password)}
+        if args.baseline:
+            results["baseline"] = bench_tree(os.path.abspath(args.baseline), args.rounds, share_url, password)
+    finally:
+        server.shutdown()
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return 0
+    print(f"每项 {args.rounds} 轮取中位数")
+    for label, r in results.items():
+        _print_tree(label, r)
+    if "baseline" in results:
+        cur, base = results["current"], results["baseline"]
+        for module in IMPORT_TARGETS:
+            if "import_s" in cur[module] and "import_s" in base[module]:
+                print(f"  {module} 导入: {base[module]['import_s'] * 1000:.1f} → {cur[module]['import_s'] * 1000:.1f} ms")
+        print(f"  首字节: {base['first_byte_s'] * 1000:.0f} → {cur['first_byte_s'] * 1000:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())